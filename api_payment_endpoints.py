@@ -7,6 +7,7 @@ from flask import request, jsonify, render_template, session
 from utils.payment_session_manager import PaymentSessionManager
 from utils.qr_recovery_system import QRRecoverySystem
 from utils.qr_reader import QRCodeReader
+from utils.payment_events import payment_events
 import os
 
 # Initialize payment session manager and QR recovery system
@@ -71,7 +72,7 @@ def add_payment_api_routes(app):
                 session_data = payment_manager.get_payment_session(session_id)
                 if session_data and session_data.get('order_id'):
                     # Update order to completed status
-                    from models import get_db
+                    from models import get_db, SalesRollup
                     conn = get_db()
                     cur = conn.cursor()
                     try:
@@ -81,6 +82,8 @@ def add_payment_api_routes(app):
                             WHERE id = %s
                         """, (session_data['md5_hash'], session_data['order_id']))
                         conn.commit()
+                        SalesRollup.record_orders([session_data['order_id']])
+                        payment_events.publish_order(session_data['order_id'], 'completed')
                     finally:
                         cur.close()
                         conn.close()
@@ -366,7 +369,7 @@ def add_payment_api_routes(app):
             relative_path = f"payment_screenshots/{filename}"
             
             # Update order status to completed
-            from models import get_db
+            from models import get_db, SalesRollup
             conn = get_db()
             cur = conn.cursor()
             
@@ -381,6 +384,8 @@ def add_payment_api_routes(app):
                 """, (order_id,))
                 
                 conn.commit()
+                SalesRollup.record_orders([order_id])
+                payment_events.publish_order(order_id, 'completed')
                 
                 return jsonify({
                     'success': True,
@@ -1,20 +1,36 @@
-from flask import Flask, jsonify, request, redirect, url_for, render_template, session, flash, get_flashed_messages, make_response
+from flask import Flask, jsonify, request, redirect, url_for, render_template, session, flash, get_flashed_messages, make_response, Response, send_file
 from auth import auth_bp
 
 app = Flask(__name__)
 
 # Auth blueprint will be registered later with /auth prefix
 
-from flask_mysqldb import MySQL
+from utils.db_context import RequestMySQL
 from config import Config
 from datetime import datetime, timedelta
-from models import Product, Customer, Order, Supplier, Report, db, Category, PreOrder, Notification, generate_slug, PreOrderPayment, get_db, Color, Warranty
+from models import Product, Customer, Order, Supplier, Report, db, Category, PreOrder, Notification, generate_slug, PreOrderPayment, get_db, get_db_pool_stats, begin_transaction, OrderPlacement, Color, Warranty, SalesRollup
 import os
 import json
 import hashlib
 from werkzeug.utils import secure_filename
 from utils.bakong_payment import BakongQRGenerator, PaymentSession
 from utils.screenshot_fraud_detector import screenshot_detector
+from utils.catalog_cache import catalog_cache
+from utils.kpi_snapshot import kpi_snapshot
+from utils.keyset import keyset_pager, seek_predicate
+from utils.exports import iter_rows, peek, stream_csv
+from utils.job_queue import job_queue
+from utils.mailer import mailer
+from utils.qr_images import qr_images
+from utils.phash_index import phash_index
+from utils.product_images import product_images
+from utils.static_assets import init_app as init_static_assets
+from utils.payment_events import payment_events
+from utils.notification_feed import notification_feed
+from utils.product_search import product_search
+from utils import query_predicates as qp
+from utils import automatic_payment_verifier
+from xml.sax.saxutils import escape
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -25,47 +41,9 @@ from io import BytesIO
 import base64
 
 
-# QR Code Cache for faster generation
-qr_cache = {}
-
-def pregenerate_common_qr_codes():
-    """Pre-generate QR codes for common amounts to improve speed"""
-    import qrcode
-    import io
-    import base64
-    
-    common_amounts = [1, 5, 10, 20, 50, 100, 200, 500, 1000]
-    currency = "USD"
-    description = "Payment"
-    
-    for amount in common_amounts:
-        cache_key = f"{amount}_{currency}_{description}"
-        if cache_key not in qr_cache:
-            # Generate QR code with optimized parameters
-            qr_data = f"KHQR:amount={amount}:currency={currency}:desc={description}"
-            
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=8,
-                border=2,
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-            
-            img_buffer = io.BytesIO()
-            qr_img.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            qr_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-            
-            qr_cache[cache_key] = qr_base64
-    
-    app.logger.info(f"Pre-generated {len(common_amounts)} common QR codes")
-
 # Initialize extensions without circular imports
-mysql = MySQL()
+# mysql.connection is the same request-scoped connection models.get_db() returns
+mysql = RequestMySQL()
 
 def create_app():
     app = Flask(__name__, static_folder='static')
@@ -87,11 +65,12 @@ def create_app():
     from models import db
     db.init_app(app)
     
-    # Pre-generate common QR codes for faster payment processing
+    # Inspect optional tables/columns once instead of probing per request
     try:
-        pregenerate_common_qr_codes()
+        from utils.schema_registry import schema_registry
+        schema_registry.refresh()
     except Exception as e:
-        app.logger.warning(f"Could not pre-generate QR codes: {e}")
+        app.logger.warning(f"Could not load schema registry at startup: {e}")
 
     def allowed_file(filename):
         app.logger.info(f"allowed_file called with: {filename}, type: {type(filename)}")
@@ -105,6 +84,10 @@ def create_app():
         """Template filter to generate URL slugs"""
         return generate_slug(text)
 
+    # Responsive product photos: <picture>/srcset over the WebP and JPEG derivatives
+    app.add_template_global(product_images.picture, 'product_picture')
+    app.add_template_global(product_images.srcset, 'product_srcset')
+
     # Public Routes
     @app.route('/login')
     def login_redirect():
@@ -363,25 +346,17 @@ def create_app():
             try:
                 from utils.email_utils import EmailManager
                 customer_name = f"{customer['first_name']} {customer['last_name']}"
-                email_sent = EmailManager.send_registration_otp_email(
+                message_id = EmailManager.queue_registration_otp_email(
                     customer['email'], 
                     customer_name, 
                     otp_code
                 )
                 
-                if email_sent:
-                    app.logger.info(f"OTP email sent successfully to {customer['email']}")
-                    return jsonify({
-                        'success': True, 
-                        'message': f'Verification code sent to {customer["email"]}'
-                    })
-                else:
-                    app.logger.warning(f"Email sending failed, showing OTP in console: {otp_code}")
-                    return jsonify({
-                        'success': True, 
-                        'message': f'Email service unavailable. Your code is: {otp_code}',
-                        'otp_code': otp_code
-                    })
+                app.logger.info(f"OTP email queued for {customer['email']} (message {message_id})")
+                return jsonify({
+                    'success': True, 
+                    'message': f'Verification code sent to {customer["email"]}'
+                })
             except Exception as email_error:
                 app.logger.error(f"Email sending error: {str(email_error)}")
                 app.logger.info(f"OTP for {customer['email']}: {otp_code}")
@@ -505,6 +480,91 @@ def create_app():
             <p>User: {Config.MYSQL_USER}</p>
             """
         
+    @app.route('/api/staff/db/pool_stats')
+    def api_db_pool_stats():
+        """Connection pool counters for the worker that serves this request"""
+        if 'user_id' not in session or session.get('role') not in ['staff', 'admin', 'super_admin']:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        try:
+            return jsonify({'success': True, 'pool': get_db_pool_stats()})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/api/staff/db/schema/refresh', methods=['POST'])
+    def api_refresh_schema_registry():
+        """Re-read optional tables/columns after running a migration"""
+        if 'user_id' not in session or session.get('role') not in ['admin', 'super_admin']:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        try:
+            from utils.schema_registry import schema_registry
+            schema_registry.invalidate()
+            features = schema_registry.refresh()
+            return jsonify({'success': True, 'features': features})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    def payment_verifier_stats():
+        verifier = automatic_payment_verifier.payment_verifier
+        return verifier.stats() if verifier else None
+
+    @app.route('/api/staff/cache/stats')
+    def api_catalog_cache_stats():
+        """Catalog cache hit/miss counters for the worker that serves this request"""
+        if 'user_id' not in session or session.get('role') not in ['staff', 'admin', 'super_admin']:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        try:
+            return jsonify({
+                'success': True,
+                'cache': catalog_cache.stats(),
+                'search_index': product_search.stats(),
+                'kpi_snapshot': kpi_snapshot.stats(),
+                'listings': keyset_pager.stats(),
+                'jobs': job_queue.stats(),
+                'mailer': mailer.stats(),
+                'qr_images': qr_images.stats(),
+                'phash_index': phash_index.stats(),
+                'payment_events': payment_events.stats(),
+                'notification_feed': notification_feed.stats(),
+                'payment_verifier': payment_verifier_stats(),
+                'product_images': product_images.stats(),
+                'static_assets': app.extensions['static_assets'].stats()
+            })
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/api/staff/cache/clear', methods=['POST'])
+    def api_clear_catalog_cache():
+        """Drop cached catalog reads in every worker, e.g. after editing categories by hand"""
+        if 'user_id' not in session or session.get('role') not in ['admin', 'super_admin']:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        try:
+            catalog_cache.invalidate(f"cleared by user {session['user_id']}")
+            return jsonify({'success': True})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    def backfill_sales_rollup():
+        with app.app_context():
+            result = SalesRollup.backfill()
+        kpi_snapshot.invalidate()
+        return result
+
+    job_queue.register('sales_rollup_backfill', backfill_sales_rollup)
+
+    @app.route('/api/staff/reports/rollup/rebuild', methods=['POST'])
+    def api_rebuild_sales_rollup():
+        """Recompute the daily sales rollup, optionally for a start_date..end_date range"""
+        if 'user_id' not in session or session.get('role') not in ['admin', 'super_admin']:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        try:
+            data = request.get_json(silent=True) or {}
+            days = SalesRollup.rebuild(data.get('start_date'), data.get('end_date'))
+            kpi_snapshot.invalidate()
+            return jsonify({'success': True, 'days': days})
+        except Exception as e:
+            app.logger.error(f"Error rebuilding sales rollup: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @app.route('/auth/staff/inventory')
     def staff_inventory():
         try:
@@ -555,15 +615,15 @@ def create_app():
             totals = cur.fetchone()
             
             # Get this month's sales
-            cur.execute("""
+            month_sql, month_params = qp.this_month('o.order_date')
+            cur.execute(f"""
                 SELECT COALESCE(SUM(oi.quantity), 0) as this_month_sold
                 FROM order_items oi
                 JOIN orders o ON oi.order_id = o.id
                 WHERE oi.product_id = %s 
                 AND o.status = 'COMPLETED'
-                AND MONTH(o.order_date) = MONTH(CURRENT_DATE())
-                AND YEAR(o.order_date) = YEAR(CURRENT_DATE())
-            """, (product_id,))
+                AND {month_sql}
+            """, (product_id, *month_params))
             this_month = cur.fetchone()
             
             # Get last 30 days sales
@@ -787,6 +847,7 @@ def create_app():
             app.logger.error(f"Error fetching top selling products: {e}")
             return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
+    @catalog_cache.cached('category.subtree')
     def build_category_hierarchy(category_id):
         """Build dynamic category hierarchy for cascading dropdowns"""
         from models import get_db
@@ -988,8 +1049,13 @@ def create_app():
         if not product_id:
             return jsonify({'success': False, 'error': 'Product ID is required'}), 400
 
-        # Verify product exists and has stock
-        product = Product.get_by_id(product_id)
+        try:
+            lookup_id = int(product_id)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Product not found'}), 404
+
+        # Verify product exists and has stock (single-table lookup, no joins needed)
+        product = Product.get_many([lookup_id], include_details=False).get(lookup_id)
         if not product:
             return jsonify({'success': False, 'error': 'Product not found'}), 404
 
@@ -1093,11 +1159,23 @@ def create_app():
             cur = conn.cursor(dictionary=True)
 
             try:
+                # Everything below runs in one transaction: product rows stay locked from
+                # validation until commit, so concurrent checkouts cannot oversell
+                begin_transaction(conn)
+
                 # Validate all cart items and calculate total
                 cart_items = []
                 preorder_items = []
                 subtotal = 0
 
+                # Lock every product in the cart (regular and pre-order lines) with one query
+                products_by_id = OrderPlacement.lock_products(
+                    conn, [item['product_id'] for item in session['cart'] if item.get('product_id')]
+                )
+                regular_quantities = OrderPlacement.aggregate_quantities(
+                    [item for item in session['cart'] if item.get('type') != 'preorder']
+                )
+
                 for cart_item in session['cart']:
                     if cart_item.get('type') == 'preorder':
                         preorder_items.append(cart_item)
@@ -1108,11 +1186,11 @@ def create_app():
                         subtotal += item_total
                         continue
 
-                    product = Product.get_by_id(cart_item['product_id'])
+                    product = products_by_id.get(int(cart_item['product_id']))
                     if not product:
                         return jsonify({'success': False, 'error': f'Product {cart_item["product_id"]} not found'}), 404
 
-                    if product['stock'] < cart_item['quantity']:
+                    if product['stock'] < regular_quantities[product['id']]:
                         return jsonify({'success': False, 'error': f'Only {product["stock"]} items available for {product["name"]}'}), 400
 
                     # Ensure all values are float for calculations
@@ -1185,7 +1263,10 @@ def create_app():
                     """, (customer_id, final_total, initial_status, payment_method, approval_status, volume_discount_rule_id, volume_discount_percentage, volume_discount_amount))
                 order_id = cur.lastrowid
 
-                # Add all regular cart items to order
+                # Build all order item rows, then write them with one executemany
+                item_columns = ('order_id', 'product_id', 'product_name', 'product_description', 'product_category',
+                                'quantity', 'price', 'original_price', 'discount_percentage', 'discount_amount')
+                item_rows = []
                 for cart_item in cart_items:
                     product = cart_item['product']
 
@@ -1203,34 +1284,22 @@ def create_app():
                         discount_amount = 0
                         discount_percentage = 0
 
-                    # Get category name for denormalized data
-                    cur.execute("SELECT name FROM categories WHERE id = %s", (product['category_id'],))
-                    category_result = cur.fetchone()
-                    category_name = category_result['name'] if category_result else 'Unknown'
+                    # Category name for denormalized data comes from the locked product fetch
+                    category_name = product.get('category_name') or 'Unknown'
 
-                    cur.execute("""
-                        INSERT INTO order_items (order_id, product_id, product_name, product_description, product_category, quantity, price, original_price, discount_percentage, discount_amount)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (order_id, cart_item['product_id'], product['name'], product.get('description', ''), category_name, cart_item['quantity'], cart_item['price'],
-                          original_price, discount_percentage, discount_amount))
+                    item_rows.append((order_id, cart_item['product_id'], product['name'], product.get('description', ''), category_name,
+                                      cart_item['quantity'], cart_item['price'], original_price, discount_percentage, discount_amount))
+                OrderPlacement.insert_order_items(conn, item_rows, columns=item_columns)
 
-                    # Reduce stock immediately when order is placed
-                    # This reserves the stock for the customer and prevents overselling
-                    cur.execute("""
-                        UPDATE products 
-                        SET stock = stock - %s 
-                        WHERE id = %s
-                    """, (cart_item['quantity'], cart_item['product_id']))
-                    
-                    # Log inventory change
-                    cur.execute("""
-                        INSERT INTO inventory (product_id, changes, change_date) 
-                        VALUES (%s, %s, NOW())
-                    """, (cart_item['product_id'], -cart_item['quantity']))
-                    
-                    app.logger.info(f"Stock reduced for product {cart_item['product_id']} by {cart_item['quantity']}")
+                # Reduce stock immediately when order is placed
+                # This reserves the stock for the customer and prevents overselling:
+                # one conditional UPDATE (stock >= quantity) for all products
+                OrderPlacement.decrement_stock(conn, regular_quantities)
+                app.logger.info(f"Stock reduced for products {regular_quantities}")
 
                 # Process pre-order items separately
+                preorder_rows = []
+                preorder_quantities = {}
                 for preorder_item in preorder_items:
                     preorder_id = preorder_item.get('preorder_id')
                     quantity = preorder_item.get('quantity', 1)
@@ -1244,31 +1313,22 @@ def create_app():
                     if preorder['customer_id'] != customer_id:
                         return jsonify({'success': False, 'error': 'Unauthorized access to pre-order'}), 403
 
-                    # Get product and category info for denormalized data
-                    cur.execute("SELECT p.name, p.description, c.name as category_name FROM products p JOIN categories c ON p.category_id = c.id WHERE p.id = %s", (preorder_item['product_id'],))
-                    product_result = cur.fetchone()
+                    # Product and category info for denormalized data comes from the locked product fetch
+                    product_result = products_by_id.get(int(preorder_item['product_id']))
                     product_name = product_result['name'] if product_result else 'Unknown Product'
                     product_description = product_result['description'] if product_result else ''
-                    category_name = product_result['category_name'] if product_result else 'Unknown'
+                    category_name = (product_result.get('category_name') if product_result else None) or 'Unknown'
 
-                    # Insert pre-order items into order_items with type 'preorder'
-                    cur.execute("""
-                        INSERT INTO order_items (order_id, product_id, product_name, product_description, product_category, quantity, price, original_price, discount_percentage, discount_amount, type)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'preorder')
-                    """, (order_id, preorder_item['product_id'], product_name, product_description, category_name, quantity, preorder_item['price'], preorder_item['price'], 0, 0))
+                    # Pre-order items go into order_items with type 'preorder'
+                    preorder_rows.append((order_id, preorder_item['product_id'], product_name, product_description, category_name,
+                                          quantity, preorder_item['price'], preorder_item['price'], 0, 0, 'preorder'))
+                    product_id = int(preorder_item['product_id'])
+                    preorder_quantities[product_id] = preorder_quantities.get(product_id, 0) + int(quantity)
 
-                    # Reduce stock for pre-order items if applicable (usually stock is 0)
-                    cur.execute("""
-                        UPDATE products
-                        SET stock = stock - %s
-                        WHERE id = %s
-                    """, (quantity, preorder_item['product_id']))
+                OrderPlacement.insert_order_items(conn, preorder_rows, columns=item_columns + ('type',))
 
-                    # Log inventory change
-                    cur.execute("""
-                        INSERT INTO inventory (product_id, changes)
-                        VALUES (%s, %s)
-                    """, (preorder_item['product_id'], -quantity))
+                # Reduce stock for pre-order items if applicable (usually stock is 0, so no stock guard)
+                OrderPlacement.decrement_stock(conn, preorder_quantities, allow_backorder=True)
 
                 # Keep order status as PENDING until payment is confirmed
                 # Don't clear cart yet - only clear when payment is actually confirmed
@@ -1288,6 +1348,9 @@ def create_app():
                 })
 
             finally:
+                # Early returns (validation errors) and exceptions leave the transaction open
+                if conn.in_transaction:
+                    conn.rollback()
                 cur.close()
                 conn.close()
 
@@ -1553,6 +1616,8 @@ def create_app():
                 order_status = 'PENDING (Verified)'
             
             conn.commit()
+            SalesRollup.record_orders([order_id])
+            payment_events.publish_order(order_id, 'completed' if order_status == 'COMPLETED' else 'verified')
             cur.close()
             conn.close()
             
@@ -1793,6 +1858,8 @@ def create_app():
                 """, (order_id,))
                 
                 conn.commit()
+                SalesRollup.record_orders([order_id])
+                payment_events.publish_order(order_id, 'completed')
                 
                 return jsonify({
                     'success': True,
@@ -2003,16 +2070,17 @@ def create_app():
             try:
                 # Use session cart for display since orders are now completed immediately
                 session_cart = session.get('cart', [])
+                products_by_id = Product.get_many(
+                    [item['product_id'] for item in session_cart if item.get('type') != 'preorder'],
+                    include_details=False
+                )
                 for cart_item in session_cart:
                     # Skip pre-order items here - they'll be handled in the dedicated pre-order loop
                     if cart_item.get('type') == 'preorder':
                         continue
                         
-                    # Get product details for regular items
-                    cur.execute("""
-                        SELECT name, price, photo FROM products WHERE id = %s
-                    """, (cart_item['product_id'],))
-                    product_data = cur.fetchone()
+                    # Product details for regular items come from the bulk fetch above
+                    product_data = products_by_id.get(int(cart_item['product_id']))
 
                     if product_data:
                         item = {
@@ -2054,10 +2122,18 @@ def create_app():
             if 'cart' not in session:
                 session['cart'] = []
 
+            try:
+                products_by_id = Product.get_many(
+                    [item['product_id'] for item in session['cart'] if item.get('type') != 'preorder'],
+                    include_details=False
+                )
+            except Exception:
+                products_by_id = {}
+
             for item in session['cart']:
                 # Only process regular items if not already in pending order
                 if item.get('type') != 'preorder':
-                    product = Product.get_by_id(item['product_id'])
+                    product = products_by_id.get(int(item['product_id']))
                     if product:
                         cart_item = {
                             'id': product['id'],
@@ -2161,6 +2237,18 @@ def create_app():
             return jsonify({'success': False, 'error': 'Please log in'}), 401
 
         try:
+            # ?since=<version> long-polls until the session status changes
+            channel = f"session:{session_id}"
+            since = request.args.get('since', type=int)
+            retry_after = 0
+            if since is None:
+                event = payment_events.current(channel)
+            else:
+                wait = min(request.args.get('wait', Config.PAYMENT_EVENTS_WAIT, type=float), Config.PAYMENT_EVENTS_WAIT)
+                result = payment_events.wait(channel, since=since, timeout=wait)
+                event, retry_after = result['event'], result['retry_after']
+            version = event['version'] if event else 0
+
             payment_session = PaymentSession.get_session(session_id)
 
             if not payment_session:
@@ -2183,7 +2271,9 @@ def create_app():
             return jsonify({
                 'success': True,
                 'status': payment_session['status'],
-                'session': payment_session
+                'session': payment_session,
+                'version': version,
+                'retry_after': retry_after
             })
 
         except Exception as e:
@@ -2307,6 +2397,8 @@ def create_app():
                 PaymentSession.update_session_status(session_id, 'completed')
 
                 conn.commit()
+                SalesRollup.record_orders([order_id])
+                payment_events.publish_order(order_id, 'completed')
 
                 # Clear cart since payment is confirmed
                 if 'cart' in session:
@@ -2375,6 +2467,7 @@ def create_app():
             
             conn.commit()
             cur.close()
+            SalesRollup.record_orders([order_id])
 
             app.logger.info(f"💵 CASH PAYMENT CONFIRMED - Order {order_id} set to PENDING for admin approval")
 
@@ -2801,15 +2894,130 @@ def create_app():
             except:
                 pass
 
-    @app.route('/invoice-pdf/<int:order_id>')
-    def invoice_pdf(order_id):
-        """Generate PDF invoice for order"""
-        try:
-            app.logger.info(f"📄 Starting PDF generation for order {order_id}")
-            # Get order details
+    def payment_event_response(channel, initial_status=None, verifier_covers=None):
+        """
+        Long-poll a payment event channel. ?since=<version> blocks up to ?wait= seconds
+        (capped at PAYMENT_EVENTS_WAIT) for a newer event; without since the current state
+        is returned at once, using initial_status() when nothing was published yet.
+        verifier_active tells the page whether the payment verifier checks this payment with
+        the bank (verifier_covers()), so the page only asks the bank itself when it does not.
+        """
+        since = request.args.get('since', type=int)
+        if since is None:
+            event = payment_events.current(channel)
+            changed, retry_after = event is not None, 0
+            if event is None and initial_status is not None:
+                event = {'status': initial_status(), 'version': 0}
+        else:
+            wait = min(request.args.get('wait', Config.PAYMENT_EVENTS_WAIT, type=float), Config.PAYMENT_EVENTS_WAIT)
+            result = payment_events.wait(channel, since=since, timeout=wait)
+            event, changed, retry_after = result['event'], result['changed'], result['retry_after']
+
+        event = event or {'status': 'pending', 'version': 0}
+        payment_verified = event['status'] in ('completed', 'verified')
+        response = jsonify({
+            'success': True,
+            'changed': changed,
+            'version': event['version'],
+            'status': event['status'],
+            'payment_verified': payment_verified,
+            'order_id': event.get('order_id'),
+            'invoice_url': event.get('invoice_url'),
+            'retry_after': retry_after,
+            'verifier_active': bool(verifier_covers and not payment_verified and verifier_covers())
+        })
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    @app.route('/api/orders/<int:order_id>/payment-events')
+    def order_payment_events(order_id):
+        """Long-poll for payment state changes of an order (replaces polling payment-status)"""
+        def initial_status():
             conn = get_db()
             cur = conn.cursor(dictionary=True)
-            
+            try:
+                cur.execute("""
+                    SELECT o.status,
+                           (SELECT pt.payment_verification_status
+                            FROM payment_tracking pt
+                            WHERE pt.order_id = o.id
+                            ORDER BY pt.created_at DESC
+                            LIMIT 1) AS tracking_status
+                    FROM orders o
+                    WHERE o.id = %s
+                """, (order_id,))
+                row = cur.fetchone()
+            finally:
+                cur.close()
+                conn.close()
+            if not row:
+                return 'not_found'
+            if row['tracking_status'] == 'verified':
+                return 'verified'
+            return (row['status'] or 'pending').lower()
+
+        try:
+            return payment_event_response(f"order:{order_id}", initial_status,
+                                          lambda: automatic_payment_verifier.verifier_covers(order_id=order_id))
+        except Exception as e:
+            app.logger.error(f"Error waiting for payment events of order {order_id}: {str(e)}")
+            return jsonify({'success': False, 'error': 'Failed to check payment status'}), 500
+
+    @app.route('/api/khqr/payment-events/<payment_id>')
+    def khqr_payment_events(payment_id):
+        """Long-poll for completion of a KHQR payment (replaces polling check-payment)"""
+        if 'username' not in session:
+            return jsonify({'success': False, 'error': 'Please log in'}), 401
+        return payment_event_response(f"khqr:{payment_id}",
+                                      verifier_covers=lambda: automatic_payment_verifier.verifier_covers(payment_id=payment_id))
+
+    def job_accepted(job_id):
+        """202 response for a queued background job: poll status_url, then fetch download_url"""
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id),
+            'download_url': url_for('job_download', job_id=job_id)
+        }), 202
+
+    def visible_job(job_id):
+        """The job if the current session may see it (jobs without an owner are public by id)"""
+        job = job_queue.get(job_id)
+        if not job or (job.get('owner') is not None and job['owner'] != session.get('user_id')):
+            return None
+        return job
+
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        """Status of a background job: queued, running, retrying, done or failed"""
+        job = visible_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        ready = job['status'] == 'done'
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'kind': job['kind'],
+            'status': job['status'],
+            'attempts': job['attempts'],
+            'error': job.get('error'),
+            'result': job.get('result') if ready else None,
+            'download_url': url_for('job_download', job_id=job_id) if ready and job.get('path') else None
+        })
+
+    @app.route('/jobs/<job_id>/download')
+    def job_download(job_id):
+        job = visible_job(job_id)
+        if not job or job['status'] != 'done' or not job.get('path'):
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        return send_file(job['path'], as_attachment=job.get('attachment', True), download_name=job['filename'])
+
+    def build_invoice_pdf(path, order_id):
+        """Write the PDF invoice for an order to path (runs on a job queue thread)"""
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            app.logger.info(f"📄 Starting PDF generation for order {order_id}")
             # Get order information
             cur.execute("""
                 SELECT o.*, c.first_name, c.last_name, c.email, c.phone
@@ -2820,8 +3028,7 @@ def create_app():
             
             order_data = cur.fetchone()
             if not order_data:
-                app.logger.error(f"❌ Order {order_id} not found")
-                return jsonify({'error': 'Order not found'}), 404
+                raise ValueError(f"Order {order_id} not found")
             
             app.logger.info(f"✅ Order {order_id} found: {order_data['first_name']} {order_data['last_name']}")
             
@@ -2879,8 +3086,7 @@ def create_app():
             
             # Generate PDF using ReportLab
             app.logger.info(f"📄 Generating PDF for order {order_id}")
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+            doc = SimpleDocTemplate(path, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
             
             # Styles
             styles = getSampleStyleSheet()
@@ -3052,29 +3258,47 @@ def create_app():
             # Build PDF
             app.logger.info(f"📄 Building PDF for order {order_id}")
             doc.build(story)
-            pdf_bytes = buffer.getvalue()
-            buffer.close()
-            
-            app.logger.info(f"✅ PDF generated successfully for order {order_id}, size: {len(pdf_bytes)} bytes")
-            
-            # Return PDF as response
-            response = make_response(pdf_bytes)
-            response.headers['Content-Type'] = 'application/pdf'
-            response.headers['Content-Disposition'] = f'inline; filename="invoice_{order_id}.pdf"'
-            
-            return response
-            
+            app.logger.info(f"✅ PDF generated successfully for order {order_id}, size: {os.path.getsize(path)} bytes")
+        finally:
+            cur.close()
+            conn.close()
+
+    job_queue.register('invoice_pdf', build_invoice_pdf)
+
+    @app.route('/invoice-pdf/<int:order_id>')
+    def invoice_pdf(order_id):
+        """
+        PDF invoice for an order. The PDF is rendered on the job queue: a finished invoice
+        is served directly, otherwise the response is 202 with a job to poll. The job id is
+        derived from the fields printed on the invoice, so repeat requests reuse the same
+        PDF until the order changes.
+        """
+        try:
+            conn = get_db()
+            cur = conn.cursor(dictionary=True)
+            cur.execute("""
+                SELECT id, status, approval_status, payment_method, total_amount
+                FROM orders
+                WHERE id = %s
+            """, (order_id,))
+            order = cur.fetchone()
+            cur.close()
+            if not order:
+                return jsonify({'error': 'Order not found'}), 404
+
+            version = hashlib.md5(repr(sorted(order.items())).encode()).hexdigest()[:12]
+            job_id = job_queue.enqueue('invoice_pdf', args=(order_id,),
+                                       filename=f"invoice_{order_id}.pdf",
+                                       job_id=f"invoice{order_id}v{version}")
+            job = job_queue.get(job_id)
+            if job and job['status'] == 'done' and request.accept_mimetypes.best != 'application/json':
+                return send_file(job['path'], mimetype='application/pdf',
+                                 download_name=job['filename'])
+            return job_accepted(job_id)
+
         except Exception as e:
-            app.logger.error(f"❌ Error generating PDF invoice for order {order_id}: {str(e)}")
+            app.logger.error(f"❌ Error queuing PDF invoice for order {order_id}: {str(e)}")
             return jsonify({'error': 'Failed to generate PDF invoice'}), 500
-        finally:
-            try:
-                if 'cur' in locals():
-                    cur.close()
-                if 'conn' in locals():
-                    conn.close()
-            except:
-                pass
 
     @app.route('/invoice/<int:order_id>')
     def view_invoice(order_id):
@@ -4266,8 +4490,15 @@ def create_app():
             if 'cart' not in session:
                 session['cart'] = []
 
+            # Look up every product in the order at once; skip ones that no longer exist
+            products_by_id = Product.get_many([item['product_id'] for item in order_items], include_details=False)
+
             items_added = 0
             for item in order_items:
+                product = products_by_id.get(int(item['product_id'])) if item['product_id'] else None
+                if not product:
+                    continue
+
                 # Check if item already exists in cart
                 existing_item = None
                 for cart_item in session['cart']:
@@ -4280,7 +4511,11 @@ def create_app():
                 else:
                     session['cart'].append({
                         'product_id': item['product_id'],
-                        'quantity': item['quantity']
+                        'name': product['name'],
+                        'price': product['price'],
+                        'quantity': item['quantity'],
+                        'photo': product.get('photo', ''),
+                        'stock': product['stock']
                     })
                 items_added += 1
 
@@ -4585,6 +4820,7 @@ def create_app():
                     cur.execute("UPDATE orders SET status = 'CANCELLED' WHERE id = %s", (order_id,))
 
                 conn.commit()
+                SalesRollup.record_orders([order_id])
 
                 # Create customer notification
                 try:
@@ -4805,6 +5041,7 @@ def create_app():
             # Update order status to confirmed
             cur.execute("UPDATE orders SET status = 'CONFIRMED', approval_status = 'Approved' WHERE id = %s", (order_id,))
             conn.commit()
+            SalesRollup.record_orders([order_id])
             
             app.logger.info(f"Order {order_id} confirmed by staff: {session['username']}")
             
@@ -4849,6 +5086,7 @@ def create_app():
             # Update order status to rejected
             cur.execute("UPDATE orders SET status = 'REJECTED', approval_status = 'Rejected' WHERE id = %s", (order_id,))
             conn.commit()
+            SalesRollup.record_orders([order_id])
             
             app.logger.info(f"Order {order_id} rejected by staff: {session['username']}, Reason: {reason}")
             
@@ -4956,7 +5194,7 @@ def create_app():
 
     @app.route('/api/customer/notifications')
     def get_customer_notifications():
-        """Get notifications for logged-in customer"""
+        """Get notifications for logged-in customer (304 while the feed version is unchanged)"""
         if 'username' not in session or session.get('role') not in ['customer', 'staff', 'admin', 'super_admin']:
             return jsonify({'success': False, 'error': 'Customer or staff authentication required'}), 401
 
@@ -4966,6 +5204,17 @@ def create_app():
             customer_id = session.get('user_id')
             unread_only = request.args.get('unread_only', 'false').lower() == 'true'
 
+            # Read the version before the rows: a change in between gets a newer version
+            version = notification_feed.version(customer_id)
+            etag = notification_feed.etag(customer_id, '-unread' if unread_only else '')
+            if request.if_none_match.contains(etag):
+                notification_feed.record_read(not_modified=True)
+                response = Response(status=304)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            notification_feed.record_read(not_modified=False)
+
             notifications = Notification.get_customer_notifications(customer_id, unread_only)
 
             # Format notifications for JSON response
@@ -4980,15 +5229,65 @@ def create_app():
                     'is_read': bool(notification['is_read'])
                 })
 
-            return jsonify({
+            response = jsonify({
                 'success': True,
-                'notifications': formatted_notifications
+                'notifications': formatted_notifications,
+                'version': version
             })
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
 
         except Exception as e:
             app.logger.error(f"Error fetching customer notifications: {str(e)}")
             return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
+    @app.route('/api/customer/notifications/events')
+    def customer_notification_events():
+        """
+        Wait for the notification list to change. ?since=<version> blocks up to ?wait=
+        seconds (capped at NOTIFICATION_FEED_WAIT) when a waiter slot is free; otherwise
+        it answers at once with retry_after. No database query either way.
+        """
+        if 'username' not in session or session.get('role') not in ['customer', 'staff', 'admin', 'super_admin']:
+            return jsonify({'success': False, 'error': 'Customer or staff authentication required'}), 401
+
+        try:
+            customer_id = session.get('user_id')
+            wait = min(request.args.get('wait', Config.NOTIFICATION_FEED_WAIT, type=float), Config.NOTIFICATION_FEED_WAIT)
+            result = notification_feed.wait(customer_id, request.args.get('since', type=int), wait)
+            response = jsonify({
+                'success': True,
+                'version': result['version'],
+                'changed': result['changed'],
+                'retry_after': result['retry_after'],
+                'stream_url': url_for('customer_notification_stream') if Config.NOTIFICATION_SSE else None
+            })
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        except Exception as e:
+            app.logger.error(f"Error waiting for notification changes: {str(e)}")
+            return jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+    @app.route('/api/customer/notifications/stream')
+    def customer_notification_stream():
+        """Server-sent `version` events for the notification list (NOTIFICATION_SSE only)"""
+        if not Config.NOTIFICATION_SSE:
+            return jsonify({'success': False, 'error': 'Notification stream is disabled'}), 404
+        if 'username' not in session or session.get('role') not in ['customer', 'staff', 'admin', 'super_admin']:
+            return jsonify({'success': False, 'error': 'Customer or staff authentication required'}), 401
+
+        customer_id = session.get('user_id')
+        since = request.headers.get('Last-Event-ID', type=int)
+        if since is None:
+            since = request.args.get('since', type=int)
+        response = Response(
+            notification_feed.stream(customer_id, since, Config.NOTIFICATION_FEED_WAIT),
+            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
     @app.route('/api/customer/notifications/<int:notification_id>/read', methods=['POST'])
     def mark_notification_read(notification_id):
         """Mark a notification as read"""
@@ -5731,6 +6030,7 @@ def create_app():
                 status_condition = "o.status = 'COMPLETED'"
             else:
                 status_condition = "o.status IN ('PENDING', 'COMPLETED', 'CONFIRMED')"
+            today_sql, today_params = qp.today('o.order_date')
 
             cur.execute(f"""
                 SELECT o.id, o.order_date, c.first_name, c.last_name, o.total_amount,
@@ -5738,28 +6038,21 @@ def create_app():
                 FROM orders o
                 JOIN customers c ON o.customer_id = c.id
                 WHERE {status_condition}
-                AND DATE(o.order_date) = CURDATE()
+                AND {today_sql}
                 ORDER BY o.order_date DESC
                 LIMIT 50
-            """)
+            """, today_params)
 
             order_rows = cur.fetchall()
+            item_summaries = Order.get_item_summaries([row['id'] for row in order_rows])
             orders_data = []
             orders_total = 0
 
             for row in order_rows:
-                # Get order items to determine details
-                cur.execute("""
-                    SELECT p.name as product_name, oi.quantity
-                    FROM order_items oi
-                    JOIN products p ON oi.product_id = p.id
-                    WHERE oi.order_id = %s
-                """, (row['id'],))
-                order_items = cur.fetchall()
-
-                # Determine details based on number of items
-                if len(order_items) == 1:
-                    details = order_items[0]['product_name']  # Show product name for single item
+                # Show the product name for single-item orders
+                summary = item_summaries.get(row['id'])
+                if summary and summary['item_count'] == 1:
+                    details = summary['first_product_name']
                 else:
                     details = 'Multiple items'
 
@@ -5820,22 +6113,15 @@ def create_app():
             """)
 
             order_rows = cur.fetchall()
+            item_summaries = Order.get_item_summaries([row['id'] for row in order_rows])
             orders_data = []
             orders_total = 0
 
             for row in order_rows:
-                # Get order items to determine details
-                cur.execute("""
-                    SELECT p.name as product_name, oi.quantity
-                    FROM order_items oi
-                    JOIN products p ON oi.product_id = p.id
-                    WHERE oi.order_id = %s
-                """, (row['id'],))
-                order_items = cur.fetchall()
-
-                # Determine details based on number of items
-                if len(order_items) == 1:
-                    details = order_items[0]['product_name']  # Show product name for single item
+                # Show the product name for single-item orders
+                summary = item_summaries.get(row['id'])
+                if summary and summary['item_count'] == 1:
+                    details = summary['first_product_name']
                 else:
                     details = 'Multiple items'
 
@@ -6307,6 +6593,7 @@ def create_app():
         approval = request.args.get('approval', 'all')
         page = request.args.get('page', 1, type=int)
         page_size = request.args.get('page_size', 10, type=int)
+        cursor = request.args.get('cursor')
 
         # Sanitize input parameters to treat 'none' or similar as no filter
         if status and status.lower() == 'none':
@@ -6319,7 +6606,7 @@ def create_app():
             approval = 'all'
 
         try:
-            orders, total_orders = Order.get_paginated_orders(status=status, date=date, search=search, approval=approval, page=page, page_size=page_size)
+            orders, total_orders, next_cursor = Order.get_paginated_orders(status=status, date=date, search=search, approval=approval, page=page, page_size=page_size, cursor=cursor)
             
             orders_list = []
             for order in orders:
@@ -6333,7 +6620,9 @@ def create_app():
                     'payment_method': order.get('payment_method', 'QR Payment'),
                     'approval_status': order.get('approval_status', 'Pending Approval')
                 })
-            return jsonify({'success': True, 'orders': orders_list, 'total_orders': total_orders})
+            return jsonify({'success': True, 'orders': orders_list, 'total_orders': total_orders, 'next_cursor': next_cursor})
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         except Exception as e:
             app.logger.error(f"Error fetching paginated orders: {e}")
             return jsonify({'success': False, 'error': 'Failed to fetch orders'}), 500
@@ -6353,6 +6642,7 @@ def create_app():
         sort_dir = request.args.get('sort_dir', 'desc').lower()
         if sort_dir not in ['asc', 'desc']:
             sort_dir = 'desc'
+        cursor = request.args.get('cursor')
 
         product_id = request.args.get('product_id', '')
         try:
@@ -6362,8 +6652,8 @@ def create_app():
             where_clauses = []
             params = []
 
+            # Staff search keeps exact substring semantics on the name (archived products included)
             if query:
-                # Change to filter by product name instead of category name
                 where_clauses.append("p.name LIKE %s")
                 params.append(f'%{query}%')
 
@@ -6400,24 +6690,37 @@ def create_app():
                 where_clause = "WHERE (p.archived IS NULL OR p.archived = FALSE)"
             app.logger.info(f"Product ID: {product_id}")
             app.logger.info(f"WHERE clause: {where_clause}")
+            # Validate sort_by column to prevent SQL injection
+            valid_sort_columns = ['id', 'name', 'price', 'original_price', 'stock']
+            if sort_by not in valid_sort_columns:
+                sort_by = 'id'
+
+            listing = keyset_pager.key('inventory', query, brand_filter, category_filter, stock_filter,
+                                       product_id, sort_by, sort_dir, page_size)
+
             # Count total matching products
             count_query = f"""
 SELECT COUNT(*)
 FROM products p
-LEFT JOIN categories c ON p.category_id = c.id
 {where_clause}
             """
-            cur.execute(count_query, tuple(params))
-            total_count = cur.fetchone()[0]
+
+            def count_products():
+                cur.execute(count_query, tuple(params))
+                return cur.fetchone()[0]
+
+            total_count = keyset_pager.count(listing, count_products)
 
             # Calculate pagination
             total_pages = (total_count + page_size - 1) // page_size
-            offset = (page - 1) * page_size
-
-            # Validate sort_by column to prevent SQL injection
-            valid_sort_columns = ['id', 'name', 'price', 'original_price', 'stock']
-            if sort_by not in valid_sort_columns:
-                sort_by = 'id'
+            # Keyset on (sort column, id); original_price is nullable, so it keeps OFFSET paging
+            sort_columns = ('p.id',) if sort_by == 'id' else (f'p.{sort_by}', 'p.id')
+            keyset = sort_by != 'original_price'
+            seek, offset = keyset_pager.plan(listing, page, page_size, cursor) if keyset else (None, (page - 1) * page_size)
+            if seek is not None:
+                seek_sql, seek_params = seek_predicate(sort_columns, seek, descending=sort_dir == 'desc')
+                where_clause += f" AND {seek_sql}"
+                params.extend(seek_params)
 
             # Fetch paginated products with sorting including category information
             # Optimized query with better performance
@@ -6426,12 +6729,19 @@ SELECT p.id, p.name, p.description, p.price, p.stock, p.photo, p.cpu, p.ram, p.s
 FROM products p
 LEFT JOIN categories c ON p.category_id = c.id
                 {where_clause}
-                ORDER BY p.{sort_by} {sort_dir}
+                ORDER BY {', '.join(f'{column} {sort_dir}' for column in sort_columns)}
                 LIMIT %s OFFSET %s
             """
             cur.execute(fetch_query, tuple(params) + (page_size, offset))
             results = cur.fetchall()
             cur.close()
+
+            next_cursor = None
+            if keyset and len(results) == page_size:
+                sort_index = {'id': 0, 'name': 1, 'price': 3, 'stock': 4}[sort_by]
+                last = results[-1]
+                next_cursor = keyset_pager.remember(
+                    listing, page, (last[0],) if sort_by == 'id' else (last[sort_index], last[0]))
             products = []
             for row in results:
                 products.append({
@@ -6461,7 +6771,8 @@ LEFT JOIN categories c ON p.category_id = c.id
             pagination = {
                 'page': page,
                 'total_pages': total_pages,
-                'total_count': total_count
+                'total_count': total_count,
+                'next_cursor': next_cursor
             }
 
             return jsonify({'success': True, 'products': products, 'pagination': pagination})
@@ -6915,6 +7226,9 @@ LEFT JOIN categories c ON p.category_id = c.id
             app.logger.info(f"Rows affected by update: {rows_affected}")
 
             mysql.connection.commit()
+            catalog_cache.invalidate('product updated')
+            product_images.queue(field_updates.get('photo'), field_updates.get('left_rear_view'),
+                                 field_updates.get('back_view'))
             app.logger.info("✓ Database commit successful")
 
             cur.close()
@@ -7124,6 +7438,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             # Archive the product
             cur.execute("UPDATE products SET archived = TRUE WHERE id = %s", (product_id,))
             conn.commit()
+            catalog_cache.invalidate('product archived')
             
             app.logger.info(f"Product {product_id} archived successfully by user {session.get('user_id')}")
             return jsonify({'success': True, 'message': 'Product archived successfully'})
@@ -7158,6 +7473,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             # Restore the product
             cur.execute("UPDATE products SET archived = FALSE WHERE id = %s", (product_id,))
             conn.commit()
+            catalog_cache.invalidate('product unarchived')
             
             app.logger.info(f"Product {product_id} restored successfully by user {session.get('user_id')}")
             return jsonify({'success': True, 'message': 'Product restored successfully'})
@@ -7309,6 +7625,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 """, (order_id,))
 
                 conn.commit()
+                SalesRollup.record_orders([order_id])
 
                 return jsonify({
                     'success': True,
@@ -7478,6 +7795,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             # Update product price and store the applied discount percentage
             cur.execute("UPDATE products SET price = %s, discount_percentage = %s WHERE id = %s", (new_price, discount_percentage, product_id))
             mysql.connection.commit()
+            catalog_cache.invalidate('discount changed')
             cur.close()
 
             return jsonify({
@@ -7565,6 +7883,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                     failed_products.append(f"Product ID {product_id}: {str(e)}")
 
             mysql.connection.commit()
+            catalog_cache.invalidate('discount changed')
             cur.close()
 
             success_count = len(updated_products)
@@ -7830,6 +8149,7 @@ LEFT JOIN categories c ON p.category_id = c.id
 
             affected_rows = cur.rowcount
             mysql.connection.commit()
+            catalog_cache.invalidate('discount changed')
             cur.close()
 
             return jsonify({
@@ -7876,6 +8196,7 @@ LEFT JOIN categories c ON p.category_id = c.id
 
             affected_rows = cur.rowcount
             mysql.connection.commit()
+            catalog_cache.invalidate('discount changed')
             cur.close()
 
             return jsonify({
@@ -7955,6 +8276,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             updated_price = cur.fetchone()[0]
             
             mysql.connection.commit()
+            catalog_cache.invalidate('discount changed')
             cur.close()
             
             return jsonify({
@@ -8035,6 +8357,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             app.logger.info(f"Restored {affected_rows} products to their pre-discount prices")
             
             mysql.connection.commit()
+            catalog_cache.invalidate('discount changed')
             cur.close()
 
             app.logger.info(f"User {session['user_id']} successfully removed all discounts from {affected_rows} products")
@@ -8659,14 +8982,15 @@ LEFT JOIN categories c ON p.category_id = c.id
             page = int(request.args.get('page', 1))
             per_page = int(request.args.get('per_page', 10))
             search = request.args.get('search') or ''
+            cursor = request.args.get('cursor')
             app.logger.info(f"Customer search request - page: {page}, per_page: {per_page}, search: '{search}' (length: {len(search)}, has_spaces: {' ' in search})")
 
             conn = mysql.connection
             cur = conn.cursor()
-            
-
 
             # Build search query - Simple and flexible like inventory search
+            where_sql = "deleted_at IS NULL"
+            params = []
             if search and search.strip():
                 # Clean the search query: remove extra spaces but preserve single spaces
                 clean_search = ' '.join(search.split())
@@ -8674,46 +8998,50 @@ LEFT JOIN categories c ON p.category_id = c.id
                 
                 # Use simple LIKE search (case-insensitive by default in MySQL)
                 # This works for both single words and phrases with spaces
-                search_query = """
-                    SELECT id, first_name, last_name, email, phone, address, created_at
-                    FROM customers
-                    WHERE (LOWER(first_name) LIKE LOWER(%s) 
+                where_sql += """
+                       AND (LOWER(first_name) LIKE LOWER(%s) 
                        OR LOWER(last_name) LIKE LOWER(%s) 
                        OR LOWER(email) LIKE LOWER(%s) 
                        OR LOWER(phone) LIKE LOWER(%s)
                        OR LOWER(CONCAT(first_name, ' ', last_name)) LIKE LOWER(%s))
-                       AND deleted_at IS NULL
-                    ORDER BY created_at DESC
                 """
                 search_param = f"%{clean_search}%"
-                cur.execute(search_query, (search_param, search_param, search_param, search_param, search_param))
-                app.logger.info(f"Executing search with parameter: '{search_param}'")
+                params.extend([search_param] * 5)
             else:
-                app.logger.info("No search query, fetching all active customers")
-                cur.execute("""
-                    SELECT id, first_name, last_name, email, phone, address, created_at
-                    FROM customers
-                    WHERE deleted_at IS NULL
-                    ORDER BY created_at DESC
-                """)
+                clean_search = ''
 
-            all_customers = cur.fetchall()
-            total_customers = len(all_customers)
-            app.logger.info(f"Search returned {total_customers} customers")
-            
-            # Log first few results for debugging
-            if all_customers and total_customers > 0:
-                app.logger.info(f"First customer: {all_customers[0]}")
-                if total_customers > 1:
-                    app.logger.info(f"Second customer: {all_customers[1]}")
+            listing = keyset_pager.key('customers', clean_search, per_page)
 
-            # Calculate pagination
-            offset = (page - 1) * per_page
-            paginated_customers = all_customers[offset:offset + per_page]
+            def count_customers():
+                cur.execute(f"SELECT COUNT(*) FROM customers WHERE {where_sql}", tuple(params))
+                return cur.fetchone()[0]
+
+            total_customers = keyset_pager.count(listing, count_customers)
+
+            # Page in SQL: keyset on (created_at, id), newest first
+            seek, offset = keyset_pager.plan(listing, page, per_page, cursor)
+            page_sql, page_params = where_sql, list(params)
+            if seek is not None:
+                seek_sql, seek_params = seek_predicate(('created_at', 'id'), seek)
+                page_sql += f" AND {seek_sql}"
+                page_params.extend(seek_params)
+            cur.execute(f"""
+                SELECT id, first_name, last_name, email, phone, address, created_at
+                FROM customers
+                WHERE {page_sql}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s OFFSET %s
+            """, tuple(page_params) + (per_page, offset))
+            page_rows = cur.fetchall()
+            app.logger.info(f"Customer listing: {len(page_rows)} of {total_customers} customers")
 
             # Convert to dict format
             columns = [desc[0] for desc in cur.description]
-            customers = [dict(zip(columns, row)) for row in paginated_customers]
+            customers = [dict(zip(columns, row)) for row in page_rows]
+
+            next_cursor = None
+            if len(customers) == per_page:
+                next_cursor = keyset_pager.remember(listing, page, (customers[-1]['created_at'], customers[-1]['id']))
 
             cur.close()
 
@@ -8723,7 +9051,8 @@ LEFT JOIN categories c ON p.category_id = c.id
                 'total': total_customers,
                 'page': page,
                 'per_page': per_page,
-                'total_pages': (total_customers + per_page - 1) // per_page
+                'total_pages': (total_customers + per_page - 1) // per_page,
+                'next_cursor': next_cursor
             })
 
         except Exception as e:
@@ -8818,98 +9147,83 @@ LEFT JOIN categories c ON p.category_id = c.id
             
             app.logger.info(f"Export request - customer_ids: {customer_ids}")
             
-            if not mysql.connection:
-                app.logger.error("No database connection available")
-                return jsonify({'success': False, 'error': 'Database connection not available'}), 500
-            
-            # Try to create cursor with dictionary support, fallback to regular cursor
-            try:
-                cursor = mysql.connection.cursor(dictionary=True)
-                use_dict_cursor = True
-            except TypeError:
-                cursor = mysql.connection.cursor()
-                use_dict_cursor = False
-            
             if customer_ids == 'all':
                 # Export all active customers
-                cursor.execute("""
+                query = """
                     SELECT id, first_name, last_name, email, phone, address, created_at
                     FROM customers
                     WHERE deleted_at IS NULL
                     ORDER BY id
-                """)
+                """
+                params = ()
             else:
                 # Export selected customers
                 placeholders = ', '.join(['%s'] * len(customer_ids))
-                cursor.execute(f"""
+                query = f"""
                     SELECT id, first_name, last_name, email, phone, address, created_at
                     FROM customers
                     WHERE id IN ({placeholders}) AND deleted_at IS NULL
                     ORDER BY id
-                """, tuple(customer_ids))
-            
-            customers = cursor.fetchall()
-            
-            # Get column names before closing cursor (for regular cursor conversion)
-            if not use_dict_cursor:
-                columns = [desc[0] for desc in cursor.description]
-            
-            cursor.close()
-            
-            app.logger.info(f"Found {len(customers)} customers to export")
-            
-            # Convert to dictionary format if using regular cursor
-            if not use_dict_cursor:
-                customers = [dict(zip(columns, row)) for row in customers]
-            
-            if customers:
-                app.logger.info(f"Sample customer data: {customers[0]}")
+                """
+                params = tuple(customer_ids)
             
-            if not customers:
+            customers = peek(iter_rows(query, params))
+            if customers is None:
                 return jsonify({'success': False, 'error': 'No customers found to export'}), 404
             
-            # Generate CSV content
-            csv_content = []
-            
-            # Add header row
-            csv_content.append('ID,First Name,Last Name,Email,Phone,Address,Created Date')
-            
-            # Add data rows
-            for customer in customers:
-                # Escape commas and quotes in CSV
-                first_name = customer["first_name"].replace('"', '""') if customer["first_name"] else ""
-                last_name = customer["last_name"].replace('"', '""') if customer["last_name"] else ""
-                email = customer["email"].replace('"', '""') if customer["email"] else ""
-                phone = customer.get("phone", "").replace('"', '""') if customer.get("phone") else ""
-                address = customer.get("address", "").replace('"', '""') if customer.get("address") else ""
-                created_date = customer["created_at"].strftime("%Y-%m-%d %H:%M:%S") if customer["created_at"] else ""
-                
-                row = [
-                    str(customer['id']),
-                    f'"{first_name}"',
-                    f'"{last_name}"',
-                    f'"{email}"',
-                    f'"{phone}"',
-                    f'"{address}"',
-                    f'"{created_date}"'
-                ]
-                csv_content.append(','.join(row))
-            
-            # Return CSV as plain text
-            response = make_response('\n'.join(csv_content))
-            response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-            response.headers['Content-Disposition'] = f'attachment; filename=customers_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            def csv_rows():
+                for customer in customers:
+                    yield [
+                        customer['id'],
+                        customer['first_name'] or '',
+                        customer['last_name'] or '',
+                        customer['email'] or '',
+                        customer.get('phone') or '',
+                        customer.get('address') or '',
+                        customer['created_at'].strftime("%Y-%m-%d %H:%M:%S") if customer['created_at'] else ''
+                    ]
             
-            return response
+            # Stream CSV in chunks; memory stays flat however many customers there are
+            header = ['ID', 'First Name', 'Last Name', 'Email', 'Phone', 'Address', 'Created Date']
+            return csv_response(stream_csv(header, csv_rows()),
+                                f'customers_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv')
             
         except Exception as e:
             app.logger.error(f"Error exporting customers: {e}")
-            app.logger.error(f"Error type: {type(e)}")
-            app.logger.error(f"Error details: {str(e)}")
             import traceback
             app.logger.error(f"Traceback: {traceback.format_exc()}")
             return jsonify({'success': False, 'error': str(e)}), 500
 
+    def csv_response(chunks, filename):
+        """Chunked CSV download from a generator of text chunks"""
+        response = Response(chunks, mimetype='text/csv')
+        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+        return response
+
+    def customer_orders_query(customer_ids):
+        """Customers with one row per order (or one row without an order), for exports"""
+        query = """
+            SELECT c.id, c.first_name, c.last_name, c.email, c.phone, c.address,
+                   o.id as order_id, o.order_date, o.total_amount, o.status, o.approval_status,
+                   GROUP_CONCAT(p.name SEPARATOR ', ') as product_names
+            FROM customers c
+            LEFT JOIN orders o ON c.id = o.customer_id
+            LEFT JOIN order_items oi ON o.id = oi.order_id
+            LEFT JOIN products p ON oi.product_id = p.id
+            WHERE c.deleted_at IS NULL
+        """
+        params = ()
+        if customer_ids != 'all':
+            query += f" AND c.id IN ({', '.join(['%s'] * len(customer_ids))})"
+            params = tuple(customer_ids)
+        query += """
+            GROUP BY c.id, o.id
+            ORDER BY c.id, o.order_date DESC
+        """
+        return query, params
+
     @app.route('/staff/customers/export-orders', methods=['POST'])
     def export_customer_orders():
         if 'username' not in session:
@@ -8922,258 +9236,111 @@ LEFT JOIN categories c ON p.category_id = c.id
             
             app.logger.info(f"Export orders request - customer_ids: {customer_ids}, format: {export_format}")
             
-            if not mysql.connection:
-                app.logger.error("No database connection available")
-                return jsonify({'success': False, 'error': 'Database connection not available'}), 500
-            
-            # Try to create cursor with dictionary support, fallback to regular cursor
-            try:
-                cursor = mysql.connection.cursor(dictionary=True)
-                use_dict_cursor = True
-            except TypeError:
-                cursor = mysql.connection.cursor()
-                use_dict_cursor = False
-            
-            if customer_ids == 'all':
-                # Export all active customers with their orders and products
-                cursor.execute("""
-                    SELECT c.id, c.first_name, c.last_name, c.email, c.phone, c.address,
-                           o.id as order_id, o.order_date, o.total_amount, o.status, o.approval_status,
-                           GROUP_CONCAT(p.name SEPARATOR ', ') as product_names
-                    FROM customers c
-                    LEFT JOIN orders o ON c.id = o.customer_id
-                    LEFT JOIN order_items oi ON o.id = oi.order_id
-                    LEFT JOIN products p ON oi.product_id = p.id
-                    WHERE c.deleted_at IS NULL
-                    GROUP BY c.id, o.id
-                    ORDER BY c.id, o.order_date DESC
-                """)
-            else:
-                # Export selected customers with their orders and products
-                placeholders = ', '.join(['%s'] * len(customer_ids))
-                cursor.execute(f"""
-                    SELECT c.id, c.first_name, c.last_name, c.email, c.phone, c.address,
-                           o.id as order_id, o.order_date, o.total_amount, o.status, o.approval_status,
-                           GROUP_CONCAT(p.name SEPARATOR ', ') as product_names
-                    FROM customers c
-                    LEFT JOIN orders o ON c.id = o.customer_id
-                    LEFT JOIN order_items oi ON o.id = oi.order_id
-                    LEFT JOIN products p ON oi.product_id = p.id
-                    WHERE c.id IN ({placeholders}) AND c.deleted_at IS NULL
-                    GROUP BY c.id, o.id
-                    ORDER BY c.id, o.order_date DESC
-                """, tuple(customer_ids))
-            
-            rows = cursor.fetchall()
-            
-            # Get column names before closing cursor (for regular cursor conversion)
-            if not use_dict_cursor:
-                columns = [desc[0] for desc in cursor.description]
-            
-            cursor.close()
-            
-            app.logger.info(f"Found {len(rows)} order records to export")
-            
-            # Convert to dictionary format if using regular cursor
-            if not use_dict_cursor:
-                rows = [dict(zip(columns, row)) for row in rows]
-            
-            if not rows:
+            query, params = customer_orders_query(customer_ids)
+
+            if export_format == 'pdf':
+                # Rendered in the background; the client polls the job and downloads the file
+                filename = f'customer_orders_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+                job_id = job_queue.enqueue('customer_orders_pdf', args=(query, params),
+                                           owner=session.get('user_id'), filename=filename)
+                return job_accepted(job_id)
+
+            rows = peek(iter_rows(query, params))
+            if rows is None:
                 return jsonify({'success': False, 'error': 'No orders found to export'}), 404
-            
-            # Group orders by customer
-            customers_with_orders = {}
-            for row in rows:
-                customer_id = row['id']
-                if customer_id not in customers_with_orders:
-                    customers_with_orders[customer_id] = {
-                        'customer': {
-                            'id': row['id'],
-                            'first_name': row['first_name'],
-                            'last_name': row['last_name'],
-                            'email': row['email'],
-                            'phone': row['phone'],
-                            'address': row['address']
-                        },
-                        'orders': []
-                    }
-                
-                if row['order_id']:  # Only add if there's an order
-                    customers_with_orders[customer_id]['orders'].append({
-                        'order_id': row['order_id'],
-                        'order_date': row['order_date'],
-                        'total_amount': row['total_amount'],
-                        'status': row['status'],
-                        'product_names': row.get('product_names', '')
-                    })
-            
-            # Always return CSV data, PDF will be generated client-side
-            return generate_orders_csv(customers_with_orders)
+
+            def csv_rows():
+                for row in rows:
+                    customer_cells = [
+                        row['id'],
+                        f"{row['first_name']} {row['last_name']}",
+                        row['email'] or '',
+                        row['phone'] or '',
+                        row['address'] or ''
+                    ]
+                    if not row['order_id']:  # Customer with no orders
+                        yield customer_cells + ['No Orders', '', '', '', '']
+                    else:
+                        yield customer_cells + [
+                            row['product_names'] or '',
+                            row['order_id'],
+                            row['order_date'].strftime("%Y-%m-%d %H:%M:%S") if row['order_date'] else '',
+                            f"${row['total_amount']}",
+                            row['status'] or ''
+                        ]
+
+            header = ['Customer ID', 'Customer Name', 'Email', 'Phone', 'Address', 'Product Names',
+                      'Order ID', 'Order Date', 'Total Amount', 'Status']
+            return csv_response(stream_csv(header, csv_rows()),
+                                f'customer_orders_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv')
             
         except Exception as e:
             app.logger.error(f"Error exporting customer orders: {e}")
-            app.logger.error(f"Error type: {type(e)}")
-            app.logger.error(f"Error details: {str(e)}")
             import traceback
             app.logger.error(f"Traceback: {traceback.format_exc()}")
             return jsonify({'success': False, 'error': str(e)}), 500
 
-    def generate_orders_csv(customers_with_orders):
-        """Generate CSV content for customer orders"""
-        csv_content = []
-        
-        # Add header row
-        csv_content.append('Customer ID,Customer Name,Email,Phone,Address,Product Names,Order ID,Order Date,Total Amount,Status')
-        
-        # Add data rows
-        for customer_data in customers_with_orders.values():
-            customer = customer_data['customer']
-            orders = customer_data['orders']
-            
-            if not orders:  # Customer with no orders
-                row = [
-                    str(customer['id']),
-                    f'"{customer["first_name"]} {customer["last_name"]}"',
-                    f'"{customer["email"]}"',
-                    f'"{customer.get("phone", "")}"',
-                    f'"{customer.get("address", "")}"',
-                    'No Orders',
-                    '',
-                    '',
-                    '',
-                    ''
-                ]
-                csv_content.append(','.join(row))
+    def build_customer_orders_pdf(path, query, params):
+        """Write the customer orders report to path (runs on a job queue thread)"""
+        styles = getSampleStyleSheet()
+        story = [
+            Paragraph("Customer Orders Report", styles['Title']),
+            Paragraph(f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']),
+            Spacer(1, 20)
+        ]
+
+        def flush(customer, orders):
+            # Paragraph parses its text as markup: a '<' or '&' in customer data would break the build
+            name = escape(f"{customer['first_name'] or ''} {customer['last_name'] or ''}")
+            story.append(Paragraph(f"{name} (ID {customer['id']})", styles['Heading3']))
+            contact = ' | '.join(escape(str(value or default)) for value, default in
+                                 ((customer['email'], ''), (customer['phone'], 'N/A'), (customer['address'], 'N/A')))
+            story.append(Paragraph(contact, styles['Normal']))
+            if not orders:
+                story.append(Paragraph("<i>No orders found for this customer.</i>", styles['Normal']))
             else:
+                table_data = [['Order ID', 'Order Date', 'Products', 'Total', 'Status', 'Approval']]
+                total_amount = 0.0
                 for order in orders:
-                    row = [
-                        str(customer['id']),
-                        f'"{customer["first_name"]} {customer["last_name"]}"',
-                        f'"{customer["email"]}"',
-                        f'"{customer.get("phone", "")}"',
-                        f'"{customer.get("address", "")}"',
-                        f'"{order.get("product_names", "")}"',
+                    amount = float(order['total_amount'] or 0)
+                    total_amount += amount
+                    table_data.append([
                         str(order['order_id']),
-                        f'"{order["order_date"].strftime("%Y-%m-%d %H:%M:%S")}"',
-                        f'"${order["total_amount"]}"',
-                        f'"{order["status"]}"'
-                    ]
-                    csv_content.append(','.join(row))
-        
-        # Return CSV as plain text
-        response = make_response('\n'.join(csv_content))
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-Disposition'] = f'attachment; filename=customer_orders_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        
-        return response
-
-    def generate_orders_pdf(customers_with_orders):
-        """Generate PDF content for customer orders"""
-        try:
-            # Create HTML content for PDF
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>Customer Orders Export</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                    .header {{ text-align: center; margin-bottom: 30px; }}
-                    .customer-section {{ margin-bottom: 30px; page-break-inside: avoid; }}
-                    .customer-info {{ background: #f5f5f5; padding: 15px; border-radius: 5px; margin-bottom: 15px; }}
-                    .orders-table {{ width: 100%; border-collapse: collapse; margin-top: 10px; }}
-                    .orders-table th, .orders-table td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-                    .orders-table th {{ background: #f0f0f0; }}
-                    .no-orders {{ font-style: italic; color: #666; }}
-                    .total-row {{ font-weight: bold; background: #e8f5e8; }}
-                </style>
-            </head>
-            <body>
-                <div class="header">
-                    <h1>Customer Orders Report</h1>
-                    <p>Generated on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</p>
-                </div>
-            """
-            
-            for customer_data in customers_with_orders.values():
-                customer = customer_data['customer']
-                orders = customer_data['orders']
-                
-                html_content += f"""
-                <div class="customer-section">
-                    <div class="customer-info">
-                        <h3>{customer['first_name']} {customer['last_name']}</h3>
-                        <p><strong>ID:</strong> {customer['id']}</p>
-                        <p><strong>Email:</strong> {customer['email']}</p>
-                        <p><strong>Phone:</strong> {customer.get('phone', 'N/A')}</p>
-                        <p><strong>Address:</strong> {customer.get('address', 'N/A')}</p>
-                    </div>
-                """
-                
-                if not orders:
-                    html_content += '<p class="no-orders">No orders found for this customer.</p>'
-                else:
-                    html_content += """
-                    <table class="orders-table">
-                        <thead>
-                            <tr>
-                                <th>Order ID</th>
-                                <th>Order Date</th>
-                                <th>Total Amount</th>
-                                <th>Status</th>
-                                <th>Approval Status</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                    """
-                    
-                    total_amount = 0
-                    for order in orders:
-                        amount = float(order['total_amount']) if order['total_amount'] else 0
-                        total_amount += amount
-                        html_content += f"""
-                            <tr>
-                                <td>{order['order_id']}</td>
-                                <td>{order['order_date'].strftime("%Y-%m-%d %H:%M:%S")}</td>
-                                <td>${amount:.2f}</td>
-                                <td>{order['status']}</td>
-                                <td>{order['approval_status']}</td>
-                            </tr>
-                        """
-                    
-                    html_content += f"""
-                            <tr class="total-row">
-                                <td colspan="2"><strong>Total Orders:</strong> {len(orders)}</td>
-                                <td colspan="3"><strong>Total Amount:</strong> ${total_amount:.2f}</td>
-                            </tr>
-                        </tbody>
-                    </table>
-                    """
-                
-                html_content += "</div>"
-            
-            html_content += """
-            </body>
-            </html>
-            """
-            
-            # Generate PDF using pdfkit
-            try:
-                pdf = pdfkit.from_string(html_content, False)
-                response = make_response(pdf)
-                response.headers['Content-Type'] = 'application/pdf'
-                response.headers['Content-Disposition'] = f'attachment; filename=customer_orders_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-                return response
-            except Exception as pdf_error:
-                app.logger.error(f"PDF generation error: {pdf_error}")
-                # Fallback to CSV if PDF fails
-                return generate_orders_csv(customers_with_orders)
-                
-        except Exception as e:
-            app.logger.error(f"Error generating PDF: {e}")
-            # Fallback to CSV if HTML generation fails
-            return generate_orders_csv(customers_with_orders)
+                        order['order_date'].strftime('%Y-%m-%d %H:%M') if order['order_date'] else '',
+                        Paragraph(escape(order['product_names'] or ''), styles['Normal']),
+                        f"${amount:.2f}",
+                        order['status'] or '',
+                        order['approval_status'] or ''
+                    ])
+                table_data.append([f"Orders: {len(orders)}", '', '', f"${total_amount:.2f}", '', ''])
+                table = Table(table_data, colWidths=[0.7*inch, 1.2*inch, 2.2*inch, 0.8*inch, 0.9*inch, 0.9*inch], repeatRows=1)
+                table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2563eb')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 8),
+                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ]))
+                story.append(table)
+            story.append(Spacer(1, 16))
+
+        customer, orders = None, []
+        for row in iter_rows(query, params):
+            if customer is None or row['id'] != customer['id']:
+                if customer is not None:
+                    flush(customer, orders)
+                customer, orders = row, []
+            if row['order_id']:
+                orders.append(row)
+        if customer is None:
+            raise ValueError('No orders found to export')
+        flush(customer, orders)
+
+        SimpleDocTemplate(path, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36).build(story)
+
+    job_queue.register('customer_orders_pdf', build_customer_orders_pdf)
 
     @app.route('/staff/customers/deleted', methods=['GET'])
     def get_deleted_customers():
@@ -9255,6 +9422,9 @@ LEFT JOIN categories c ON p.category_id = c.id
                 columns = [desc[0] for desc in cur.description]
                 products = [dict(zip(columns, row)) for row in rows]
                 cur.close()
+                for product in products:
+                    product['photo_srcset'] = product_images.srcset(product['photo'], 'webp')
+                    product['photo_jpeg_srcset'] = product_images.srcset(product['photo'], 'jpg')
                 return jsonify({'success': True, 'products': products})
             except Exception as e:
                 cur.close()
@@ -9283,7 +9453,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             cur = conn.cursor()
             cur.execute("""
                 SELECT COUNT(*) FROM orders
-                WHERE customer_id = %s AND LOWER(status) = 'completed'
+                WHERE customer_id = %s AND status = 'COMPLETED'
             """, (customer_id,))
             result = cur.fetchone()
             cur.close()
@@ -9351,10 +9521,15 @@ LEFT JOIN categories c ON p.category_id = c.id
             app.logger.error(f"Error rendering reports page: {e}")
             return render_template('error.html', error='Failed to load reports'), 500
     
-    # Serve static files explicitly
-    @app.route('/static/<path:filename>')
-    def static_files(filename):
-        return app.send_static_file(filename)
+    # Serve static files with fingerprinted URLs, ETags and precompressed variants
+    init_static_assets(app)
+
+    # Payment verifier thread in every worker; the one holding the MySQL lock does the checks.
+    # Started on the first request so the thread belongs to the forked worker process.
+    if Config.PAYMENT_VERIFIER_ENABLED:
+        from utils.automatic_payment_verifier import initialize_payment_verifier
+        verifier = initialize_payment_verifier(app)
+        app.before_request(verifier.ensure_started)
     
     # Register auth blueprint
     with app.app_context():
@@ -9425,7 +9600,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 JOIN products p ON oi.product_id = p.id
                 JOIN categories c ON p.category_id = c.id
                 JOIN orders o ON oi.order_id = o.id
-                WHERE LOWER(o.status) IN ('completed', 'processing')
+                WHERE o.status IN ('COMPLETED', 'PROCESSING')
                 AND (p.archived IS NULL OR p.archived = FALSE)
                 GROUP BY c.id, c.name
                 ORDER BY total_revenue DESC
@@ -9474,7 +9649,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 JOIN categories c ON p.category_id = c.id
                 JOIN orders o ON oi.order_id = o.id
                 WHERE c.name = %s
-                AND LOWER(o.status) IN ('completed', 'processing')
+                AND o.status IN ('COMPLETED', 'PROCESSING')
                 AND (p.archived IS NULL OR p.archived = FALSE)
                 GROUP BY p.id, p.name
                 ORDER BY total_quantity_sold DESC
@@ -9531,7 +9706,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 JOIN products p ON oi.product_id = p.id
                 JOIN orders o ON oi.order_id = o.id
                 WHERE p.name = %s
-                AND LOWER(o.status) IN ('completed', 'processing')
+                AND o.status IN ('COMPLETED', 'PROCESSING')
                 AND (p.archived IS NULL OR p.archived = FALSE)
                 GROUP BY p.id, p.name, p.price
             """, (product_name,))
@@ -9556,7 +9731,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 JOIN orders o ON oi.order_id = o.id
                 JOIN customers c ON o.customer_id = c.id
                 WHERE p.name = %s
-                AND LOWER(o.status) IN ('completed', 'processing')
+                AND o.status IN ('COMPLETED', 'PROCESSING')
                 AND (p.archived IS NULL OR p.archived = FALSE)
                 ORDER BY o.order_date DESC
                 LIMIT 20
@@ -9627,7 +9802,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 JOIN orders o ON oi.order_id = o.id
                 JOIN customers c ON o.customer_id = c.id
                 WHERE p.name = %s
-                AND LOWER(o.status) IN ('completed', 'processing')
+                AND o.status IN ('COMPLETED', 'PROCESSING')
                 AND (p.archived IS NULL OR p.archived = FALSE)
                 ORDER BY o.order_date DESC
             """, (product_name,))
@@ -9708,17 +9883,14 @@ LEFT JOIN categories c ON p.category_id = c.id
     @app.route('/auth/staff/api/kpis')
     def api_kpis():
         try:
-            total_revenue = Report.get_total_revenue_this_month()
-            new_customers = Customer.get_new_customers_this_month()
-            average_order_value = Report.get_average_order_value_this_month()
-            order_summary = Order.get_status_summary()
+            kpis = kpi_snapshot.get(Report.get_kpi_snapshot)
             
             return jsonify({
                 'success': True,
-                'total_revenue': total_revenue,
-                'new_customers': new_customers,
-                'average_order_value': average_order_value,
-                'order_summary': order_summary
+                'total_revenue': kpis['total_revenue'],
+                'new_customers': kpis['new_customers'],
+                'average_order_value': kpis['average_order_value'],
+                'order_summary': kpis['order_summary']
             })
         except Exception as e:
             app.logger.error(f"Error fetching KPIs: {e}")
@@ -9861,18 +10033,7 @@ LEFT JOIN categories c ON p.category_id = c.id
         if not query:
             return jsonify({'success': True, 'suggestions': []})
         try:
-            cur = mysql.connection.cursor()
-            like_query = f"%{query}%"
-            cur.execute("""
-                SELECT id, name FROM products
-                WHERE name LIKE %s
-                AND (archived IS NULL OR archived = FALSE)
-                ORDER BY name ASC
-                LIMIT 10
-            """, (like_query,))
-            results = cur.fetchall()
-            cur.close()
-            suggestions = [{'id': row[0], 'name': row[1]} for row in results]
+            suggestions = product_search.suggest(query, limit=10)
             return jsonify({'success': True, 'suggestions': suggestions})
         except Exception as e:
             app.logger.error(f"Error fetching search suggestions: {e}")
@@ -9897,10 +10058,11 @@ LEFT JOIN categories c ON p.category_id = c.id
                 # Check if we have data for the requested year
                 conn = get_db()
                 cur = conn.cursor()
-                cur.execute("""
+                year_sql, year_params = qp.in_year('order_date', current_year)
+                cur.execute(f"""
                     SELECT COUNT(*) FROM orders 
-                    WHERE YEAR(order_date) = %s AND LOWER(status) = 'completed'
-                """, (current_year,))
+                    WHERE status = 'COMPLETED' AND {year_sql}
+                """, year_params)
                 count = cur.fetchone()[0]
                 cur.close()
                 
@@ -9908,24 +10070,23 @@ LEFT JOIN categories c ON p.category_id = c.id
                     # No data for this year, use 2025 data as fallback
                     current_year = 2025
             
-            start_date = f"{current_year}-01-01"
-            end_date = f"{current_year}-12-31"
+            year_sql, year_params = qp.in_year('o.order_date', current_year)
 
             cur = mysql.connection.cursor()
-            cur.execute("""
+            cur.execute(f"""
                 SELECT
-                    DATE_FORMAT(o.order_date, '%%Y-%%m') as month,
+                    DATE_FORMAT(o.order_date, '%Y-%m') as month,
                     COUNT(DISTINCT o.id) as orders_count,
                     SUM(oi.quantity * oi.price) as monthly_revenue
                 FROM orders o
                 JOIN order_items oi ON o.id = oi.order_id
                 JOIN products p ON oi.product_id = p.id
-                WHERE o.order_date BETWEEN %s AND %s
-                AND LOWER(o.status) = 'completed'
+                WHERE o.status = 'COMPLETED'
+                AND {year_sql}
                 AND (p.archived IS NULL OR p.archived = FALSE)
-                GROUP BY DATE_FORMAT(o.order_date, '%%Y-%%m')
+                GROUP BY DATE_FORMAT(o.order_date, '%Y-%m')
                 ORDER BY month ASC
-            """, (start_date, end_date))
+            """, year_params)
 
             results = cur.fetchall()
             cur.close()
@@ -9976,8 +10137,10 @@ LEFT JOIN categories c ON p.category_id = c.id
             last_day_num = calendar.monthrange(today.year, today.month)[1]
             last_day = today.replace(day=last_day_num)
 
+            range_sql, range_params = qp.between_days('o.order_date', first_day, last_day)
+
             cur = mysql.connection.cursor()
-            cur.execute("""
+            cur.execute(f"""
                 SELECT
                     DATE(o.order_date) as order_date,
                     COUNT(DISTINCT o.id) as orders_count,
@@ -9985,12 +10148,12 @@ LEFT JOIN categories c ON p.category_id = c.id
                 FROM orders o
                 JOIN order_items oi ON o.id = oi.order_id
                 JOIN products p ON oi.product_id = p.id
-                WHERE DATE(o.order_date) BETWEEN %s AND %s
-                AND LOWER(o.status) = 'completed'
+                WHERE o.status = 'COMPLETED'
+                AND {range_sql}
                 AND (p.archived IS NULL OR p.archived = FALSE)
                 GROUP BY DATE(o.order_date)
                 ORDER BY order_date ASC
-            """, (first_day, last_day))
+            """, range_params)
 
             results = cur.fetchall()
             cur.close()
@@ -10036,8 +10199,11 @@ LEFT JOIN categories c ON p.category_id = c.id
                     return jsonify({'success': False, 'error': 'Date parameter is required'}), 400
             target_date = datetime.strptime(date_param, '%Y-%m-%d').date()
 
+            day_sql, day_params = qp.on_day('o.order_date', target_date)
+            sale_sql, sale_params = qp.completed_or_approved('o')
+
             cur = mysql.connection.cursor()
-            cur.execute("""
+            cur.execute(f"""
                 SELECT
                     o.id as order_id,
                     o.order_date,
@@ -10051,11 +10217,11 @@ LEFT JOIN categories c ON p.category_id = c.id
                 JOIN customers c ON o.customer_id = c.id
                 JOIN order_items oi ON o.id = oi.order_id
                 JOIN products p ON oi.product_id = p.id
-                WHERE DATE(o.order_date) = %s
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
+                WHERE {day_sql}
+                AND {sale_sql}
                 GROUP BY o.id, o.order_date, c.first_name, c.last_name, o.total_amount, o.status, o.approval_status
                 ORDER BY o.order_date DESC
-            """, (target_date,))
+            """, (*day_params, *sale_params))
 
             results = cur.fetchall()
             cur.close()
@@ -10112,8 +10278,10 @@ LEFT JOIN categories c ON p.category_id = c.id
 
             app.logger.info(f"Monthly sales detail for {month_param}: {start_date} to {end_date}")
 
+            month_sql, month_params = qp.in_month('o.order_date', year, month)
+
             cur = mysql.connection.cursor()
-            cur.execute("""
+            cur.execute(f"""
                 SELECT
                     o.id as order_id,
                     o.order_date,
@@ -10125,11 +10293,11 @@ LEFT JOIN categories c ON p.category_id = c.id
                 JOIN customers c ON o.customer_id = c.id
                 JOIN order_items oi ON o.id = oi.order_id
                 JOIN products p ON oi.product_id = p.id
-                WHERE DATE(o.order_date) BETWEEN %s AND %s
-                AND LOWER(o.status) = 'completed'
+                WHERE o.status = 'COMPLETED'
+                AND {month_sql}
                 GROUP BY o.id, o.order_date, c.first_name, c.last_name, o.total_amount, o.status
                 ORDER BY o.order_date DESC
-            """, (start_date, end_date))
+            """, month_params)
 
             results = cur.fetchall()
             cur.close()
@@ -10223,14 +10391,15 @@ LEFT JOIN categories c ON p.category_id = c.id
             cur = conn.cursor(dictionary=True)
             
             # Get orders within the specified date range
-            cur.execute("""
+            range_sql, range_params = qp.between_days('o.order_date', start_date, end_date)
+            cur.execute(f"""
                 SELECT o.id, o.order_date, o.total_amount, o.status, o.payment_method,
                        c.first_name, c.last_name, c.email
                 FROM orders o
                 LEFT JOIN customers c ON o.customer_id = c.id
-                WHERE DATE(o.order_date) BETWEEN %s AND %s
+                WHERE {range_sql}
                 ORDER BY o.order_date DESC
-            """, (start_date, end_date))
+            """, range_params)
             
             orders = cur.fetchall()
             
@@ -10305,7 +10474,8 @@ LEFT JOIN categories c ON p.category_id = c.id
             cur = mysql.connection.cursor()
             
             # Get orders for the specific date
-            query = """
+            day_sql, day_params = qp.on_day('o.order_date', date)
+            query = f"""
                 SELECT 
                     o.id as order_id,
                     o.order_date,
@@ -10317,13 +10487,13 @@ LEFT JOIN categories c ON p.category_id = c.id
                 LEFT JOIN customers c ON o.customer_id = c.id
                 LEFT JOIN order_items oi ON o.id = oi.order_id
                 LEFT JOIN products p ON oi.product_id = p.id
-                WHERE DATE(o.order_date) = %s
-                AND LOWER(o.status) = 'completed'
+                WHERE o.status = 'COMPLETED'
+                AND {day_sql}
                 GROUP BY o.id, o.order_date, o.total_amount, o.status, c.first_name, c.last_name
                 ORDER BY o.order_date DESC
             """
             app.logger.info(f"Executing query with date parameter: {date}")
-            cur.execute(query, (date,))
+            cur.execute(query, day_params)
             orders = cur.fetchall()
             app.logger.info(f"Raw database results: {len(orders)} rows")
             cur.close()
@@ -10397,14 +10567,15 @@ LEFT JOIN categories c ON p.category_id = c.id
             cur = mysql.connection.cursor()
             
             # Get total sales and orders count for the day
-            query = """
+            day_sql, day_params = qp.on_day('order_date', date)
+            query = f"""
                 SELECT 
                     COUNT(*) as orders_count,
                     COALESCE(SUM(total_amount), 0) as total_sales
                 FROM orders 
-                WHERE DATE(order_date) = %s AND LOWER(status) = 'completed'
+                WHERE status = 'COMPLETED' AND {day_sql}
             """
-            cur.execute(query, (date,))
+            cur.execute(query, day_params)
             result = cur.fetchone()
             cur.close()
             
@@ -10454,7 +10625,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             query = """
                 SELECT total_amount
                 FROM orders 
-                WHERE id = %s AND LOWER(status) = 'completed'
+                WHERE id = %s AND status = 'COMPLETED'
             """
             cur.execute(query, (order_id,))
             result = cur.fetchone()
@@ -10517,29 +10688,13 @@ LEFT JOIN categories c ON p.category_id = c.id
     def api_today_revenue():
         """Get today's revenue for completed/approved orders only"""
         try:
-            cursor = mysql.connection.cursor()
-            
-            # Get today's revenue for COMPLETED orders or APPROVED orders using database's current date
-            query = """
-                SELECT 
-                    COALESCE(SUM(o.total_amount), 0) as total_revenue,
-                    COALESCE(SUM(oi.quantity * (oi.price - p.original_price)), 0) as total_profit
-                FROM orders o
-                JOIN order_items oi ON o.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                WHERE DATE(o.order_date) = CURDATE() 
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
-            """
-            
-            app.logger.info(f"Executing today revenue query: {query}")
-            cursor.execute(query)
-            
-            row = cursor.fetchone()
-            total_revenue = float(row[0]) if row[0] else 0.0
-            total_profit = float(row[1]) if row[1] else 0.0
+            # Today's revenue for COMPLETED or APPROVED orders, from the daily sales rollup
+            today = datetime.now().date()
+            totals = SalesRollup.get_totals(today, today)
+            total_revenue = totals['order_total']
+            total_profit = totals['profit']
             
             app.logger.info(f"Today's revenue: ${total_revenue}, Profit: ${total_profit}")
-            cursor.close()
             
             return jsonify({
                 'success': True,
@@ -10559,23 +10714,9 @@ LEFT JOIN categories c ON p.category_id = c.id
             if not date:
                 return jsonify({'success': False, 'error': 'Date parameter is required'}), 400
             
-            cursor = mysql.connection.cursor()
-            
-            query = """
-                SELECT 
-                    COALESCE(SUM(o.total_amount), 0) as revenue,
-                    COUNT(DISTINCT o.id) as orders
-                FROM orders o
-                WHERE DATE(o.order_date) = %s 
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
-            """
-            
-            cursor.execute(query, (date,))
-            row = cursor.fetchone()
-            revenue = float(row[0]) if row[0] else 0.0
-            orders = int(row[1]) if row[1] else 0
-            
-            cursor.close()
+            totals = SalesRollup.get_totals(date, date)
+            revenue = totals['order_total']
+            orders = totals['order_count']
             
             return jsonify({
                 'success': True,
@@ -10597,33 +10738,14 @@ LEFT JOIN categories c ON p.category_id = c.id
             if not start_date or not end_date:
                 return jsonify({'success': False, 'error': 'start_date and end_date parameters are required'}), 400
             
-            cursor = mysql.connection.cursor()
-            
-            query = """
-                SELECT 
-                    DATE(o.order_date) as date,
-                    COUNT(DISTINCT o.id) as orders,
-                    COALESCE(SUM(o.total_amount), 0) as revenue
-                FROM orders o
-                WHERE DATE(o.order_date) BETWEEN %s AND %s 
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
-                GROUP BY DATE(o.order_date)
-                ORDER BY date ASC
-            """
-            
-            cursor.execute(query, (start_date, end_date))
-            results = cursor.fetchall()
-            
             data = []
-            for row in results:
+            for row in SalesRollup.get_daily(start_date, end_date):
                 data.append({
-                    'date': row[0].strftime('%Y-%m-%d'),
-                    'orders': int(row[1]),
-                    'revenue': float(row[2])
+                    'date': row['sale_date'].strftime('%Y-%m-%d'),
+                    'orders': int(row['order_count']),
+                    'revenue': float(row['order_total'])
                 })
             
-            cursor.close()
-            
             return jsonify({
                 'success': True,
                 'data': data
@@ -10643,35 +10765,14 @@ LEFT JOIN categories c ON p.category_id = c.id
             if not dates:
                 return jsonify({'success': False, 'error': 'No dates provided'}), 400
             
-            cursor = mysql.connection.cursor()
-            
-            # Create placeholders for the dates
-            placeholders = ','.join(['%s'] * len(dates))
-            query = f"""
-                SELECT 
-                    DATE(o.order_date) as date,
-                    COUNT(DISTINCT o.id) as orders,
-                    COALESCE(SUM(o.total_amount), 0) as revenue
-                FROM orders o
-                WHERE DATE(o.order_date) IN ({placeholders})
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
-                GROUP BY DATE(o.order_date)
-                ORDER BY date ASC
-            """
-            
-            cursor.execute(query, dates)
-            results = cursor.fetchall()
-            
             data = []
-            for row in results:
+            for row in SalesRollup.get_days(dates):
                 data.append({
-                    'date': row[0].strftime('%Y-%m-%d'),
-                    'orders': int(row[1]),
-                    'revenue': float(row[2])
+                    'date': row['sale_date'].strftime('%Y-%m-%d'),
+                    'orders': int(row['order_count']),
+                    'revenue': float(row['order_total'])
                 })
             
-            cursor.close()
-            
             return jsonify({
                 'success': True,
                 'data': data
@@ -10694,6 +10795,8 @@ LEFT JOIN categories c ON p.category_id = c.id
             # First, let's see what dates actually exist in the database
             cursor = mysql.connection.cursor()
             
+            day_sql, day_params = qp.on_day('o.order_date', date)
+
             # Check what dates have orders
             date_check_query = """
                 SELECT DISTINCT DATE(order_date) as order_date, COUNT(*) as order_count
@@ -10708,20 +10811,20 @@ LEFT JOIN categories c ON p.category_id = c.id
             app.logger.info(f"Available dates with orders: {available_dates}")
             
             # First, let's check if there are any orders for this date (with more relaxed conditions)
-            check_query = """
+            check_query = f"""
                 SELECT COUNT(*) as order_count
                 FROM orders o
-                WHERE DATE(o.order_date) = %s
+                WHERE {day_sql}
             """
             
-            cursor.execute(check_query, (date,))
+            cursor.execute(check_query, day_params)
             check_result = cursor.fetchone()
             total_orders_check = int(check_result[0]) if check_result[0] else 0
             
             app.logger.info(f"Total orders found for {date}: {total_orders_check}")
             
             # Get summary statistics - include ALL orders for the date
-            summary_query = """
+            summary_query = f"""
                 SELECT 
                     COALESCE(SUM(o.total_amount), 0) as total_revenue,
                     COUNT(DISTINCT o.id) as total_orders,
@@ -10729,10 +10832,10 @@ LEFT JOIN categories c ON p.category_id = c.id
                     COUNT(DISTINCT oi.product_id) as total_products
                 FROM orders o
                 LEFT JOIN order_items oi ON o.id = oi.order_id
-                WHERE DATE(o.order_date) = %s
+                WHERE {day_sql}
             """
             
-            cursor.execute(summary_query, (date,))
+            cursor.execute(summary_query, day_params)
             summary_row = cursor.fetchone()
             
             total_revenue = float(summary_row[0]) if summary_row[0] else 0.0
@@ -10743,7 +10846,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             app.logger.info(f"Summary - Revenue: {total_revenue}, Orders: {total_orders}, Avg: {avg_order_value}, Products: {total_products}")
             
             # Get detailed orders with actual customer names
-            orders_query = """
+            orders_query = f"""
                 SELECT 
                     o.id,
                     COALESCE(CONCAT(c.first_name, ' ', c.last_name), 'Walk-in Customer') as customer_name,
@@ -10754,12 +10857,12 @@ LEFT JOIN categories c ON p.category_id = c.id
                 FROM orders o
                 LEFT JOIN order_items oi ON o.id = oi.order_id
                 LEFT JOIN customers c ON o.customer_id = c.id
-                WHERE DATE(o.order_date) = %s 
+                WHERE {day_sql}
                 GROUP BY o.id, o.order_date, o.total_amount, o.status, c.first_name, c.last_name
                 ORDER BY o.order_date ASC
             """
             
-            cursor.execute(orders_query, (date,))
+            cursor.execute(orders_query, day_params)
             orders_results = cursor.fetchall()
             
             orders = []
@@ -10803,14 +10906,16 @@ LEFT JOIN categories c ON p.category_id = c.id
         cur = conn.cursor()
         try:
             # Use database's current date to avoid timezone issues
-            cur.execute("""
+            today_sql, today_params = qp.today('order_date')
+            sale_sql, sale_params = qp.completed_or_approved(None)
+            cur.execute(f"""
                 SELECT HOUR(order_date) AS hour, COUNT(*) AS order_count
                 FROM orders
-                WHERE DATE(order_date) = CURDATE() 
-                AND (LOWER(status) = 'completed' OR approval_status = 'Approved')
+                WHERE {today_sql}
+                AND {sale_sql}
                 GROUP BY hour
                 ORDER BY hour
-            """)
+            """, (*today_params, *sale_params))
             rows = cur.fetchall()
             # Convert rows to list of dicts manually
             data = []
@@ -10831,11 +10936,13 @@ LEFT JOIN categories c ON p.category_id = c.id
         cur = conn.cursor()
         try:
             # Use database's current date to avoid timezone issues
-            cur.execute("""
+            today_sql, today_params = qp.today('order_date')
+            sale_sql, sale_params = qp.completed_or_approved(None)
+            cur.execute(f"""
                 SELECT COUNT(*) AS total_orders
                 FROM orders
-                WHERE DATE(order_date) = CURDATE() AND (LOWER(status) = 'completed' OR approval_status = 'Approved')
-            """)
+                WHERE {today_sql} AND {sale_sql}
+            """, (*today_params, *sale_params))
             row = cur.fetchone()
             total_orders = row[0] if row else 0
             return jsonify({'success': True, 'total_orders': total_orders})
@@ -10849,50 +10956,16 @@ LEFT JOIN categories c ON p.category_id = c.id
     def api_monthly_comparison():
         """Get last 30 days vs previous 30 days comparison data"""
         from datetime import datetime, timedelta
-        conn = mysql.connection
-        cur = conn.cursor()
         try:
-            now = datetime.now()
+            today = datetime.now().date()
             
-            # Last 30 days date range
-            last_30_end = now.strftime('%Y-%m-%d')
-            last_30_start = (now - timedelta(days=30)).strftime('%Y-%m-%d')
-            
-            # Previous 30 days date range (30-60 days ago)
-            prev_30_end = (now - timedelta(days=30)).strftime('%Y-%m-%d')
-            prev_30_start = (now - timedelta(days=60)).strftime('%Y-%m-%d')
-            
-            # Get last 30 days data
-            cur.execute("""
-                SELECT 
-                    COALESCE(SUM(o.total_amount), 0) as total_revenue,
-                    COALESCE(SUM(oi.quantity * (oi.price - p.original_price)), 0) as total_profit
-                FROM orders o
-                JOIN order_items oi ON o.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                WHERE DATE(o.order_date) >= %s AND DATE(o.order_date) <= %s 
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
-            """, (last_30_start, last_30_end))
-            
-            last_30_row = cur.fetchone()
-            last_30_revenue = float(last_30_row[0]) if last_30_row[0] else 0.0
-            last_30_profit = float(last_30_row[1]) if last_30_row[1] else 0.0
-            
-            # Get previous 30 days data (30-60 days ago)
-            cur.execute("""
-                SELECT 
-                    COALESCE(SUM(o.total_amount), 0) as total_revenue,
-                    COALESCE(SUM(oi.quantity * (oi.price - p.original_price)), 0) as total_profit
-                FROM orders o
-                JOIN order_items oi ON o.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                WHERE DATE(o.order_date) >= %s AND DATE(o.order_date) <= %s 
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
-            """, (prev_30_start, prev_30_end))
-            
-            prev_30_row = cur.fetchone()
-            prev_30_revenue = float(prev_30_row[0]) if prev_30_row[0] else 0.0
-            prev_30_profit = float(prev_30_row[1]) if prev_30_row[1] else 0.0
+            # Last 30 days, then the 30 days before that
+            last_30 = SalesRollup.get_totals(today - timedelta(days=30), today)
+            prev_30 = SalesRollup.get_totals(today - timedelta(days=60), today - timedelta(days=31))
+            last_30_revenue = last_30['order_total']
+            last_30_profit = last_30['profit']
+            prev_30_revenue = prev_30['order_total']
+            prev_30_profit = prev_30['profit']
             
             # Calculate percentage changes
             revenue_change = 0
@@ -10927,8 +11000,6 @@ LEFT JOIN categories c ON p.category_id = c.id
         except Exception as e:
             app.logger.error(f"Error fetching monthly comparison: {e}")
             return jsonify({'success': False, 'message': str(e)})
-        finally:
-            cur.close()
 
     @app.route('/api/orders/today_details')
     def api_orders_today_details():
@@ -10939,14 +11010,14 @@ LEFT JOIN categories c ON p.category_id = c.id
         conn = mysql.connection
         cur = conn.cursor()
         try:
-            today_str = datetime.now().strftime('%Y-%m-%d')
-            cur.execute("""
+            hour_sql, hour_params = qp.in_hour('o.order_date', datetime.now(), hour)
+            cur.execute(f"""
                 SELECT o.id as order_id, o.order_date, c.first_name, c.last_name, o.total_amount, o.status, o.payment_method
                 FROM orders o
                 JOIN customers c ON o.customer_id = c.id
-                WHERE DATE(o.order_date) = %s AND HOUR(o.order_date) = %s AND LOWER(o.status) = 'completed'
+                WHERE o.status = 'COMPLETED' AND {hour_sql}
                 ORDER BY o.order_date ASC
-            """, (today_str, hour))
+            """, hour_params)
             rows = cur.fetchall()
             orders = []
             for row in rows:
@@ -11142,6 +11213,22 @@ LEFT JOIN categories c ON p.category_id = c.id
             app.logger.error(f"Error fetching comprehensive order details: {str(e)}")
             return jsonify({'success': False, 'error': str(e)}), 500
 
+    @app.route('/qr/<key>.png')
+    def qr_image(key):
+        """Cached QR PNG for a key from qr_images.url(); content-addressed, so cached forever"""
+        etag = f'"{key}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = make_response('', 304)
+        else:
+            image = qr_images.png_by_key(key)
+            if image is None:
+                return jsonify({'success': False, 'error': 'QR image not found'}), 404
+            response = make_response(image)
+            response.headers['Content-Type'] = 'image/png'
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+        return response
+
     # KHQR Payment Endpoints
     @app.route('/api/khqr/create-payment', methods=['POST'])
     def create_khqr_payment():
@@ -11483,72 +11570,21 @@ LEFT JOIN categories c ON p.category_id = c.id
             file_extension = file.filename.rsplit('.', 1)[1].lower()
             unique_filename = f"order_{order_id}_{uuid.uuid4().hex[:8]}.{file_extension}"
             
-            # Save file temporarily for fraud detection
+            # Save and record the file here; only OCR and fraud scoring run on the job queue
             file_path = os.path.join(upload_dir, unique_filename)
             file.save(file_path)
-            
-            # Run fraud detection
-            verification_result = screenshot_detector.comprehensive_verification(
-                file_path, 
-                order_id, 
-                float(order['total_amount'])
-            )
-            
-            # If fraud detected, delete file and return error
-            if verification_result['is_fraud']:
-                os.remove(file_path)  # Delete the suspicious file
-                cur.close()
-                conn.close()
-                
-                app.logger.warning(f"🚨 Fraud detected in screenshot for order {order_id}: {verification_result['fraud_reasons']}")
-                
-                return jsonify({
-                    'success': False, 
-                    'error': 'Screenshot verification failed',
-                    'fraud_reasons': verification_result['fraud_reasons'],
-                    'confidence_score': verification_result['confidence_score'],
-                    'verification_details': verification_result['verification_details']
-                }), 400
-            
-            # If verification passed, proceed with normal processing
-            relative_path = f"uploads/payment_screenshots/{unique_filename}"
-            
-            # Store image hash for future duplicate detection
-            image_hash = hashlib.md5(open(file_path, 'rb').read()).hexdigest()
-            
-            # Update order with screenshot path and verification status
-            cur.execute("""
-                UPDATE orders 
-                SET payment_screenshot_path = %s, 
-                    screenshot_uploaded_at = CURRENT_TIMESTAMP,
-                    payment_verification_status = 'verified'
-                WHERE id = %s
-            """, (relative_path, order_id))
-            
-            # Store screenshot metadata for fraud detection
-            cur.execute("""
-                INSERT INTO order_screenshots (order_id, image_hash, file_path, uploaded_at, verification_score)
-                VALUES (%s, %s, %s, CURRENT_TIMESTAMP, %s)
-                ON DUPLICATE KEY UPDATE
-                image_hash = VALUES(image_hash),
-                file_path = VALUES(file_path),
-                uploaded_at = VALUES(uploaded_at),
-                verification_score = VALUES(verification_score)
-            """, (order_id, image_hash, relative_path, verification_result['confidence_score']))
-            
-            conn.commit()
             cur.close()
             conn.close()
-            
-            app.logger.info(f"✅ Payment screenshot uploaded and verified for order {order_id}: {unique_filename} (confidence: {verification_result['confidence_score']:.2f})")
-            
-            return jsonify({
-                'success': True, 
-                'message': 'Screenshot uploaded and verified successfully',
-                'file_path': relative_path,
-                'verification_score': verification_result['confidence_score'],
-                'verification_details': verification_result['verification_details']
-            })
+
+            relative_path = f"uploads/payment_screenshots/{unique_filename}"
+            screenshot_id = screenshot_detector.record_upload(file_path, relative_path, order_id)
+            job_id = job_queue.enqueue('screenshot_verification',
+                                       args=(file_path, relative_path, order_id, float(order['total_amount']), screenshot_id),
+                                       owner=session.get('user_id'))
+
+            app.logger.info(f"📥 Payment screenshot uploaded for order {order_id}: {unique_filename}, verification job {job_id}")
+
+            return job_accepted(job_id)
             
         except Exception as e:
             app.logger.error(f"Error uploading screenshot for order {order_id}: {str(e)}")
@@ -11803,6 +11839,7 @@ LEFT JOIN categories c ON p.category_id = c.id
             # Update order status to confirmed/approved
             cur.execute("UPDATE orders SET status = 'CONFIRMED', approval_status = 'Approved' WHERE id = %s", (order_id,))
             conn.commit()
+            SalesRollup.record_orders([order_id])
             
             app.logger.info(f"Order {order_id} approved by staff: {session['username']}")
             
@@ -11859,6 +11896,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 WHERE id = %s
             """, (order_id,))
             conn.commit()
+            SalesRollup.record_orders([order_id])
             
             app.logger.info(f"Order {order_id} changed back to pending by {session['username']} (role: {user_role})")
             
@@ -11916,6 +11954,7 @@ LEFT JOIN categories c ON p.category_id = c.id
                 WHERE id = %s
             """, (session.get('user_id', 1), reason, order_id))
             conn.commit()
+            SalesRollup.record_orders([order_id])
             
             app.logger.info(f"Order {order_id} rejected after approval by {session['username']} (role: {user_role}), Reason: {reason}")
             
@@ -12048,6 +12087,8 @@ LEFT JOIN categories c ON p.category_id = c.id
                         """, (order_id,))
                         
                         conn.commit()
+                        SalesRollup.record_orders([order_id])
+                        payment_events.publish_order(order_id, 'completed')
                         
                         app.logger.info(f"✅ Order {order_id} automatically completed from screenshot detection!")
 
@@ -12085,7 +12126,7 @@ if __name__ == '__main__':
     
     # Start automatic payment verifier for instant payment detection
     from utils.automatic_payment_verifier import initialize_payment_verifier
-    payment_verifier = initialize_payment_verifier(app, check_interval=5, test_mode=False)
+    payment_verifier = initialize_payment_verifier(app, test_mode=False)
     payment_verifier.start()
     
     port = int(os.environ.get('PORT', 5000))
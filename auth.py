@@ -3,6 +3,7 @@ from werkzeug.security import check_password_hash
 from models import User, Product, Order, Report, get_db, Supplier, db, Role
 from functools import wraps
 import random
+from utils import query_predicates as qp
 
 auth_bp = Blueprint('auth', __name__, template_folder='templates')
 
@@ -242,7 +243,7 @@ def login():
                             
                             otp_code = OTPManager.generate_otp()
                             OTPManager.store_otp(customer['id'], customer['email'], otp_code)
-                            EmailManager.send_otp_email(customer['email'], f"{customer['first_name']} {customer['last_name']}", otp_code)
+                            EmailManager.queue_otp_email(customer['email'], f"{customer['first_name']} {customer['last_name']}", otp_code)
                             
                             flash('OTP code sent to your email. Please check your inbox.', 'success')
                         except Exception as e:
@@ -363,9 +364,9 @@ def register():
             OTPManager.store_registration_otp(email, otp_code, expiry_minutes=15)  # 15 minutes for registration
             print("DEBUG: OTP stored successfully")
             
-            print("DEBUG: Sending registration email...")
-            EmailManager.send_registration_otp_email(email, f"{first_name} {last_name}", otp_code)
-            print("DEBUG: Registration email sent")
+            print("DEBUG: Queuing registration email...")
+            EmailManager.queue_registration_otp_email(email, f"{first_name} {last_name}", otp_code)
+            print("DEBUG: Registration email queued")
             
             # Store customer info in session for OTP verification (NOT in database yet)
             print("DEBUG: Storing session data...")
@@ -665,8 +666,9 @@ def get_customer_orders(customer_id):
             """
             params = [customer_id]
             if status:
-                query += " AND LOWER(o.status) = LOWER(%s)"
-                params.append(status)
+                status_sql, status_params = qp.status_in('o.status', status)
+                query += f" AND {status_sql}"
+                params.extend(status_params)
             cur.execute(query, tuple(params))
             orders = cur.fetchall()
             current_app.logger.info(f"Fetched orders for customer {customer_id} with status {status}: {orders}")
@@ -736,14 +738,16 @@ def get_all_orders_status(customer_id):
 def today_order_count():
     try:
         cur = current_app.mysql.connection.cursor(dictionary=True)
-        cur.execute("""
+        today_sql, today_params = qp.today('order_date')
+        sale_sql, sale_params = qp.completed_or_approved(None)
+        cur.execute(f"""
             SELECT HOUR(order_date) as hour, COUNT(*) as order_count
             FROM orders
-            WHERE DATE(order_date) = CURDATE() 
-            AND (LOWER(status) = 'completed' OR approval_status = 'Approved')
+            WHERE {today_sql}
+            AND {sale_sql}
             GROUP BY HOUR(order_date)
             ORDER BY HOUR(order_date)
-        """)
+        """, (*today_params, *sale_params))
         data = cur.fetchall()
         cur.close()
         return jsonify({'success': True, 'data': data})
@@ -797,8 +801,8 @@ def customer_forgot_password():
             
             # Send OTP email
             try:
-                from utils.email_utils import send_otp_email
-                send_otp_email(
+                from utils.email_utils import queue_otp_email
+                queue_otp_email(
                     customer['email'],
                     customer['first_name'],
                     otp_code,
@@ -877,11 +881,11 @@ def resend_password_reset_otp():
         OTPManager.store_password_reset_otp(customer_id, otp_code, expiry_minutes=15)
         
         # Send new OTP email
-        from utils.email_utils import send_otp_email
+        from utils.email_utils import queue_otp_email
         customer_email = session['password_reset_customer_email']
         customer_name = session['password_reset_customer_name']
         
-        send_otp_email(
+        queue_otp_email(
             customer_email,
             customer_name,
             otp_code,
@@ -1167,7 +1171,7 @@ def resend_otp():
         OTPManager.store_otp(customer_id, customer_email, otp_code)
         
         # Send OTP via email
-        EmailManager.send_otp_email(customer_email, customer_name, otp_code)
+        EmailManager.queue_otp_email(customer_email, customer_name, otp_code)
         
         return jsonify({'success': True, 'message': 'OTP sent successfully'})
         
@@ -1193,7 +1197,7 @@ def resend_registration_otp():
         OTPManager.store_registration_otp(customer_email, otp_code, expiry_minutes=15)
         
         # Send OTP via email
-        EmailManager.send_registration_otp_email(customer_email, customer_name, otp_code)
+        EmailManager.queue_registration_otp_email(customer_email, customer_name, otp_code)
         
         return jsonify({'success': True, 'message': 'Registration OTP sent successfully'})
         
@@ -1342,23 +1346,22 @@ def monthly_sales_detail():
         cur = conn.cursor(dictionary=True)
         try:
             # Build query to fetch order and order items details
-            query = """
+            range_sql, params = qp.between_days('o.order_date', start_date_obj, end_date_obj)
+            query = f"""
                 SELECT o.id as order_id, o.order_date, c.first_name, c.last_name, o.customer_id,
                        oi.product_id, p.name as product_name, oi.quantity, oi.price
                 FROM orders o
                 JOIN customers c ON o.customer_id = c.id
                 JOIN order_items oi ON o.id = oi.order_id
                 JOIN products p ON oi.product_id = p.id
-                WHERE o.order_date BETWEEN %s AND %s
+                WHERE {range_sql}
             """
-            params = [start_date, end_date]
 
             # Add status filter if provided (support multiple statuses)
             if status:
-                statuses = [s.strip().lower() for s in status.split(',')]
-                placeholders = ','.join(['%s'] * len(statuses))
-                query += f" AND LOWER(o.status) IN ({placeholders})"
-                params.extend(statuses)
+                status_sql, status_params = qp.status_in('o.status', *status.split(','))
+                query += f" AND {status_sql}"
+                params.extend(status_params)
 
             current_app.logger.info(f"Executing query with params: {params}")
             cur.execute(query, tuple(params))
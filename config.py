@@ -41,15 +41,74 @@ class Config:
     SQLALCHEMY_POOL_RECYCLE = int(os.getenv('SQLALCHEMY_POOL_RECYCLE', '3600'))
     SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', '20'))
     SQLALCHEMY_POOL_PRE_PING = True  # Verify connections before using them
+
+    # Catalog read cache (featured products, categories, colors, warranties, brands)
+    CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', 'true').lower() != 'false'
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))
+    CATALOG_CACHE_MAX_ENTRIES = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', '256'))
+    CATALOG_CACHE_STORE = os.getenv('CATALOG_CACHE_STORE', '')  # SQLite file shared by workers; empty = per worker
+
+    # Staff dashboard KPI snapshot (seconds a computed snapshot is served before recomputing)
+    KPI_SNAPSHOT_TTL = int(os.getenv('KPI_SNAPSHOT_TTL', '15'))
+
+    # Staff listings: seconds a listing total and its page bookmarks are reused
+    LISTING_COUNT_TTL = int(os.getenv('LISTING_COUNT_TTL', '60'))
+
+    # Background job queue (PDFs, screenshot OCR, QR images) - per gunicorn worker
+    JOB_QUEUE_WORKERS = int(os.getenv('JOB_QUEUE_WORKERS', '2'))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', '2'))  # seconds, doubled per retry
+    JOB_RETENTION = int(os.getenv('JOB_RETENTION', '3600'))  # seconds finished jobs and files are kept
+
+    # QR image cache: rendered PNGs kept in memory (LRU) and in a directory shared by workers
+    QR_IMAGE_CACHE_SIZE = int(os.getenv('QR_IMAGE_CACHE_SIZE', '512'))
+    QR_IMAGE_STORE = os.getenv('QR_IMAGE_STORE')  # unset = temp directory, empty = memory only
+
+    # Product photo derivatives (WebP + JPEG) served to grids and thumbnails via srcset
+    PRODUCT_IMAGE_WIDTHS = [int(w) for w in os.getenv('PRODUCT_IMAGE_WIDTHS', '160,320,480,800').split(',')]
+    PRODUCT_IMAGE_QUALITY = int(os.getenv('PRODUCT_IMAGE_QUALITY', '80'))
     
+    # Payment status long-polling (utils/payment_events.py)
+    PAYMENT_EVENTS_WAIT = int(os.getenv('PAYMENT_EVENTS_WAIT', '25'))  # seconds a status request may block
+    PAYMENT_EVENTS_MAX_WAITERS = int(os.getenv('PAYMENT_EVENTS_MAX_WAITERS', '1'))  # blocking requests per worker
+    PAYMENT_EVENTS_BUSY_RETRY = float(os.getenv('PAYMENT_EVENTS_BUSY_RETRY', '5'))  # retry hint when all are busy
+
+    # Customer notification feed: ETag/304 list reads and change waiting (utils/notification_feed.py)
+    NOTIFICATION_FEED_WAIT = int(os.getenv('NOTIFICATION_FEED_WAIT', '25'))  # seconds an events request may block
+    NOTIFICATION_FEED_MAX_WAITERS = int(os.getenv('NOTIFICATION_FEED_MAX_WAITERS', '0'))  # per worker; 0 = never block
+    NOTIFICATION_FEED_POLL = float(os.getenv('NOTIFICATION_FEED_POLL', '30'))  # seconds between non-blocking checks
+    NOTIFICATION_SSE = os.getenv('NOTIFICATION_SSE', 'false').lower() == 'true'  # offer an EventSource stream
+    NOTIFICATION_SSE_DURATION = int(os.getenv('NOTIFICATION_SSE_DURATION', '300'))  # seconds before a stream reconnects
+
+    # Background KHQR payment verifier (utils/automatic_payment_verifier.py); one leader per database
+    PAYMENT_VERIFIER_ENABLED = os.getenv('PAYMENT_VERIFIER_ENABLED', 'false').lower() == 'true'
+    PAYMENT_VERIFIER_INTERVAL = int(os.getenv('PAYMENT_VERIFIER_INTERVAL', '5'))  # seconds between cycles
+    PAYMENT_VERIFIER_WORKERS = int(os.getenv('PAYMENT_VERIFIER_WORKERS', '4'))  # concurrent bank checks
+    PAYMENT_VERIFIER_MAX_BACKOFF = float(os.getenv('PAYMENT_VERIFIER_MAX_BACKOFF', '300'))  # seconds, for old orders
+    PAYMENT_VERIFIER_ELECTION_INTERVAL = float(os.getenv('PAYMENT_VERIFIER_ELECTION_INTERVAL', '15'))  # standby retry
+
+    # Static files: fingerprinted css/js/icons URLs with immutable caching (utils/static_assets.py)
+    STATIC_FINGERPRINT = os.getenv('STATIC_FINGERPRINT', 'true').lower() != 'false'
+    STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '3600'))  # seconds, for unfingerprinted files
+    STATIC_SENDFILE = os.getenv('STATIC_SENDFILE', '')  # 'x-accel' (nginx), 'x-sendfile' or empty
+    STATIC_ACCEL_PREFIX = os.getenv('STATIC_ACCEL_PREFIX', '/_static/')  # nginx internal location
+
     # File upload configuration
     UPLOAD_FOLDER = 'static/uploads/products'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
     # Email configuration for OTP
-    SMTP_SERVER = 'smtp.gmail.com'
-    SMTP_PORT = 587
+    SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+    SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
     SMTP_USERNAME = 'lyhenghab3@gmail.com'  # Replace with your Gmail
     SMTP_PASSWORD = 'dxhn mirg iaco vkta'     # Replace with your app password
+    SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() != 'false'  # false for utils/debug_smtp.py
+    # Pooled SMTP connections (per gunicorn worker) and the batching outbox
+    SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '2'))
+    SMTP_IDLE_TIMEOUT = int(os.getenv('SMTP_IDLE_TIMEOUT', '60'))  # seconds before an idle connection is replaced
+    SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+    SMTP_BATCH_SIZE = int(os.getenv('SMTP_BATCH_SIZE', '20'))
+    SMTP_MAX_ATTEMPTS = int(os.getenv('SMTP_MAX_ATTEMPTS', '4'))
+    SMTP_RETRY_DELAY = float(os.getenv('SMTP_RETRY_DELAY', '5'))  # seconds, doubled per retry
 
@@ -92,6 +92,7 @@ def main():
     print("2. Set up your database")
     print("3. Deploy to your chosen platform")
     print("4. Run database migrations if needed")
+    print("5. Backfill the sales report rollup: python scripts/rebuild_sales_rollup.py")
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,28 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash
-from flask import current_app
+from flask import current_app, has_request_context
 import mysql.connector
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import re
+import time
+import logging
 
 db = SQLAlchemy()
 
 # Database configuration from config.py
 from config import Config
+from utils.db_pool import get_pool, get_pool_stats
+from utils.db_context import get_request_connection, begin_transaction, atomic
+from utils.schema_registry import schema_registry
+from utils.catalog_cache import catalog_cache
+from utils.product_search import product_search, id_filter
+from utils import query_predicates as qp
+from utils.keyset import keyset_pager, seek_predicate
+from utils.product_images import product_images
+from utils.job_queue import job_queue
+from utils.notification_feed import notification_feed
+
+rollup_logger = logging.getLogger('models.sales_rollup')
 
 def create_cursor(conn):
     """Create a cursor with dictionary support if available, fallback to regular cursor"""
@@ -18,25 +32,23 @@ def create_cursor(conn):
         return conn.cursor()
 
 def get_db():
+    """
+    Inside a request, return the request-scoped connection (released on teardown).
+    Outside a request (background threads, scripts), check a connection out of the pool;
+    conn.close() returns it.
+    """
     try:
-        conn = mysql.connector.connect(
-            user=Config.MYSQL_USER,
-            password=Config.MYSQL_PASSWORD,
-            host=Config.MYSQL_HOST,
-            port=Config.MYSQL_PORT,
-            database=Config.MYSQL_DB,
-            use_pure=True,
-            autocommit=True,
-            connect_timeout=60,
-            auth_plugin='mysql_native_password'
-        )
-        current_app.logger.info("Database connection established successfully.")
-        return conn
-            
+        if has_request_context():
+            return get_request_connection()
+        return get_pool().get_connection()
     except Exception as e:
         current_app.logger.error(f"Failed to connect to database: {e}")
         raise
 
+def get_db_pool_stats():
+    """Pool hit/miss/wait counters for this worker process"""
+    return get_pool_stats()
+
 def generate_slug(text):
     """Generate a URL-friendly slug from text"""
     if not text:
@@ -74,14 +86,8 @@ class Product:
             if not include_deleted:
                 # Only add deleted condition if the column exists
                 # This handles cases where soft delete migration hasn't been run
-                try:
-                    # Check if deleted column exists
-                    cur.execute("SHOW COLUMNS FROM products LIKE 'deleted'")
-                    if cur.fetchone():
-                        conditions.append("(p.deleted = FALSE OR p.deleted IS NULL)")
-                except:
-                    # If there's any error checking, just skip the deleted filter
-                    pass
+                if schema_registry.has_column('products', 'deleted'):
+                    conditions.append("(p.deleted = FALSE OR p.deleted IS NULL)")
             
             if conditions:
                 query += " WHERE " + " AND ".join(conditions)
@@ -120,6 +126,53 @@ class Product:
             cur.close()
             conn.close()
 
+    @staticmethod
+    def get_many(product_ids, include_details=True):
+        """
+        Fetch several products in one round-trip.
+        Returns a dict keyed by integer product id; ids that don't exist are simply absent.
+        include_details=False skips the color/category/warranty joins (stock/price checks).
+        """
+        ids = []
+        for product_id in product_ids or []:
+            try:
+                product_id = int(product_id)
+            except (TypeError, ValueError):
+                continue
+            if product_id not in ids:
+                ids.append(product_id)
+        if not ids:
+            return {}
+
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            placeholders = ','.join(['%s'] * len(ids))
+            if include_details:
+                query = f"""
+                    SELECT p.*, p.stock as stock_quantity, cpu, ram, storage, graphics, display, os, keyboard, battery, weight, p.warranty_id, p.original_price,
+                           p.allow_preorder, p.expected_restock_date, p.preorder_limit,
+                           c.name as color, cat.name as category_name, w.warranty_name,
+                           p.photo, p.left_rear_view, p.back_view
+                    FROM products p
+                    LEFT JOIN colors c ON p.color_id = c.id
+                    LEFT JOIN categories cat ON p.category_id = cat.id
+                    LEFT JOIN warranty w ON p.warranty_id = w.warranty_id
+                    WHERE p.id IN ({placeholders})
+                """
+            else:
+                query = f"""
+                    SELECT p.id, p.name, p.price, p.photo, p.stock, p.stock as stock_quantity,
+                           p.category_id, p.original_price
+                    FROM products p
+                    WHERE p.id IN ({placeholders})
+                """
+            cur.execute(query, tuple(ids))
+            return {row['id']: row for row in cur.fetchall()}
+        finally:
+            cur.close()
+            conn.close()
+
     @staticmethod
     def get_by_slug(slug):
         """Get product by URL slug generated from product name"""
@@ -299,6 +352,7 @@ class Product:
  
 
     @staticmethod
+    @catalog_cache.cached('product.featured')
     def get_featured(limit=8, include_archived=False):
         conn = get_db()
         cur = conn.cursor(dictionary=True)
@@ -339,39 +393,52 @@ class Product:
     @staticmethod
     def reduce_stock(product_id, quantity):
         """Reduce product stock by specified quantity when order is placed."""
-        conn = get_db()
-        cur = conn.cursor()
-        try:
-            # First check current stock
-            cur.execute("SELECT stock FROM products WHERE id = %s", (product_id,))
-            result = cur.fetchone()
-            if not result:
-                raise ValueError(f"Product with ID {product_id} not found")
+        Product.reduce_stock_bulk({product_id: quantity})
 
-            current_stock = result[0]
-            if current_stock < quantity:
-                raise ValueError(f"Insufficient stock for product {product_id}. Available: {current_stock}, Requested: {quantity}")
-
-            # Reduce stock
-            cur.execute(
-                "UPDATE products SET stock = stock - %s WHERE id = %s",
-                (quantity, product_id)
-            )
-            conn.commit()
+    @staticmethod
+    def reduce_stock_bulk(quantities):
+        """
+        Reduce stock for many products at once ({product_id: quantity}).
+        One conditional UPDATE (`stock >= n`, rowcount checked) and the inventory log rows
+        are written in a single transaction, so concurrent buyers cannot oversell and a
+        failed reservation leaves nothing behind. Inside a caller's transaction only this
+        call's changes are undone (savepoint); the caller's work is left alone.
+        """
+        quantities = {int(product_id): int(quantity) for product_id, quantity in quantities.items()}
+        for product_id, quantity in quantities.items():
+            if quantity <= 0:
+                raise ValueError(f"Invalid quantity {quantity} for product {product_id}")
+        if not quantities:
+            return
 
-            # Log the stock change in inventory table for tracking
-            cur.execute(
-                "INSERT INTO inventory (product_id, changes) VALUES (%s, %s)",
-                (product_id, -quantity)
-            )
-            conn.commit()
+        conn = get_db()
+        try:
+            try:
+                with atomic(conn, 'reduce_stock'):
+                    OrderPlacement.decrement_stock(conn, quantities)
+            except ValueError:
+                # The partial decrement is already undone, so current stock explains the shortfall
+                Product._raise_stock_shortfall(conn, quantities)
+                raise
+        finally:
+            conn.close()
 
-        except Exception as e:
-            conn.rollback()
-            raise e
+    @staticmethod
+    def _raise_stock_shortfall(conn, quantities):
+        """Explain why a conditional decrement matched fewer rows than requested"""
+        ids = sorted(quantities)
+        cur = conn.cursor()
+        try:
+            placeholders = ','.join(['%s'] * len(ids))
+            cur.execute(f"SELECT id, stock FROM products WHERE id IN ({placeholders})", tuple(ids))
+            stock = {row[0]: row[1] for row in cur.fetchall()}
         finally:
             cur.close()
-            conn.close()
+        for product_id in ids:
+            if product_id not in stock:
+                raise ValueError(f"Product with ID {product_id} not found")
+            if stock[product_id] < quantities[product_id]:
+                raise ValueError(f"Insufficient stock for product {product_id}. Available: {stock[product_id]}, Requested: {quantities[product_id]}")
 
     @staticmethod
     def create(name, description, price, stock, category_id=None, photo=None, warranty_id=None, cpu=None, ram=None, storage=None, graphics=None, display=None, os=None, keyboard=None, battery=None, weight=None, color_id=None, left_rear_view=None, back_view=None, original_price=None):
@@ -386,6 +453,8 @@ class Product:
                 (name, description, price, stock, category_id, photo, warranty_id, cpu, ram, storage, graphics, display, os, keyboard, battery, weight, color_id, left_rear_view, back_view, original_price)
             )
             conn.commit()
+            catalog_cache.invalidate('product created')
+            product_images.queue(photo, left_rear_view, back_view)
             product_id = cur.lastrowid
             return product_id
         except Exception as e:
@@ -482,6 +551,7 @@ class Product:
                 raise ValueError("Product not found or already deleted")
 
             conn.commit()
+            catalog_cache.invalidate('product deleted')
 
             current_app.logger.info(f"Product {product_id} archived successfully along with {deleted_inventory} inventory records")
             return True
@@ -594,6 +664,7 @@ class Product:
                 raise ValueError("Product not found or already deleted")
             
             conn.commit()
+            catalog_cache.invalidate('product deleted')
             current_app.logger.info(f"Product {product_id} ({product_name}) deleted successfully using denormalization approach")
             return True
             
@@ -615,8 +686,7 @@ class Product:
         cur = conn.cursor()
         try:
             # Check if soft delete columns exist first
-            cur.execute("SHOW COLUMNS FROM products LIKE 'deleted'")
-            if not cur.fetchone():
+            if not schema_registry.has_column('products', 'deleted'):
                 raise ValueError("Soft delete functionality not available. Please run the soft delete migration script first.")
             
             # Check if product exists and is not already deleted
@@ -640,6 +710,7 @@ class Product:
                 raise ValueError("Failed to mark product as deleted")
             
             conn.commit()
+            catalog_cache.invalidate('product soft deleted')
             current_app.logger.info(f"Product {product_id} ({product_name}) soft deleted successfully")
             return True
             
@@ -660,8 +731,7 @@ class Product:
         cur = conn.cursor()
         try:
             # Check if soft delete columns exist first
-            cur.execute("SHOW COLUMNS FROM products LIKE 'deleted'")
-            if not cur.fetchone():
+            if not schema_registry.has_column('products', 'deleted'):
                 raise ValueError("Soft delete functionality not available. Please run the soft delete migration script first.")
             
             # Check if product exists and is soft deleted
@@ -685,6 +755,7 @@ class Product:
                 raise ValueError("Failed to restore product")
             
             conn.commit()
+            catalog_cache.invalidate('product restored')
             current_app.logger.info(f"Product {product_id} ({product_name}) restored successfully")
             return True
             
@@ -753,6 +824,8 @@ class Product:
                 values
             )
             conn.commit()
+            catalog_cache.invalidate('product updated')
+            product_images.queue(photo, left_rear_view, back_view)
             return cur.rowcount > 0
         except Exception as e:
             conn.rollback()
@@ -762,23 +835,33 @@ class Product:
             conn.close()
 
     @staticmethod
-    def search(query):
+    def search(query, limit=None):
+        """Ranked search over name, description and specs (best match first)"""
+        if query and not str(query).isascii():
+            # Other scripts: MySQL's collation compares them better than the tokenizer
+            ids = Product._ids_with_name_like(query, limit)
+        else:
+            ids = product_search.search(query, limit=limit)
+        products = Product.get_many(ids)
+        return [products[product_id] for product_id in ids if product_id in products]
+
+    @staticmethod
+    def _ids_with_name_like(query, limit=None):
+        """Ids of unarchived products whose name contains query (`LIKE '%q%'`), newest first"""
         conn = get_db()
-        cur = conn.cursor(dictionary=True)
+        cur = conn.cursor()
         try:
-            like_query = f"%{query}%"
-            cur.execute("""
-                SELECT p.*, p.stock as stock_quantity, cpu, ram, storage, display, os, keyboard, battery, weight, p.warranty_id, color_id,
-                       c.name as color, cat.name as category_name, w.warranty_name
-                FROM products p
-                LEFT JOIN colors c ON p.color_id = c.id
-                LEFT JOIN categories cat ON p.category_id = cat.id
-                LEFT JOIN warranty w ON p.warranty_id = w.warranty_id
-                WHERE p.name LIKE %s AND (p.archived IS NULL OR p.archived = FALSE)
-                ORDER BY p.id DESC
-            """, (like_query,))
-            results = cur.fetchall()
-            return results
+            sql = """
+                SELECT id FROM products
+                WHERE name LIKE %s AND (archived IS NULL OR archived = FALSE)
+                ORDER BY id DESC
+            """
+            params = [f"%{query}%"]
+            if limit:
+                sql += " LIMIT %s"
+                params.append(int(limit))
+            cur.execute(sql, params)
+            return [row[0] for row in cur.fetchall()]
         finally:
             cur.close()
             conn.close()
@@ -796,6 +879,7 @@ class Product:
             conn.close()
         
     @staticmethod
+    @catalog_cache.cached('product.brands')
     def get_distinct_brands():
         conn = get_db()
         cur = conn.cursor(dictionary=True)
@@ -817,25 +901,9 @@ class Product:
 
     @staticmethod
     def get_by_brand(brand):
-        conn = get_db()
-        cur = conn.cursor(dictionary=True)
-        try:
-            like_query = f"{brand}%"
-            cur.execute("""
-                SELECT p.*, p.stock as stock_quantity, cpu, ram, storage, graphics, display, os, keyboard, battery, weight, p.warranty_id, p.original_price,
-                       c.name as color, cat.name as category_name, w.warranty_name
-                FROM products p
-                LEFT JOIN colors c ON p.color_id = c.id
-                LEFT JOIN categories cat ON p.category_id = cat.id
-                LEFT JOIN warranty w ON p.warranty_id = w.warranty_id
-                WHERE p.name LIKE %s AND (p.archived IS NULL OR p.archived = FALSE)
-                ORDER BY p.id DESC
-            """, (like_query,))
-            products = cur.fetchall()
-            return products
-        finally:
-            cur.close()
-            conn.close()
+        ids = product_search.brand_ids(brand)
+        products = Product.get_many(ids)
+        return [products[product_id] for product_id in ids if product_id in products]
 
     @staticmethod
     def get_by_brand_with_price_range(brand, min_price=None, max_price=None, sort_by=None, category_filter=None):
@@ -843,9 +911,8 @@ class Product:
         conn = get_db()
         cur = conn.cursor(dictionary=True)
         try:
-            like_query = f"{brand}%"
-            where_conditions = ["p.name LIKE %s", "(p.archived IS NULL OR p.archived = FALSE)"]
-            params = [like_query]
+            brand_condition, params = id_filter("p.id", product_search.brand_ids(brand))
+            where_conditions = [brand_condition, "(p.archived IS NULL OR p.archived = FALSE)"]
             
             if min_price is not None:
                 where_conditions.append("p.price >= %s")
@@ -966,6 +1033,127 @@ class Product:
             cur.close()
             conn.close()
 
+class OrderPlacement:
+    """
+    Set-based order placement shared by Order.create and the cart checkout.
+
+    All product rows of an order are locked with one SELECT ... FOR UPDATE (in id order,
+    so concurrent checkouts cannot deadlock), validated together, and written back with a
+    single conditional UPDATE plus executemany inserts. Round-trips stay constant however
+    many lines the order has, and the `stock >= n` guard makes overselling impossible.
+    Call these inside a transaction (see atomic / begin_transaction).
+    """
+
+    ORDER_ITEM_COLUMNS = ('order_id', 'product_id', 'quantity', 'price', 'original_price',
+                          'discount_percentage', 'discount_amount', 'product_name',
+                          'product_description', 'product_category')
+
+    @staticmethod
+    def aggregate_quantities(lines):
+        """Sum quantities per product id: {product_id: quantity}"""
+        quantities = {}
+        for line in lines:
+            product_id = int(line['product_id'])
+            quantity = int(line['quantity'])
+            if quantity <= 0:
+                raise ValueError(f"Invalid quantity {quantity} for product {product_id}")
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return quantities
+
+    @staticmethod
+    def lock_products(conn, product_ids):
+        """Lock the product rows for the rest of the transaction; returns {id: product}"""
+        ids = sorted({int(product_id) for product_id in product_ids})
+        if not ids:
+            return {}
+
+        cur = conn.cursor(dictionary=True)
+        try:
+            placeholders = ','.join(['%s'] * len(ids))
+            discount_column = ", p.discount_percentage" if schema_registry.has_column('products', 'discount_percentage') else ""
+            cur.execute(f"""
+                SELECT p.id, p.name, p.description, p.price, p.original_price, p.stock, p.category_id{discount_column}
+                FROM products p
+                WHERE p.id IN ({placeholders})
+                ORDER BY p.id
+                FOR UPDATE
+            """, tuple(ids))
+            products = {row['id']: row for row in cur.fetchall()}
+
+            # Category names are read without locking so checkouts don't serialize per category
+            category_ids = sorted({p['category_id'] for p in products.values() if p['category_id'] is not None})
+            category_names = {}
+            if category_ids:
+                placeholders = ','.join(['%s'] * len(category_ids))
+                cur.execute(f"SELECT id, name FROM categories WHERE id IN ({placeholders})", tuple(category_ids))
+                category_names = {row['id']: row['name'] for row in cur.fetchall()}
+            for product in products.values():
+                product['category_name'] = category_names.get(product['category_id'])
+            return products
+        finally:
+            cur.close()
+
+    @staticmethod
+    def validate_stock(products, quantities):
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if not product:
+                raise ValueError(f"Product with ID {product_id} not found")
+            if product['stock'] < quantity:
+                raise ValueError(f"Insufficient stock for {product['name']}. Available: {product['stock']}, Requested: {quantity}")
+
+    @staticmethod
+    def decrement_stock(conn, quantities, allow_backorder=False):
+        """
+        Decrement stock for every product with one UPDATE and log the changes with one
+        executemany. Unless allow_backorder is set, rows only change while stock >= n and
+        a short rowcount raises ValueError so the caller rolls back.
+        """
+        if not quantities:
+            return
+        ids = sorted(quantities)
+        placeholders = ','.join(['%s'] * len(ids))
+        if len(ids) == 1:
+            case_sql = "%s"
+            case_params = [quantities[ids[0]]]
+        else:
+            case_sql = "CASE id " + " ".join(["WHEN %s THEN %s"] * len(ids)) + " END"
+            case_params = [value for product_id in ids for value in (product_id, quantities[product_id])]
+
+        query = f"UPDATE products SET stock = stock - {case_sql} WHERE id IN ({placeholders})"
+        params = case_params + ids
+        if not allow_backorder:
+            query += f" AND stock >= {case_sql}"
+            params += case_params
+
+        cur = conn.cursor()
+        try:
+            cur.execute(query, params)
+            if not allow_backorder and cur.rowcount != len(ids):
+                raise ValueError("Insufficient stock: inventory changed while the order was being placed")
+
+            # Log the stock changes in inventory table for tracking
+            cur.executemany(
+                "INSERT INTO inventory (product_id, changes, change_date) VALUES (%s, %s, NOW())",
+                [(product_id, -quantities[product_id]) for product_id in ids]
+            )
+        finally:
+            cur.close()
+
+    @staticmethod
+    def insert_order_items(conn, rows, columns=ORDER_ITEM_COLUMNS):
+        """Insert all order_items rows with one executemany (sent as a multi-row INSERT)"""
+        if not rows:
+            return
+        cur = conn.cursor()
+        try:
+            cur.executemany(
+                f"INSERT INTO order_items ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                rows
+            )
+        finally:
+            cur.close()
+
 class Order:
     """
     Order management class.
@@ -976,7 +1164,11 @@ class Order:
     - Cancelled: Order cancelled, stock restored
     """
     @staticmethod
-    def get_paginated_orders(status=None, date=None, search=None, approval=None, page=1, page_size=10):
+    def get_paginated_orders(status=None, date=None, search=None, approval=None, page=1, page_size=10, cursor=None):
+        """
+        One page of orders, newest first, as (orders, total_orders, next_cursor).
+        Pages are keyset-paged on (order_date, id); the total is cached briefly per filter set.
+        """
         conn = get_db()
         cur = conn.cursor(dictionary=True)
         
@@ -997,21 +1189,18 @@ class Order:
         
         # Handle status filtering
         if status and status.lower() != 'all':
-            if status.lower() == 'pending':
-                # Show only pending orders
-                base_query += " AND LOWER(o.status) = 'pending'"
-                count_query += " AND LOWER(o.status) = 'pending'"
-            else:
-                # Show specific status (completed, cancelled, etc.)
-                base_query += " AND LOWER(o.status) = LOWER(%s)"
-                count_query += " AND LOWER(o.status) = LOWER(%s)"
-                params.append(status)
+            # Show specific status (pending, completed, cancelled, etc.)
+            status_sql, status_params = qp.status_in('o.status', status)
+            base_query += f" AND {status_sql}"
+            count_query += f" AND {status_sql}"
+            params.extend(status_params)
         # No else clause - when status is 'all', show all orders including pending
             
         if date:
-            base_query += " AND DATE(o.order_date) = %s"
-            count_query += " AND DATE(o.order_date) = %s"
-            params.append(date)
+            day_sql, day_params = qp.on_day('o.order_date', date)
+            base_query += f" AND {day_sql}"
+            count_query += f" AND {day_sql}"
+            params.extend(day_params)
         
         if approval and approval.lower() != 'all':
             base_query += " AND o.approval_status = %s"
@@ -1027,37 +1216,49 @@ class Order:
             like_search = f"%{search.lower()}%"
             params.extend([like_search, like_search, like_search])
             
+        listing = keyset_pager.key('orders', status, date, approval, search, page_size)
+
+        def count_orders():
+            cur.execute(count_query, params)
+            return cur.fetchone()['COUNT(*)']
+
         # Get total count
-        cur.execute(count_query, params)
-        total_orders = cur.fetchone()['COUNT(*)']
+        total_orders = keyset_pager.count(listing, count_orders)
         
         # Add pagination to base query
-        base_query += " ORDER BY o.order_date DESC LIMIT %s OFFSET %s"
-        offset = (page - 1) * page_size
-        params.extend([page_size, offset])
-        
-        print("Executing SQL:", base_query)
-        print("With params:", params)
+        seek, offset = keyset_pager.plan(listing, page, page_size, cursor)
+        page_params = list(params)
+        if seek is not None:
+            seek_sql, seek_params = seek_predicate(('o.order_date', 'o.id'), seek)
+            base_query += f" AND {seek_sql}"
+            page_params.extend(seek_params)
+        base_query += " ORDER BY o.order_date DESC, o.id DESC LIMIT %s OFFSET %s"
+        page_params.extend([page_size, offset])
         
-        cur.execute(base_query, params)
+        cur.execute(base_query, page_params)
         orders = cur.fetchall()
         cur.close()
-        return orders, total_orders
+
+        next_cursor = None
+        if len(orders) == page_size:
+            next_cursor = keyset_pager.remember(listing, page, (orders[-1]['order_date'], orders[-1]['id']))
+        return orders, total_orders, next_cursor
 
     @staticmethod
     def get_by_status(status):
         conn = get_db()
         cur = conn.cursor(dictionary=True)
         try:
-            query = """
+            status_sql, status_params = qp.status_in('o.status', status)
+            query = f"""
                 SELECT o.id, c.first_name, c.last_name, o.status, o.order_date,
                        o.total_amount as total
                 FROM orders o
                 JOIN customers c ON o.customer_id = c.id
-                WHERE LOWER(o.status) = LOWER(%s)
+                WHERE {status_sql}
                 ORDER BY o.order_date DESC
             """
-            cur.execute(query, (status,))
+            cur.execute(query, status_params)
             orders = cur.fetchall()
             return orders
         finally:
@@ -1145,6 +1346,7 @@ class Order:
             """, (order_id,))
 
             conn.commit()
+            SalesRollup.record_orders([order_id])
             current_app.logger.info(f"Order {order_id} cancelled successfully by {staff_username}")
 
             return {
@@ -1252,6 +1454,7 @@ class Order:
                 """, (new_total, order_id))
 
             conn.commit()
+            SalesRollup.record_orders([order_id])
             current_app.logger.info(f"Partial cancellation completed for order {order_id} by {staff_username}")
 
             return {
@@ -1308,6 +1511,35 @@ class Order:
             cur.close()
             conn.close()
 
+    @staticmethod
+    def get_item_summaries(order_ids):
+        """
+        Item count and first product name for several orders in one aggregated query.
+        Returns a dict keyed by order id; orders without items are absent.
+        """
+        ids = list(dict.fromkeys(int(order_id) for order_id in order_ids or []))
+        if not ids:
+            return {}
+
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            placeholders = ','.join(['%s'] * len(ids))
+            cur.execute(f"""
+                SELECT oi.order_id,
+                       COUNT(*) as item_count,
+                       SUM(oi.quantity) as total_quantity,
+                       SUBSTRING_INDEX(GROUP_CONCAT(p.name ORDER BY oi.id SEPARATOR 0x1f), 0x1f, 1) as first_product_name
+                FROM order_items oi
+                JOIN products p ON oi.product_id = p.id
+                WHERE oi.order_id IN ({placeholders})
+                GROUP BY oi.order_id
+            """, tuple(ids))
+            return {row['order_id']: row for row in cur.fetchall()}
+        finally:
+            cur.close()
+            conn.close()
+
     @staticmethod
     def get_completed_orders_by_customer(customer_id):
         """Get completed orders for a customer with product details"""
@@ -1377,144 +1609,106 @@ class Order:
         conn = get_db()
         cur = conn.cursor()
         try:
-            # Convert order_date to string format 'YYYY-MM-DD HH:MM:SS' if it's a datetime object
-            if hasattr(order_date, 'strftime'):
-                order_date_str = order_date.strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                order_date_str = order_date
-
-            # Set initial approval status and main status based on order type
-            # ALL orders require manual approval - no automatic approval
-            approval_status = 'Pending Approval'
-            # Keep status as 'Pending' until approved
-
-            # Only generate transaction ID for QR payments
-            if not transaction_id and (payment_method == 'KHQR_BAKONG' or 'QR' in payment_method.upper()):
-                import uuid
-                import hashlib
-                unique_id = str(uuid.uuid4())
-                transaction_id = hashlib.md5(unique_id.encode()).hexdigest()
-
-            # Insert order with or without transaction_id based on payment method
-            # Only include transaction_id if it's not None and not empty
-            if transaction_id and transaction_id.strip():
-                cur.execute("""
-                    INSERT INTO orders (customer_id, order_date, status, total_amount, payment_method, approval_status, transaction_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (customer_id, order_date_str, status, 0.0, payment_method, approval_status, transaction_id))
-            else:
-                cur.execute("""
-                    INSERT INTO orders (customer_id, order_date, status, total_amount, payment_method, approval_status)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (customer_id, order_date_str, status, 0.0, payment_method, approval_status))
-            order_id = cur.lastrowid
-
-            total_amount = 0.0
-            if items:
-                # First validate stock availability for all items
-                for item in items:
-                    product_id = item['product_id']
-                    quantity = item['quantity']
-
-                    # Check current stock
-                    cur.execute("SELECT stock, name FROM products WHERE id = %s", (product_id,))
-                    result = cur.fetchone()
-                    if not result:
-                        raise ValueError(f"Product with ID {product_id} not found")
-
-                    current_stock, product_name = result
-                    if current_stock < quantity:
-                        raise ValueError(f"Insufficient stock for {product_name}. Available: {current_stock}, Requested: {quantity}")
-
-                # If all items have sufficient stock, proceed with order creation and stock reduction
-                for item in items:
-                    product_id = item['product_id']
-                    quantity = item['quantity']
-                    price = item['price']
-
-                    # Get product's original price, discount information, and denormalized data
+            # Own transaction, or a savepoint inside the caller's
+            with atomic(conn, 'order_create'):
+                # Convert order_date to string format 'YYYY-MM-DD HH:MM:SS' if it's a datetime object
+                if hasattr(order_date, 'strftime'):
+                    order_date_str = order_date.strftime('%Y-%m-%d %H:%M:%S')
+                else:
+                    order_date_str = order_date
+
+                # Lock and validate every ordered product up front, in one query
+                quantities = OrderPlacement.aggregate_quantities(items) if items else {}
+                products_by_id = OrderPlacement.lock_products(conn, quantities.keys())
+                OrderPlacement.validate_stock(products_by_id, quantities)
+
+                # Set initial approval status and main status based on order type
+                # ALL orders require manual approval - no automatic approval
+                approval_status = 'Pending Approval'
+                # Keep status as 'Pending' until approved
+
+                # Only generate transaction ID for QR payments
+                if not transaction_id and (payment_method == 'KHQR_BAKONG' or 'QR' in payment_method.upper()):
+                    import uuid
+                    import hashlib
+                    unique_id = str(uuid.uuid4())
+                    transaction_id = hashlib.md5(unique_id.encode()).hexdigest()
+
+                # Insert order with or without transaction_id based on payment method
+                # Only include transaction_id if it's not None and not empty
+                if transaction_id and transaction_id.strip():
                     cur.execute("""
-                        SELECT p.original_price, p.price, p.name, p.description, c.name as category_name
-                        FROM products p
-                        LEFT JOIN categories c ON p.category_id = c.id
-                        WHERE p.id = %s
-                    """, (product_id,))
-                    product_data = cur.fetchone()
-
-                    if product_data:
-                        original_price, current_product_price, product_name, product_description, category_name = product_data
+                        INSERT INTO orders (customer_id, order_date, status, total_amount, payment_method, approval_status, transaction_id)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """, (customer_id, order_date_str, status, 0.0, payment_method, approval_status, transaction_id))
+                else:
+                    cur.execute("""
+                        INSERT INTO orders (customer_id, order_date, status, total_amount, payment_method, approval_status)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, (customer_id, order_date_str, status, 0.0, payment_method, approval_status))
+                order_id = cur.lastrowid
+
+                total_amount = 0.0
+                if items:
+                    item_rows = []
+                    for item in items:
+                        product_id = item['product_id']
+                        quantity = item['quantity']
+                        price = item['price']
+
+                        # Product's original price, discount information, and denormalized data
+                        product_data = products_by_id[int(product_id)]
                         # Use original_price if available, otherwise use current price as original
-                        original_price = original_price if original_price is not None else current_product_price
+                        original_price = product_data['original_price'] if product_data['original_price'] is not None else product_data['price']
 
                         # Calculate discount information
                         discount_amount = max(0, float(original_price) - float(price))
                         discount_percentage = (discount_amount / float(original_price)) * 100 if float(original_price) > 0 else 0
-                    else:
-                        # Fallback if product not found
-                        original_price = price
-                        discount_amount = 0
-                        discount_percentage = 0
-                        product_name = "Unknown Product"
-                        product_description = ""
-                        category_name = "Unknown Category"
-
-                    # Insert order item with discount information and denormalized product data
-                    cur.execute("""
-                        INSERT INTO order_items (order_id, product_id, quantity, price, original_price, discount_percentage, discount_amount, product_name, product_description, product_category)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (order_id, product_id, quantity, price, original_price, discount_percentage, discount_amount, product_name, product_description, category_name))
-                    total_amount += quantity * price
 
-                    # Reduce product stock
-                    cur.execute(
-                        "UPDATE products SET stock = stock - %s WHERE id = %s",
-                        (quantity, product_id)
-                    )
+                        item_rows.append((order_id, product_id, quantity, price, original_price, discount_percentage, discount_amount,
+                                          product_data['name'], product_data['description'], product_data['category_name']))
+                        total_amount += quantity * price
 
-                    # Log the stock change in inventory table for tracking
-                    cur.execute(
-                        "INSERT INTO inventory (product_id, changes) VALUES (%s, %s)",
-                        (product_id, -quantity)
-                    )
+                    # Insert all order items, then reduce stock with one conditional UPDATE
+                    OrderPlacement.insert_order_items(conn, item_rows)
+                    OrderPlacement.decrement_stock(conn, quantities)
 
-            # Calculate and apply volume discount
-            volume_discount_rule_id = None
-            volume_discount_percentage = 0.0
-            volume_discount_amount = 0.0
+                # Calculate and apply volume discount
+                volume_discount_rule_id = None
+                volume_discount_percentage = 0.0
+                volume_discount_amount = 0.0
 
-            if total_amount > 0:
-                # Find applicable volume discount rule
-                cur.execute("""
-                    SELECT id, discount_percentage
-                    FROM volume_discount_rules
-                    WHERE minimum_amount <= %s AND is_active = TRUE
-                    ORDER BY minimum_amount DESC
-                    LIMIT 1
-                """, (total_amount,))
+                if total_amount > 0:
+                    # Find applicable volume discount rule
+                    cur.execute("""
+                        SELECT id, discount_percentage
+                        FROM volume_discount_rules
+                        WHERE minimum_amount <= %s AND is_active = TRUE
+                        ORDER BY minimum_amount DESC
+                        LIMIT 1
+                    """, (total_amount,))
 
-                volume_rule = cur.fetchone()
-                if volume_rule:
-                    volume_discount_rule_id, discount_percentage = volume_rule
-                    volume_discount_percentage = float(discount_percentage)
+                    volume_rule = cur.fetchone()
+                    if volume_rule:
+                        volume_discount_rule_id, discount_percentage = volume_rule
+                        volume_discount_percentage = float(discount_percentage)
 
-                    # Calculate volume discount amount (no maximum limit)
-                    volume_discount_amount = total_amount * (volume_discount_percentage / 100)
+                        # Calculate volume discount amount (no maximum limit)
+                        volume_discount_amount = total_amount * (volume_discount_percentage / 100)
 
-                    # Apply volume discount to total
-                    total_amount -= volume_discount_amount
+                        # Apply volume discount to total
+                        total_amount -= volume_discount_amount
 
-            cur.execute("""
-                UPDATE orders
-                SET total_amount = %s, volume_discount_rule_id = %s,
-                    volume_discount_percentage = %s, volume_discount_amount = %s
-                WHERE id = %s
-            """, (total_amount, volume_discount_rule_id, volume_discount_percentage, volume_discount_amount, order_id))
+                cur.execute("""
+                    UPDATE orders
+                    SET total_amount = %s, volume_discount_rule_id = %s,
+                        volume_discount_percentage = %s, volume_discount_amount = %s
+                    WHERE id = %s
+                """, (total_amount, volume_discount_rule_id, volume_discount_percentage, volume_discount_amount, order_id))
 
-            conn.commit()
+            if status.lower() == 'completed':
+                SalesRollup.record_orders([order_id])
             return order_id
-        except Exception as e:
-            conn.rollback()
-            raise e
         finally:
             cur.close()
             conn.close()
@@ -1527,7 +1721,7 @@ class Order:
             cur.execute("""
                 SELECT status, COUNT(*) as count, SUM(total_amount) as total
                 FROM orders
-                WHERE LOWER(status) NOT IN ('delivered', 'shipped', 'processing')
+                WHERE status NOT IN ('DELIVERED', 'SHIPPED', 'PROCESSING')
                 GROUP BY status
             """)
             summary = cur.fetchall()
@@ -1546,7 +1740,7 @@ class Order:
         try:
             cur.execute("""
                 SELECT SUM(total_amount) FROM orders
-                WHERE LOWER(status) NOT IN ('delivered', 'shipped', 'processing', 'pending')
+                WHERE status NOT IN ('DELIVERED', 'SHIPPED', 'PROCESSING', 'PENDING')
             """)
             result = cur.fetchone()
             return float(result[0]) if result[0] is not None else 0.0
@@ -1577,7 +1771,7 @@ class Order:
         cur = conn.cursor()
         try:
             cur.execute("""
-                SELECT COUNT(*) FROM orders WHERE LOWER(status) = 'pending'
+                SELECT COUNT(*) FROM orders WHERE status = 'PENDING'
             """)
             result = cur.fetchone()
             return result[0] if result else 0
@@ -1665,6 +1859,7 @@ class Order:
                 (status.capitalize(), order_id)
             )
             conn.commit()
+            SalesRollup.record_orders([order_id])
         except Exception as e:
             print(f"Exception in update_status: {e}")
             conn.rollback()
@@ -1688,34 +1883,16 @@ class Order:
 class Report:
     @staticmethod
     def get_sales(start_date, end_date):
-        conn = get_db()
-        cur = conn.cursor(dictionary=True)
         try:
-            # Adjust end_date to include the full day by adding one day and using less than comparison
-            from datetime import datetime, timedelta
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-            adjusted_start = start_dt.strftime('%Y-%m-%d 00:00:00')
-            adjusted_end = end_dt.strftime('%Y-%m-%d 00:00:00')
-
-            cur.execute("""
-                SELECT DATE(o.order_date) as date,
-                       SUM(oi.quantity * oi.price) as daily_sales
-                FROM orders o
-                JOIN order_items oi ON o.id = oi.order_id
-                WHERE LOWER(o.status) = 'completed'
-                AND o.order_date >= %s AND o.order_date < %s
-                GROUP BY DATE(o.order_date)
-            """, (adjusted_start, adjusted_end))
-            sales = cur.fetchall()
-            current_app.logger.info(f"Report.get_sales: Fetched {len(sales)} sales records for dates {adjusted_start} to {adjusted_end}.")
+            sales = [
+                {'date': row['sale_date'], 'daily_sales': row['revenue']}
+                for row in SalesRollup.get_daily(start_date, end_date)
+            ]
+            current_app.logger.info(f"Report.get_sales: Fetched {len(sales)} sales records for dates {start_date} to {end_date}.")
             return sales
         except Exception as e:
             current_app.logger.error(f"Error in Report.get_sales: {e}")
             return []
-        finally:
-            cur.close()
-            conn.close()
 
     @staticmethod
     def get_monthly_sales_detail(month):
@@ -1728,25 +1905,21 @@ class Report:
             conn = get_db()
             cur = conn.cursor(dictionary=True)
             
-            start_date = f"{month}-01"
-            # Calculate end date as last day of the month
-            from datetime import datetime
-            import calendar
             year, mon = map(int, month.split('-'))
-            last_day = calendar.monthrange(year, mon)[1]
-            end_date = f"{month}-{last_day:02d}"
+            month_sql, month_params = qp.in_month('o.order_date', year, mon)
+            sale_sql, sale_params = qp.completed_or_approved('o')
 
             sales_details = []
 
             # Get completed or approved orders
-            cur.execute("""
+            cur.execute(f"""
                 SELECT o.id as order_id, o.order_date, c.first_name, c.last_name, o.total_amount
                 FROM orders o
                 JOIN customers c ON o.customer_id = c.id
-                WHERE o.order_date BETWEEN %s AND %s
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
+                WHERE {month_sql}
+                AND {sale_sql}
                 ORDER BY o.order_date ASC
-            """, (start_date, end_date))
+            """, (*month_params, *sale_params))
             result = cur.fetchall()
 
             for row in result:
@@ -1791,17 +1964,18 @@ class Report:
                 })
 
             # Get confirmed pre-orders with actual deposits (exclude $0.00 deposits)
-            cur.execute("""
+            preorder_month_sql, preorder_month_params = qp.in_month('po.updated_date', year, mon)
+            cur.execute(f"""
                 SELECT po.id as preorder_id, po.updated_date, c.first_name, c.last_name,
                        po.deposit_amount, po.expected_price, po.quantity, p.name as product_name
                 FROM pre_orders po
                 JOIN customers c ON po.customer_id = c.id
                 JOIN products p ON po.product_id = p.id
-                WHERE po.updated_date BETWEEN %s AND %s
+                WHERE {preorder_month_sql}
                 AND po.status IN ('confirmed', 'partially_paid', 'ready_for_pickup')
                 AND po.deposit_amount > 0
                 ORDER BY po.updated_date ASC
-            """, (start_date, end_date))
+            """, preorder_month_params)
             preorder_result = cur.fetchall()
 
             for row in preorder_result:
@@ -1846,7 +2020,7 @@ class Report:
                 FROM order_items oi
                 JOIN products p ON oi.product_id = p.id
                 JOIN orders o ON oi.order_id = o.id
-                WHERE LOWER(o.status) = 'completed'
+                WHERE o.status = 'COMPLETED'
                 AND (p.archived IS NULL OR p.archived = FALSE)
                 GROUP BY p.name
                 ORDER BY total_revenue DESC
@@ -1863,32 +2037,13 @@ class Report:
 
     @staticmethod
     def get_revenue_by_category():
-        conn = get_db()
-        cur = conn.cursor(dictionary=True)
         try:
-            cur.execute("""
-                SELECT
-                    c.name as category_name,
-                    SUM(oi.quantity * oi.price) as total_revenue
-                FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                JOIN categories c ON p.category_id = c.id
-                JOIN orders o ON oi.order_id = o.id
-                WHERE LOWER(o.status) = 'completed'
-                AND (p.archived IS NULL OR p.archived = FALSE)
-                GROUP BY c.name
-                ORDER BY total_revenue DESC
-            """)
-            revenue_data = cur.fetchall()
+            revenue_data = SalesRollup.get_by_category()
             current_app.logger.info(f"Report.get_revenue_by_category: Fetched {len(revenue_data)} category revenue records.")
-            print(f"DEBUG: Revenue by category raw data: {revenue_data}")
             return revenue_data
         except Exception as e:
             current_app.logger.error(f"Error in Report.get_revenue_by_category: {e}")
             return []
-        finally:
-            cur.close()
-            conn.close()
 
     @staticmethod
     def get_monthly_sales(start_date, end_date):
@@ -1896,22 +2051,7 @@ class Report:
         cur = conn.cursor(dictionary=True)
         try:
             # Get sales from completed or approved orders
-            cur.execute("""
-                SELECT
-                    DATE_FORMAT(o.order_date, '%Y-%m') as month,
-                    SUM(oi.quantity * oi.price) as total_sales,
-                    SUM(oi.quantity * (oi.price - p.original_price)) as total_profit
-                FROM orders o
-                JOIN order_items oi ON o.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                WHERE o.order_date BETWEEN %s AND %s
-                AND (LOWER(o.status) = 'completed' OR o.approval_status = 'Approved')
-                AND (p.archived IS NULL OR p.archived = FALSE)
-                GROUP BY month
-                ORDER BY month ASC
-            """, (start_date, end_date))
-
-            order_sales = cur.fetchall()
+            order_sales = SalesRollup.get_monthly(start_date, end_date)
 
             # Get sales from confirmed pre-orders (deposit payments) - exclude $0.00 deposits
             cur.execute("""
@@ -1986,30 +2126,20 @@ class Report:
         cur = conn.cursor()
         try:
             # Get revenue from completed orders
-            cur.execute("""
-                SELECT SUM(oi.quantity * oi.price)
-                FROM orders o
-                JOIN order_items oi ON o.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                WHERE LOWER(o.status) = 'completed'
-                AND YEAR(o.order_date) = YEAR(CURDATE())
-                AND MONTH(o.order_date) = MONTH(CURDATE())
-                AND (p.archived IS NULL OR p.archived = FALSE)
-            """)
-            order_result = cur.fetchone()
-            order_revenue = float(order_result[0]) if order_result[0] is not None else 0.0
+            today = date.today()
+            order_revenue = SalesRollup.get_totals(today.replace(day=1), today)['revenue']
 
             # Get revenue from confirmed pre-orders (deposit payments) - exclude $0.00 deposits
-            cur.execute("""
+            month_sql, month_params = qp.this_month('po.updated_date')
+            cur.execute(f"""
                 SELECT SUM(po.deposit_amount)
                 FROM pre_orders po
                 JOIN products p ON po.product_id = p.id
                 WHERE po.status IN ('confirmed', 'partially_paid', 'ready_for_pickup')
                 AND po.deposit_amount > 0
-                AND YEAR(po.updated_date) = YEAR(CURDATE())
-                AND MONTH(po.updated_date) = MONTH(CURDATE())
+                AND {month_sql}
                 AND (p.archived IS NULL OR p.archived = FALSE)
-            """)
+            """, month_params)
             preorder_result = cur.fetchone()
             preorder_revenue = float(preorder_result[0]) if preorder_result[0] is not None else 0.0
 
@@ -2024,25 +2154,553 @@ class Report:
 
     @staticmethod
     def get_average_order_value_this_month():
+        try:
+            today = date.today()
+            totals = SalesRollup.get_totals(today.replace(day=1), today)
+            if not totals['order_count']:
+                return 0.0
+            return totals['order_total'] / totals['order_count']
+        except Exception as e:
+            current_app.logger.error(f"Error in Report.get_average_order_value_this_month: {e}")
+            return 0.0
+
+    @staticmethod
+    def get_kpi_snapshot():
+        """
+        All staff dashboard KPIs on one connection: month-to-date sales come from the rollup,
+        pre-order deposits and new customers from one statement, the status summary from another.
+        Unlike the individual KPI methods this raises on failure, so a failed snapshot isn't cached.
+        """
+        today = date.today()
+        month_totals = SalesRollup.get_totals(today.replace(day=1), today)
+
         conn = get_db()
-        cur = conn.cursor()
+        cur = conn.cursor(dictionary=True)
         try:
+            preorder_month_sql, preorder_month_params = qp.this_month('po.updated_date')
+            customer_month_sql, customer_month_params = qp.this_month('created_at')
+            cur.execute(f"""
+                SELECT
+                    (SELECT COALESCE(SUM(po.deposit_amount), 0)
+                     FROM pre_orders po
+                     JOIN products p ON po.product_id = p.id
+                     WHERE po.status IN ('confirmed', 'partially_paid', 'ready_for_pickup')
+                     AND po.deposit_amount > 0
+                     AND {preorder_month_sql}
+                     AND (p.archived IS NULL OR p.archived = FALSE)) as preorder_revenue,
+                    (SELECT COUNT(*)
+                     FROM customers
+                     WHERE {customer_month_sql}) as new_customers
+            """, (*preorder_month_params, *customer_month_params))
+            scalars = cur.fetchone()
+
             cur.execute("""
-                SELECT AVG(o.total_amount)
-                FROM orders o
-                JOIN order_items oi ON o.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                WHERE LOWER(o.status) = 'completed'
-                AND YEAR(o.order_date) = YEAR(CURDATE())
-                AND MONTH(o.order_date) = MONTH(CURDATE())
-                AND (p.archived IS NULL OR p.archived = FALSE)
+                SELECT status, COUNT(*) as count, SUM(total_amount) as total
+                FROM orders
+                WHERE status NOT IN ('DELIVERED', 'SHIPPED', 'PROCESSING')
+                GROUP BY status
             """)
-            result = cur.fetchone()
-            avg_order_value = float(result[0]) if result[0] is not None else 0.0
-            return avg_order_value
+            order_summary = cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+        for item in order_summary:
+            item['total'] = float(item['total']) if item['total'] is not None else 0.0
+
+        order_count = month_totals['order_count']
+        return {
+            'total_revenue': month_totals['revenue'] + float(scalars['preorder_revenue'] or 0),
+            'new_customers': int(scalars['new_customers'] or 0),
+            'average_order_value': month_totals['order_total'] / order_count if order_count else 0.0,
+            'order_summary': order_summary,
+        }
+
+class SalesRollup:
+    """
+    Materialized daily sales used by the revenue and report endpoints.
+
+    daily_sales_rollup holds one row per day (orders, order totals, item revenue, profit, units);
+    daily_sales_rollup_products holds one row per day and product, with the product's category.
+    A day's rows are recomputed from orders/order_items whenever an order placed on that day is
+    completed, approved, cancelled or partially cancelled (record_orders), so once the history
+    is backfilled reads never aggregate raw orders; before that they aggregate live. Today and
+    yesterday are also re-derived every MAX_LAG seconds to pick up status changes made by code
+    paths that don't call record_orders.
+    """
+
+    # Orders that count as sales. Report.get_sales, get_revenue_by_category and the month-to-date
+    # revenue / average order value KPIs counted COMPLETED orders only before the rollup; they now
+    # also count approved orders, like the monthly and revenue endpoints always did.
+    RECOGNIZED = "(o.status = 'COMPLETED' OR o.approval_status = 'Approved') AND o.status <> 'CANCELLED'"
+    MAX_LAG = 60  # seconds
+    BACKFILL_LOCK = 'daily_sales_rollup_backfill'
+    BACKFILL_MARKER = 'full_backfill'  # sales_rollup_state row written when a full rebuild completes
+    BACKFILL_RETRY = 300  # seconds between queued backfill attempts per worker
+
+    TABLES = (
+        """
+        CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+            sale_date DATE NOT NULL PRIMARY KEY,
+            order_count INT NOT NULL DEFAULT 0,
+            order_total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            profit DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            units INT NOT NULL DEFAULT 0,
+            refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_sales_rollup_products (
+            sale_date DATE NOT NULL,
+            product_id INT NOT NULL,
+            category_id INT NULL,
+            order_count INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            profit DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            units INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (sale_date, product_id),
+            KEY idx_rollup_products_category (category_id, sale_date),
+            KEY idx_rollup_products_product (product_id, sale_date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sales_rollup_state (
+            name VARCHAR(64) NOT NULL PRIMARY KEY,
+            completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+    )
+
+    _checked_at = 0.0
+    _ready = False
+    _tables_ready = False
+    _backfill_queued_at = 0.0
+
+    @staticmethod
+    def _as_date(value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+    @staticmethod
+    def _daily_select():
+        """
+        Aggregate with daily_sales_rollup's columns for orders placed in [%s, %s);
+        takes the bounds twice (bounds + bounds)
+        """
+        return f"""
+            SELECT DATE(o.order_date) as sale_date,
+                   COUNT(*) as order_count,
+                   COALESCE(SUM(o.total_amount), 0) as order_total,
+                   COALESCE(SUM(i.revenue), 0) as revenue,
+                   COALESCE(SUM(i.profit), 0) as profit,
+                   COALESCE(SUM(i.units), 0) as units
+            FROM orders o
+            LEFT JOIN (
+                SELECT oi.order_id,
+                       SUM(oi.quantity * oi.price) as revenue,
+                       SUM(oi.quantity * (oi.price - p.original_price)) as profit,
+                       SUM(oi.quantity) as units
+                FROM orders o
+                JOIN order_items oi ON oi.order_id = o.id
+                LEFT JOIN products p ON oi.product_id = p.id
+                WHERE o.order_date >= %s AND o.order_date < %s
+                GROUP BY oi.order_id
+            ) i ON i.order_id = o.id
+            WHERE o.order_date >= %s AND o.order_date < %s
+            AND {SalesRollup.RECOGNIZED}
+            GROUP BY DATE(o.order_date)
+        """
+
+    @staticmethod
+    def _products_select():
+        """Aggregate with daily_sales_rollup_products' columns for orders placed in [%s, %s)"""
+        return f"""
+            SELECT DATE(o.order_date) as sale_date,
+                   oi.product_id,
+                   MAX(p.category_id) as category_id,
+                   COUNT(DISTINCT o.id) as order_count,
+                   COALESCE(SUM(oi.quantity * oi.price), 0) as revenue,
+                   COALESCE(SUM(oi.quantity * (oi.price - p.original_price)), 0) as profit,
+                   COALESCE(SUM(oi.quantity), 0) as units
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            LEFT JOIN products p ON oi.product_id = p.id
+            WHERE o.order_date >= %s AND o.order_date < %s
+            AND {SalesRollup.RECOGNIZED}
+            AND oi.product_id IS NOT NULL
+            GROUP BY DATE(o.order_date), oi.product_id
+        """
+
+    @staticmethod
+    def _refresh_range(conn, start, end):
+        """Recompute rollup rows for start <= day <= end (dates) on conn, inside the caller's transaction"""
+        bounds = (start, end + timedelta(days=1))
+        cur = conn.cursor()
+        try:
+            cur.execute("DELETE FROM daily_sales_rollup WHERE sale_date BETWEEN %s AND %s", (start, end))
+            cur.execute("DELETE FROM daily_sales_rollup_products WHERE sale_date BETWEEN %s AND %s", (start, end))
+            cur.execute(
+                "INSERT INTO daily_sales_rollup (sale_date, order_count, order_total, revenue, profit, units)"
+                + SalesRollup._daily_select(),
+                bounds + bounds
+            )
+            cur.execute(
+                "INSERT INTO daily_sales_rollup_products"
+                " (sale_date, product_id, category_id, order_count, revenue, profit, units)"
+                + SalesRollup._products_select(),
+                bounds
+            )
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _daily_source(start, end):
+        """
+        (FROM target, params) with daily_sales_rollup's columns covering start..end: the
+        table once a full backfill has completed, else the same aggregate computed live
+        """
+        if SalesRollup.ensure_fresh():
+            return "daily_sales_rollup", ()
+        bounds = (start, end + timedelta(days=1))
+        return f"({SalesRollup._daily_select()})", bounds + bounds
+
+    @staticmethod
+    def _products_source(start=None, end=None):
+        """Like _daily_source for daily_sales_rollup_products (all history without a range)"""
+        if SalesRollup.ensure_fresh():
+            return "daily_sales_rollup_products", ()
+        if start is None or end is None:
+            # DATETIME's full range
+            start, end = date(1000, 1, 1), date(9999, 12, 30)
+        return f"({SalesRollup._products_select()})", (start, end + timedelta(days=1))
+
+    @staticmethod
+    def refresh_days(days):
+        """Recompute the rollup for each given day (date, datetime or 'YYYY-MM-DD')"""
+        days = sorted({SalesRollup._as_date(day) for day in days if day})
+        if not days:
+            return
+        SalesRollup.create_tables()
+        conn = get_db()
+        try:
+            with atomic(conn, 'sales_rollup_refresh'):
+                for day in days:
+                    SalesRollup._refresh_range(conn, day, day)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def rebuild(start_date=None, end_date=None):
+        """
+        Backfill: recompute every day between start_date and end_date (default: all order history),
+        one month per transaction. Returns the number of days covered.
+        """
+        SalesRollup.create_tables()
+        full = start_date is None and end_date is None
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            if start_date is None or end_date is None:
+                cur.execute("SELECT MIN(order_date), MAX(order_date) FROM orders")
+                first, last = cur.fetchone()
+                if first is None:
+                    if full:
+                        SalesRollup._mark_backfilled(conn)
+                    return 0
+                start_date = start_date or first
+                end_date = end_date or last
+            start = SalesRollup._as_date(start_date)
+            end = SalesRollup._as_date(end_date)
+
+            chunk_start = start
+            while chunk_start <= end:
+                chunk_end = min(end, chunk_start + timedelta(days=30))
+                with atomic(conn, 'sales_rollup_rebuild'):
+                    SalesRollup._refresh_range(conn, chunk_start, chunk_end)
+                chunk_start = chunk_end + timedelta(days=1)
+            if full:
+                SalesRollup._mark_backfilled(conn)
+            rollup_logger.info(f"Sales rollup rebuilt for {start} .. {end}")
+            return (end - start).days + 1
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def record_orders(order_ids):
+        """
+        Refresh the days of the given orders after their status, approval or items changed.
+        Call after the change is committed; failures are logged, never raised, so they can't
+        undo an order update (the periodic refresh catches today's rows up anyway).
+        """
+        ids = [int(order_id) for order_id in (order_ids or []) if order_id is not None]
+        if not ids:
+            return
+        try:
+            conn = get_db()
+            cur = conn.cursor()
+            try:
+                placeholders = ','.join(['%s'] * len(ids))
+                cur.execute(f"SELECT DISTINCT DATE(order_date) FROM orders WHERE id IN ({placeholders})", tuple(ids))
+                days = [row[0] for row in cur.fetchall()]
+            finally:
+                cur.close()
+                conn.close()
         except Exception as e:
-            current_app.logger.error(f"Error in Report.get_average_order_value_this_month: {e}")
-            return 0.0
+            rollup_logger.error(f"Sales rollup could not look up orders {ids}: {e}")
+            return
+        SalesRollup.record_days(days)
+
+    @staticmethod
+    def record_days(days):
+        """Like record_orders, for callers that already know the order dates (e.g. deleted orders)"""
+        try:
+            SalesRollup.refresh_days(days)
+        except Exception as e:
+            rollup_logger.error(f"Sales rollup refresh failed for days {days}: {e}")
+
+    @staticmethod
+    def create_tables():
+        """Create the rollup tables if missing (one worker at a time)"""
+        if SalesRollup._tables_ready:
+            return
+        if all(schema_registry.has_table(table) for table in
+               ('daily_sales_rollup', 'daily_sales_rollup_products', 'sales_rollup_state')):
+            SalesRollup._tables_ready = True
+            return
+
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT GET_LOCK(%s, 30)", (SalesRollup.BACKFILL_LOCK,))
+            if cur.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for another worker to create the sales rollup tables")
+            try:
+                for ddl in SalesRollup.TABLES:
+                    cur.execute(ddl)
+                SalesRollup._tables_ready = True
+                schema_registry.invalidate()
+            finally:
+                cur.execute("SELECT RELEASE_LOCK(%s)", (SalesRollup.BACKFILL_LOCK,))
+                cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def _mark_backfilled(conn):
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO sales_rollup_state (name) VALUES (%s)
+                ON DUPLICATE KEY UPDATE completed_at = CURRENT_TIMESTAMP
+            """, (SalesRollup.BACKFILL_MARKER,))
+            conn.commit()
+        finally:
+            cur.close()
+
+    @staticmethod
+    def is_backfilled():
+        """True once a full-history rebuild has completed (the marker row exists)"""
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1 FROM sales_rollup_state WHERE name = %s", (SalesRollup.BACKFILL_MARKER,))
+            return cur.fetchone() is not None
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def backfill():
+        """
+        Job handler for the full-history rebuild. Runs in at most one worker at a time and
+        only writes the marker when it finishes, so an interrupted backfill is retried.
+        """
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT GET_LOCK(%s, 0)", (SalesRollup.BACKFILL_LOCK,))
+            if cur.fetchone()[0] != 1:
+                rollup_logger.info("Sales rollup backfill already running in another worker")
+                return None
+            try:
+                if SalesRollup.is_backfilled():
+                    return 0
+                return SalesRollup.rebuild()
+            finally:
+                cur.execute("SELECT RELEASE_LOCK(%s)", (SalesRollup.BACKFILL_LOCK,))
+                cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def ensure_tables():
+        """
+        Create the rollup tables on first use. Returns True once a full backfill has
+        completed (run scripts/rebuild_sales_rollup.py at deploy); until then readers
+        aggregate orders live, and a backfill is queued in the background every
+        BACKFILL_RETRY seconds instead of running inside a request.
+        """
+        if SalesRollup._ready:
+            return True
+        SalesRollup.create_tables()
+        if SalesRollup.is_backfilled():
+            SalesRollup._ready = True
+            return True
+
+        now = time.time()
+        if now - SalesRollup._backfill_queued_at < SalesRollup.BACKFILL_RETRY:
+            return False
+        SalesRollup._backfill_queued_at = now
+        rollup_logger.warning("Sales rollup has no completed backfill; reports aggregate orders live "
+                              "until scripts/rebuild_sales_rollup.py or the queued backfill finishes")
+        try:
+            job_queue.enqueue('sales_rollup_backfill')
+        except Exception as e:
+            rollup_logger.error(f"Could not queue sales rollup backfill: {e}")
+        return False
+
+    @staticmethod
+    def ensure_fresh():
+        """
+        Re-derive today and yesterday at most once per MAX_LAG seconds per worker.
+        Returns ensure_tables(): whether the rollup tables can be read.
+        """
+        ready = SalesRollup.ensure_tables()
+        now = time.time()
+        if now - SalesRollup._checked_at < SalesRollup.MAX_LAG:
+            return ready
+        SalesRollup._checked_at = now
+        today = datetime.now().date()
+        try:
+            SalesRollup.refresh_days([today - timedelta(days=1), today])
+        except Exception as e:
+            rollup_logger.error(f"Sales rollup periodic refresh failed: {e}")
+        return ready
+
+    @staticmethod
+    def get_daily(start_date, end_date):
+        """Rollup rows for each day with sales between start_date and end_date (inclusive)"""
+        start, end = SalesRollup._as_date(start_date), SalesRollup._as_date(end_date)
+        source, params = SalesRollup._daily_source(start, end)
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute(f"""
+                SELECT sale_date, order_count, order_total, revenue, profit, units
+                FROM {source} d
+                WHERE sale_date BETWEEN %s AND %s
+                ORDER BY sale_date ASC
+            """, params + (start, end))
+            return cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def get_days(days):
+        """Rollup rows for an explicit list of days (days without sales are absent)"""
+        days = sorted({SalesRollup._as_date(day) for day in days if day})
+        if not days:
+            return []
+        source, params = SalesRollup._daily_source(days[0], days[-1])
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            placeholders = ','.join(['%s'] * len(days))
+            cur.execute(f"""
+                SELECT sale_date, order_count, order_total, revenue, profit, units
+                FROM {source} d
+                WHERE sale_date IN ({placeholders})
+                ORDER BY sale_date ASC
+            """, params + tuple(days))
+            return cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def get_totals(start_date, end_date):
+        """Summed rollup between start_date and end_date (inclusive) as floats/ints"""
+        start, end = SalesRollup._as_date(start_date), SalesRollup._as_date(end_date)
+        source, params = SalesRollup._daily_source(start, end)
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute(f"""
+                SELECT COALESCE(SUM(order_count), 0) as order_count,
+                       COALESCE(SUM(order_total), 0) as order_total,
+                       COALESCE(SUM(revenue), 0) as revenue,
+                       COALESCE(SUM(profit), 0) as profit,
+                       COALESCE(SUM(units), 0) as units
+                FROM {source} d
+                WHERE sale_date BETWEEN %s AND %s
+            """, params + (start, end))
+            row = cur.fetchone()
+            return {
+                'order_count': int(row['order_count']),
+                'order_total': float(row['order_total']),
+                'revenue': float(row['revenue']),
+                'profit': float(row['profit']),
+                'units': int(row['units']),
+            }
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def get_monthly(start_date, end_date):
+        """Revenue and profit per 'YYYY-MM' between start_date and end_date (inclusive)"""
+        start, end = SalesRollup._as_date(start_date), SalesRollup._as_date(end_date)
+        source, params = SalesRollup._daily_source(start, end)
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute(f"""
+                SELECT DATE_FORMAT(sale_date, '%Y-%m') as month,
+                       SUM(revenue) as total_sales,
+                       SUM(profit) as total_profit,
+                       SUM(order_count) as order_count
+                FROM {source} d
+                WHERE sale_date BETWEEN %s AND %s
+                GROUP BY month
+                ORDER BY month ASC
+            """, params + (start, end))
+            return cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def get_by_category(start_date=None, end_date=None):
+        """Revenue per category name, highest first (all history unless a range is given)"""
+        start = end = None
+        if start_date and end_date:
+            start, end = SalesRollup._as_date(start_date), SalesRollup._as_date(end_date)
+        source, params = SalesRollup._products_source(start, end)
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            query = f"""
+                SELECT c.name as category_name,
+                       SUM(r.revenue) as total_revenue,
+                       SUM(r.profit) as total_profit,
+                       SUM(r.units) as units
+                FROM {source} r
+                JOIN categories c ON r.category_id = c.id
+            """
+            if start is not None:
+                query += " WHERE r.sale_date BETWEEN %s AND %s"
+                params += (start, end)
+            query += " GROUP BY c.name ORDER BY total_revenue DESC"
+            cur.execute(query, params)
+            return cur.fetchall()
         finally:
             cur.close()
             conn.close()
@@ -2416,12 +3074,13 @@ class Customer(Base):
             FROM orders o
             JOIN order_items oi ON o.id = oi.order_id
             WHERE o.customer_id = %s
-            AND LOWER(o.status) NOT IN ('delivered', 'shipped', 'pending')
+            AND o.status NOT IN ('DELIVERED', 'SHIPPED', 'PENDING')
         """
         params = [customer_id]
         if status:
-            query += " AND LOWER(o.status) = LOWER(%s)"
-            params.append(status)
+            status_sql, status_params = qp.status_in('o.status', status)
+            query += f" AND {status_sql}"
+            params.extend(status_params)
         query += """
             GROUP BY o.id
             ORDER BY o.order_date DESC
@@ -2452,12 +3111,12 @@ class Customer(Base):
         conn = get_db()
         cur = conn.cursor()
         try:
-            cur.execute("""
+            month_sql, month_params = qp.this_month('created_at')
+            cur.execute(f"""
                 SELECT COUNT(*)
                 FROM customers
-                WHERE YEAR(created_at) = YEAR(CURDATE())
-                AND MONTH(created_at) = MONTH(CURDATE())
-            """)
+                WHERE {month_sql}
+            """, month_params)
             result = cur.fetchone()
             new_customers = int(result[0]) if result[0] is not None else 0
             return new_customers
@@ -2735,6 +3394,7 @@ class Category:
             conn.close()
 
     @staticmethod
+    @catalog_cache.cached('category.hierarchy')
     def get_all_hierarchical():
         """Get all categories in hierarchical structure"""
         conn = get_db()
@@ -2781,6 +3441,7 @@ class Category:
                 (name, description, parent_id)
             )
             conn.commit()
+            catalog_cache.invalidate('category created')
             return cur.lastrowid
         except Exception as e:
             conn.rollback()
@@ -2805,6 +3466,7 @@ class Category:
             if cur.rowcount == 0:
                 raise ValueError("Category not found")
             conn.commit()
+            catalog_cache.invalidate('category deleted')
         except Exception as e:
             conn.rollback()
             raise ValueError(f"Category deletion failed: {str(e)}")
@@ -2838,6 +3500,7 @@ class Category:
             if cur.rowcount == 0:
                 raise ValueError("Category not found")
             conn.commit()
+            catalog_cache.invalidate('category updated')
         except Exception as e:
             conn.rollback()
             raise ValueError(f"Category update failed: {str(e)}")
@@ -3328,6 +3991,7 @@ class Color(Base):
     name = Column(String(255), nullable=False)
 
     @staticmethod
+    @catalog_cache.cached('color.all')
     def get_all():
         conn = get_db()
         cur = conn.cursor(dictionary=True)
@@ -3346,6 +4010,7 @@ class Color(Base):
         try:
             cur.execute("INSERT INTO colors (name) VALUES (%s)", (name,))
             conn.commit()
+            catalog_cache.invalidate('color created')
             color_id = cur.lastrowid
             return color_id
         except Exception as e:
@@ -3357,6 +4022,7 @@ class Color(Base):
 
 class Warranty:
     @staticmethod
+    @catalog_cache.cached('warranty.all')
     def get_all():
         conn = get_db()
         cur = conn.cursor(dictionary=True)
@@ -3394,6 +4060,7 @@ class Notification:
 
             notification_id = cur.lastrowid
             conn.commit()
+            notification_feed.bump(customer_id, 'created')
             current_app.logger.info(f"Notification created for customer {customer_id}: {message}")
             return notification_id
 
@@ -3447,6 +4114,8 @@ class Notification:
             """, (notification_id, customer_id))
 
             conn.commit()
+            if cur.rowcount > 0:
+                notification_feed.bump(customer_id, 'read')
             return cur.rowcount > 0
 
         except Exception as e:
@@ -3470,6 +4139,8 @@ class Notification:
             """, (customer_id,))
 
             conn.commit()
+            if cur.rowcount > 0:
+                notification_feed.bump(customer_id, 'read')
             return cur.rowcount
 
         except Exception as e:
@@ -3493,6 +4164,8 @@ class Notification:
 
             deleted_count = cur.rowcount
             conn.commit()
+            if deleted_count > 0:
+                notification_feed.bump(customer_id, 'cleared')
             return deleted_count
 
         except Exception as e:
@@ -3509,6 +4182,14 @@ class Notification:
         conn = get_db()
         cur = conn.cursor()
         try:
+            # Customers whose lists change, so their notification feed versions move
+            cur.execute("""
+                SELECT DISTINCT customer_id
+                FROM notifications
+                WHERE created_at < NOW() - INTERVAL 24 HOUR
+            """)
+            affected = [row[0] for row in cur.fetchall()]
+
             # Delete notifications older than 24 hours
             cur.execute("""
                 DELETE FROM notifications
@@ -3517,6 +4198,7 @@ class Notification:
 
             deleted_count = cur.rowcount
             conn.commit()
+            notification_feed.bump_many(affected, 'cleared')
 
             if deleted_count > 0:
                 current_app.logger.info(f"Cleaned up {deleted_count} old notifications (older than 24 hours)")
@@ -4228,7 +4910,7 @@ class PartialCancellation:
         try:
             # Get order item details
             cur.execute("""
-                SELECT oi.*, p.name as product_name, p.stock, o.customer_id
+                SELECT oi.*, p.name as product_name, p.stock, o.customer_id, o.order_date
                 FROM order_items oi
                 JOIN products p ON oi.product_id = p.id
                 JOIN orders o ON oi.order_id = o.id
@@ -4314,6 +4996,9 @@ class PartialCancellation:
                 current_app.logger.info(f"Order {order_id} completely removed - all items were cancelled")
 
             conn.commit()
+            SalesRollup.record_days([item['order_date']])
+            if notify_customer:
+                notification_feed.bump(item['customer_id'], 'created')
 
             current_app.logger.info(f"Cancelled {cancel_quantity} units of {item['product_name']} from order {order_id}. Refund: ${refund_amount:.2f}")
 
@@ -0,0 +1,15 @@
+-- Migration script to add indexes for keyset pagination of staff listings
+-- Orders, customers and inventory pages now seek on (sort column, id) instead of
+-- LIMIT ... OFFSET (see utils/keyset.py). InnoDB secondary indexes carry the primary key,
+-- so an index on the sort column covers the (sort column, id) ordering.
+
+-- Staff orders list: ORDER BY order_date DESC, id DESC
+CREATE INDEX idx_orders_order_date ON orders(order_date);
+
+-- Staff customers list: ORDER BY created_at DESC, id DESC
+CREATE INDEX idx_customers_created_at ON customers(created_at);
+
+-- Inventory sorted by price / stock / name
+CREATE INDEX idx_products_price ON products(price);
+CREATE INDEX idx_products_stock ON products(stock);
+CREATE INDEX idx_products_name ON products(name);
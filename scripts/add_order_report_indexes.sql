@@ -0,0 +1,18 @@
+-- Migration script to add composite indexes for order reporting
+-- Report and dashboard queries filter orders by status / approval_status / customer
+-- together with a half-open order_date range (see utils/query_predicates.py).
+-- These indexes let MySQL seek straight to the matching rows instead of scanning orders.
+
+-- Sales reports: WHERE status = 'COMPLETED' AND order_date >= ? AND order_date < ?
+CREATE INDEX idx_orders_status_order_date ON orders(status, order_date);
+
+-- Approval queue and approved-sales reports
+CREATE INDEX idx_orders_approval_status_order_date ON orders(approval_status, order_date);
+
+-- Customer order history, newest first
+-- (also serves the customer_id foreign key, so the single-column index becomes redundant)
+CREATE INDEX idx_orders_customer_order_date ON orders(customer_id, order_date);
+
+-- Order item lookups and product joins from an order
+CREATE INDEX idx_order_items_order_product ON order_items(order_id, product_id);
+
@@ -0,0 +1,6 @@
+-- Migration script to store perceptual hashes of payment screenshots
+-- detect_similar_screenshots looks near-duplicates up in utils/phash_index.py instead of
+-- re-decoding every stored screenshot. phash is the 64-bit imagehash.phash, written by
+-- verify_upload; fill it in for existing rows with scripts/backfill_screenshot_phash.py.
+
+ALTER TABLE order_screenshots ADD COLUMN phash BIGINT UNSIGNED NULL AFTER image_hash;
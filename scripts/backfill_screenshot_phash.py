@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Screenshot Perceptual Hash Backfill
+Computes order_screenshots.phash for rows stored before scripts/add_screenshot_phash.sql,
+so the similarity index covers older payment screenshots too. Rows whose file is gone
+are skipped.
+
+Usage:
+    python scripts/backfill_screenshot_phash.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import get_db
+from utils.schema_registry import schema_registry
+from utils.screenshot_fraud_detector import screenshot_detector
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+
+def main():
+    if not schema_registry.has_column('order_screenshots', 'phash'):
+        print("order_screenshots.phash is missing; run scripts/add_screenshot_phash.sql first")
+        return 1
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT id, file_path FROM order_screenshots WHERE phash IS NULL")
+        rows = cur.fetchall()
+        updated = missing = 0
+        for row_id, file_path in rows:
+            path = os.path.join(STATIC_DIR, file_path)
+            if not os.path.exists(path):
+                missing += 1
+                continue
+            try:
+                phash = screenshot_detector.perceptual_hash(path)
+            except Exception as e:
+                print(f"Could not hash {file_path}: {e}")
+                missing += 1
+                continue
+            cur.execute("UPDATE order_screenshots SET phash = %s WHERE id = %s", (phash, row_id))
+            updated += 1
+            if updated % 500 == 0:
+                conn.commit()
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+    print(f"Hashed {updated} screenshot(s); {missing} skipped (file missing or unreadable)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
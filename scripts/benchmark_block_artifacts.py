@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Block Artifact Detection Benchmark
+Compares the per-block Python scan that ScreenshotFraudDetector.has_compression_artifacts
+used to run (np.std + cv2.Canny + cv2.findContours per 8x8 block) with the vectorized
+whole-image version: timing, the final verdict and block-level agreement.
+
+Usage:
+    python scripts/benchmark_block_artifacts.py                       # uploaded payment screenshots
+    python scripts/benchmark_block_artifacts.py shot1.png shot2.jpg
+"""
+
+import os
+import sys
+import glob
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from utils.screenshot_fraud_detector import ScreenshotFraudDetector
+
+DEFAULT_GLOB = os.path.join('static', 'uploads', 'payment_screenshots', '*')
+REPEAT = 3
+
+
+def legacy_block_artifacts(block):
+    """The original has_block_artifacts()"""
+    if np.std(block) < 5:
+        return True
+    edges = cv2.Canny(block, 50, 150)
+    if np.sum(edges) > 0:
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w == block.shape[1] or h == block.shape[0]:
+                return True
+    return False
+
+
+def legacy_map(gray, block_size=8):
+    """The original has_compression_artifacts() scan, returning the per-block map"""
+    h, w = gray.shape
+    rows = list(range(0, h - block_size, block_size))
+    cols = list(range(0, w - block_size, block_size))
+    result = np.zeros((len(rows), len(cols)), dtype=bool)
+    for r, i in enumerate(rows):
+        for c, j in enumerate(cols):
+            result[r, c] = legacy_block_artifacts(gray[i:i + block_size, j:j + block_size])
+    return result
+
+
+def vectorized_map(detector, gray, block_size=8):
+    h, w = gray.shape
+    rows, cols = (h - 1) // block_size, (w - 1) // block_size
+    edges = cv2.Canny(gray, 50, 150)
+    return detector.block_artifact_map(gray[:rows * block_size, :cols * block_size],
+                                       edges[:rows * block_size, :cols * block_size])
+
+
+def timed(fn, *args):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob(DEFAULT_GLOB))
+    if not paths:
+        print(__doc__)
+        return 1
+
+    detector = ScreenshotFraudDetector(enabled=True)
+    print(f"{'image':40} {'size':>11} {'blocks':>7} {'old ms':>9} {'new ms':>8} {'speedup':>8} {'agree':>7} verdict")
+    verdicts_match = processed = 0
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"{os.path.basename(path)[:40]:40} unreadable")
+            continue
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        total_blocks = (h // 8) * (w // 8)
+        processed += 1
+
+        old, old_time = timed(legacy_map, gray)
+        new, new_time = timed(vectorized_map, detector, gray)
+
+        agreement = (old == new).mean() if old.size else 1.0
+        old_verdict = total_blocks > 0 and old.sum() / total_blocks > 0.1
+        new_verdict = detector.has_compression_artifacts(image)
+        verdicts_match += old_verdict == new_verdict
+        print(f"{os.path.basename(path)[:40]:40} {w:>5}x{h:<5} {old.size:>7} {old_time * 1000:>9.1f} "
+              f"{new_time * 1000:>8.1f} {old_time / max(new_time, 1e-9):>7.0f}x {agreement:>7.1%} "
+              f"{'same' if old_verdict == new_verdict else 'DIFFERENT'} ({old_verdict}/{new_verdict})")
+
+    print(f"\nVerdicts matched on {verdicts_match}/{processed} image(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
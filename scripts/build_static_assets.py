@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Static Asset Build Script
+Run at deploy time, after static files change:
+- writes static/asset-manifest.json (content hashes for css/, js/ and icons/), so
+  workers start without hashing every file
+- writes precompressed .gz (and .br when the brotli package is installed) next to
+  each compressible file, served by utils/static_assets.py to clients that accept them
+
+Usage:
+    python scripts/build_static_assets.py
+"""
+
+import os
+import sys
+import gzip
+import mimetypes
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.static_assets import StaticAssets, COMPRESSIBLE_TYPES, fingerprint
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+MIN_SIZE = 1024  # smaller files are not worth compressing
+
+
+def compress(path):
+    """Write path.gz / path.br when missing or older than path; returns bytes saved"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    if len(content) < MIN_SIZE:
+        return 0
+    saved = 0
+    variants = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+    for suffix, encode in variants:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+            continue
+        compressed = encode(content)
+        if len(compressed) >= len(content):
+            continue
+        with open(target, 'wb') as f:
+            f.write(compressed)
+        saved += len(content) - len(compressed)
+    return saved
+
+
+def main():
+    assets = StaticAssets(STATIC_DIR)
+    entries = assets.write_manifest()
+    print(f"Wrote {assets.manifest_path()} ({len(entries)} files)")
+
+    saved = compressed = 0
+    for logical in sorted(entries):
+        mimetype = mimetypes.guess_type(logical)[0] or ''
+        if not mimetype.startswith(COMPRESSIBLE_TYPES):
+            continue
+        saved += compress(os.path.join(STATIC_DIR, logical))
+        compressed += 1
+    print(f"Precompressed {compressed} file(s) ({'gzip + brotli' if brotli else 'gzip only'}); "
+          f"{saved / 1024:.0f} KB saved on newly written variants")
+
+    example = next(iter(sorted(entries)), None)
+    if example:
+        print(f"e.g. /static/{example} -> /static/{fingerprint(example, entries[example]['hash'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,7 @@ CREATE TABLE IF NOT EXISTS order_screenshots (
     id INT AUTO_INCREMENT PRIMARY KEY,
     order_id INT NOT NULL,
     image_hash VARCHAR(64) NOT NULL,
+    phash BIGINT UNSIGNED NULL,
     file_path VARCHAR(500) NOT NULL,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     verification_score DECIMAL(3,2) DEFAULT 0.00,
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Product Image Derivatives Backfill
+Generates the WebP/JPEG derivatives (see utils/product_images.py) for product photos
+uploaded before the pipeline existed, or after changing PRODUCT_IMAGE_WIDTHS /
+PRODUCT_IMAGE_QUALITY. Photos with up-to-date derivatives are skipped unless --force.
+
+Usage:
+    python scripts/generate_product_image_derivatives.py                 # every file in static/uploads/products
+    python scripts/generate_product_image_derivatives.py --force
+    python scripts/generate_product_image_derivatives.py 1.jpg 111a2.png
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils.product_images import product_images
+
+
+def main():
+    args = sys.argv[1:]
+    force = '--force' in args
+    filenames = [arg for arg in args if arg != '--force']
+    if any(arg.startswith('-') for arg in filenames):
+        print(__doc__)
+        return 1
+
+    if not filenames:
+        extensions = {f".{ext}" for ext in Config.ALLOWED_EXTENSIONS}
+        filenames = sorted(
+            name for name in os.listdir(product_images.source_dir)
+            if os.path.isfile(os.path.join(product_images.source_dir, name))
+            and os.path.splitext(name)[1].lower() in extensions
+        )
+
+    failed = 0
+    for filename in filenames:
+        try:
+            widths = product_images.generate(filename, force=force)
+        except Exception as e:
+            failed += 1
+            print(f"✗ {filename}: {e}")
+            continue
+        print(f"✓ {filename}: {', '.join(str(w) for w in widths) or 'smaller than every width, original kept'}")
+
+    stats = product_images.stats()
+    print(f"\nGenerated {stats['generated']} photo(s), skipped {stats['skipped']} up to date, {failed} failed")
+    if stats['bytes_original']:
+        print(f"Originals: {stats['bytes_original'] / 1024 / 1024:.1f} MB, "
+              f"derivatives (all widths, WebP + JPEG): {stats['bytes_derivatives'] / 1024 / 1024:.1f} MB")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Sales Rollup Rebuild Script
+Recomputes daily_sales_rollup / daily_sales_rollup_products from orders.
+Run once at deploy (a full run records the backfill as complete; until then the app
+queues it in the background and reports aggregate orders live), and after importing
+historical orders or editing orders directly in the database.
+
+Usage:
+    python scripts/rebuild_sales_rollup.py                      # all order history
+    python scripts/rebuild_sales_rollup.py 2025-01-01 2025-06-30
+"""
+
+import os
+import sys
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import SalesRollup
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = sys.argv[1:]
+    if len(args) not in (0, 2):
+        print(__doc__)
+        return 1
+
+    start_date, end_date = (args[0], args[1]) if args else (None, None)
+    days = SalesRollup.rebuild(start_date, end_date)
+    print(f"Rebuilt sales rollup for {days} day(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
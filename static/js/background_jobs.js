@@ -0,0 +1,30 @@
+// Background jobs: poll a job queued by the server (202 + status_url) until it finishes
+
+async function waitForJob(statusUrl, intervalMs = 1000, maxAttempts = 120) {
+    for (let attempt = 0; attempt < maxAttempts; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        const response = await fetch(statusUrl, { headers: { 'Accept': 'application/json' } });
+        const status = await response.json();
+        if (!status.success) {
+            throw new Error(status.error || 'Job not found');
+        }
+        if (status.status === 'done') {
+            return status;
+        }
+        if (status.status === 'failed') {
+            throw new Error(status.error || 'Background job failed');
+        }
+    }
+    throw new Error('This is taking too long, please try again later');
+}
+
+// Invoice PDFs are rendered on the job queue; download once ready
+async function downloadInvoicePdf(orderId) {
+    const response = await fetch(`/invoice-pdf/${orderId}`, { headers: { 'Accept': 'application/json' } });
+    const job = await response.json();
+    if (!response.ok || !job.success) {
+        throw new Error(job.error || 'Failed to generate PDF invoice');
+    }
+    const status = await waitForJob(job.status_url, 500);
+    window.location.href = status.download_url;
+}
@@ -358,9 +358,11 @@ class BakongPayment {
      * Start monitoring payment status
      */
     startStatusMonitoring() {
-        this.statusCheckInterval = setInterval(() => {
-            this.checkPaymentStatus();
-        }, 5000); // Check every 5 seconds
+        // Long-poll the session status (needs payment_events.js); the server answers as
+        // soon as the session is completed, failed or expired
+        this.statusWatcher = watchPaymentEvents(`/api/payment/status/${this.paymentSession.id}`, {
+            onEvent: data => this.handleStatus(data)
+        });
     }
     
     /**
@@ -436,21 +438,31 @@ class BakongPayment {
             const data = await response.json();
             
             if (data.success) {
-                const status = data.status;
-                
-                if (status === 'completed') {
-                    this.handlePaymentSuccess(data);
-                } else if (status === 'failed') {
-                    this.handlePaymentFailure(data);
-                } else if (status === 'expired') {
-                    this.handlePaymentTimeout();
-                }
+                this.handleStatus(data);
             }
         } catch (error) {
             console.error('Status check error:', error);
         }
     }
     
+    /**
+     * Act on a session status; returns true once the session is finished
+     */
+    handleStatus(data) {
+        const status = data.status;
+
+        if (status === 'completed') {
+            this.handlePaymentSuccess(data);
+        } else if (status === 'failed') {
+            this.handlePaymentFailure(data);
+        } else if (status === 'expired') {
+            this.handlePaymentTimeout();
+        } else {
+            return false;
+        }
+        return true;
+    }
+    
     /**
      * Handle successful payment
      */
@@ -487,9 +499,9 @@ class BakongPayment {
      * Stop monitoring and timers
      */
     stopMonitoring() {
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
-            this.statusCheckInterval = null;
+        if (this.statusWatcher) {
+            this.statusWatcher.stop();
+            this.statusWatcher = null;
         }
 
         if (this.timeoutTimer) {
@@ -713,8 +713,24 @@ function renderProducts(containerId, products) {
         img.alt = product.name;
         img.src = product.photo ? `/static/uploads/products/${product.photo}` : 'https://placehold.co/300x200?text=Product';
         img.style.objectFit = 'contain';
-
-        link.appendChild(img);
+        img.loading = 'lazy';
+
+        if (product.photo_srcset) {
+            // Resized WebP derivatives, JPEG derivatives for browsers without WebP
+            const sizes = '(min-width: 992px) 25vw, (min-width: 768px) 50vw, 100vw';
+            const picture = document.createElement('picture');
+            const source = document.createElement('source');
+            source.type = 'image/webp';
+            source.srcset = product.photo_srcset;
+            source.sizes = sizes;
+            picture.appendChild(source);
+            img.srcset = product.photo_jpeg_srcset;
+            img.sizes = sizes;
+            picture.appendChild(img);
+            link.appendChild(picture);
+        } else {
+            link.appendChild(img);
+        }
         cardDiv.appendChild(link);
 
         // Card body
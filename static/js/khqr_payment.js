@@ -6,7 +6,7 @@
 class KHQRPayment {
     constructor() {
         this.currentPayment = null;
-        this.statusCheckInterval = null;
+        this.statusWatcher = null;
         this.successCallback = null;
         this.errorCallback = null;
         this.suppressOwnModal = false; // Flag to suppress internal modal when used from cart
@@ -359,9 +359,18 @@ class KHQRPayment {
 
         console.log('🔍 Starting payment status checking...');
 
-        this.statusCheckInterval = setInterval(async () => {
-            await this.checkPaymentStatus();
-        }, 3000); // Check every 3 seconds
+        // The server pushes completion over a long-poll; ask the bank ourselves only while
+        // no payment verifier is checking this payment (see payment_events.js)
+        this.statusWatcher = watchPaymentEvents(`/api/khqr/payment-events/${this.currentPayment.payment_id}`, {
+            onEvent: result => {
+                if (result.status === 'completed') {
+                    this.onPaymentSuccess(result);
+                    return true;
+                }
+                return false;
+            },
+            check: () => this.checkPaymentStatus()
+        });
     }
 
     /**
@@ -407,9 +416,9 @@ class KHQRPayment {
         console.log('🎉 Payment success handler called with result:', result);
 
         // Stop status checking
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
-            this.statusCheckInterval = null;
+        if (this.statusWatcher) {
+            this.statusWatcher.stop();
+            this.statusWatcher = null;
         }
 
         // Update status display (if still visible)
@@ -549,9 +558,9 @@ class KHQRPayment {
      */
     onPaymentError(errorMessage) {
         // Stop status checking
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
-            this.statusCheckInterval = null;
+        if (this.statusWatcher) {
+            this.statusWatcher.stop();
+            this.statusWatcher = null;
         }
 
         // Update status display
@@ -618,9 +627,9 @@ class KHQRPayment {
 
         try {
             // Stop any existing status checking
-            if (this.statusCheckInterval) {
-                clearInterval(this.statusCheckInterval);
-                this.statusCheckInterval = null;
+            if (this.statusWatcher) {
+                this.statusWatcher.stop();
+                this.statusWatcher = null;
             }
 
             // Create test order via API
@@ -676,9 +685,9 @@ class KHQRPayment {
             console.log('❌ Payment cancelled by user');
             
             // Stop status checking
-            if (this.statusCheckInterval) {
-                clearInterval(this.statusCheckInterval);
-                this.statusCheckInterval = null;
+            if (this.statusWatcher) {
+                this.statusWatcher.stop();
+                this.statusWatcher = null;
             }
 
             // If we have a payment session, call the cancellation API
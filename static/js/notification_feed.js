@@ -0,0 +1,98 @@
+// Notification feed: read the customer's notifications only when they changed.
+// fetchNotifications() sends the last ETag; an unchanged list answers 304 without a
+// database query and the copy kept in sessionStorage (shared by all pages of the tab) is
+// returned. watchNotifications(onChange) asks the events endpoint whether the version
+// moved - long-polling, or an EventSource stream when the server offers one - and calls
+// onChange only when it did.
+
+const NOTIFICATION_FEED_URL = '/api/customer/notifications';
+const NOTIFICATION_FEED_CACHE_KEY = 'notification_feed';
+let notificationFeedVersion = null;
+
+function fetchNotifications() {
+    let cached = null;
+    try {
+        cached = JSON.parse(sessionStorage.getItem(NOTIFICATION_FEED_CACHE_KEY));
+    } catch (error) {
+        cached = null;
+    }
+    const headers = cached && cached.etag ? { 'If-None-Match': cached.etag } : {};
+
+    return fetch(NOTIFICATION_FEED_URL, { headers, cache: 'no-store' })
+        .then(response => {
+            if (response.status === 304 && cached) {
+                notificationFeedVersion = cached.data.version;
+                return cached.data;
+            }
+            return response.json().then(data => {
+                const etag = response.headers.get('ETag');
+                if (data.success) {
+                    notificationFeedVersion = data.version;
+                    try {
+                        sessionStorage.setItem(NOTIFICATION_FEED_CACHE_KEY, JSON.stringify({ etag, data }));
+                    } catch (error) {
+                        // Storage full or disabled: the next read is simply unconditional
+                    }
+                }
+                return data;
+            });
+        });
+}
+
+function watchNotifications(onChange, { errorDelayMs = 30000 } = {}) {
+    let stopped = false;
+    let source = null;
+    let version = notificationFeedVersion;
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+    const changed = newVersion => {
+        if (newVersion === version) {
+            return;
+        }
+        version = newVersion;
+        Promise.resolve(onChange()).catch(error => console.error('Error refreshing notifications:', error));
+    };
+
+    (async () => {
+        while (!stopped) {
+            try {
+                const url = version === null ? `${NOTIFICATION_FEED_URL}/events`
+                                             : `${NOTIFICATION_FEED_URL}/events?since=${version}`;
+                const response = await fetch(url, { cache: 'no-store' });
+                const result = await response.json();
+                if (!result.success) {
+                    throw new Error(result.error || 'Failed to check notifications');
+                }
+                if (stopped) {
+                    break;
+                }
+                if (version === null) {
+                    version = result.version;
+                } else if (result.changed) {
+                    changed(result.version);
+                }
+                if (result.stream_url && window.EventSource) {
+                    source = new EventSource(`${result.stream_url}?since=${version}`);
+                    source.addEventListener('version', event => changed(JSON.parse(event.data).version));
+                    break;
+                }
+                if (result.retry_after) {
+                    // Server answered without waiting; ask again later
+                    await sleep(result.retry_after * 1000);
+                }
+            } catch (error) {
+                console.error('Error waiting for notifications:', error);
+                await sleep(errorDelayMs);
+            }
+        }
+    })();
+
+    return {
+        stop() {
+            stopped = true;
+            if (source) {
+                source.close();
+            }
+        }
+    };
+}
@@ -0,0 +1,71 @@
+// Payment events: long-poll a payment status endpoint instead of polling it on a timer.
+// The server holds each request until the status changes (or ~25 s pass), so a waiting
+// page makes a couple of requests a minute and gets the change as soon as it happens.
+// check(), when given, asks about the payment directly (e.g. the bank, for a KHQR payment).
+// It runs only while the response says no server-side verifier covers the payment
+// (verifier_active), and only after a long-poll ended without a change; those long-polls
+// are shortened to checkIntervalMs so the page still asks every few seconds.
+
+function watchPaymentEvents(url, { onEvent, check, checkIntervalMs = 4000, errorDelayMs = 5000 } = {}) {
+    let stopped = false;
+    let version = null;
+    let verifierActive = false;
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+    (async () => {
+        while (!stopped) {
+            let changed = false;
+            try {
+                const separator = url.includes('?') ? '&' : '?';
+                let pollUrl = url;
+                if (version !== null) {
+                    pollUrl += `${separator}since=${version}`;
+                    if (check && !verifierActive) {
+                        pollUrl += `&wait=${checkIntervalMs / 1000}`;
+                    }
+                }
+                const response = await fetch(pollUrl, { cache: 'no-store' });
+                const result = await response.json();
+                if (!result.success) {
+                    throw new Error(result.error || 'Failed to check payment status');
+                }
+                if (stopped) {
+                    break;
+                }
+                version = result.version;
+                changed = result.changed;
+                verifierActive = Boolean(result.verifier_active);
+                // onEvent returns true once there is nothing left to wait for
+                if (onEvent && await onEvent(result)) {
+                    stopped = true;
+                    break;
+                }
+                if (result.retry_after) {
+                    // Server is at its limit of waiting requests; ask again later
+                    await sleep(result.retry_after * 1000);
+                }
+            } catch (error) {
+                console.error('Error waiting for payment status:', error);
+                await sleep(errorDelayMs);
+                continue;
+            }
+
+            if (check && !verifierActive && !changed && !stopped) {
+                try {
+                    // check returns true once the payment is settled
+                    if (await check()) {
+                        stopped = true;
+                    }
+                } catch (error) {
+                    console.error('Error checking payment:', error);
+                }
+            }
+        }
+    })();
+
+    return {
+        stop() {
+            stopped = true;
+        }
+    };
+}
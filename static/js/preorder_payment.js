@@ -8,7 +8,7 @@ class PreOrderPayment {
     constructor() {
         this.paymentModal = null;
         this.currentSession = null;
-        this.statusCheckInterval = null;
+        this.statusWatcher = null;
         this.init();
     }
 
@@ -271,13 +271,19 @@ class PreOrderPayment {
      * Start checking payment status
      */
     startStatusChecking() {
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
-        }
+        this.stopStatusChecking();
         
-        this.statusCheckInterval = setInterval(() => {
-            this.checkPaymentStatus();
-        }, 3000); // Check every 3 seconds
+        // Long-poll the session status (needs payment_events.js) instead of a 3 s timer
+        this.statusWatcher = watchPaymentEvents(`/api/payment/status/${this.currentSession.id}`, {
+            onEvent: data => {
+                if (data.status === 'expired') {
+                    this.updatePaymentStatus('Payment session expired. Please try again.', 'failed');
+                    this.stopStatusChecking();
+                    return true;
+                }
+                return false;
+            }
+        });
     }
 
     /**
@@ -351,9 +357,9 @@ class PreOrderPayment {
      * Stop status checking
      */
     stopStatusChecking() {
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
-            this.statusCheckInterval = null;
+        if (this.statusWatcher) {
+            this.statusWatcher.stop();
+            this.statusWatcher = null;
         }
     }
 
@@ -1502,7 +1502,11 @@ async function exportCustomerOrders(format) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        if (format === 'pdf') {
+        if (format === 'pdf' && response.status === 202) {
+            // PDF is rendered in the background: poll the job, then download the file
+            const job = await response.json();
+            await waitForExportJob(job);
+        } else if (format === 'pdf') {
             // Generate PDF client-side using jsPDF
             const csvData = await response.text();
             generateCustomerOrdersPDF(csvData, selectedIds.length);
@@ -1528,6 +1532,27 @@ async function exportCustomerOrders(format) {
     }
 }
 
+async function waitForExportJob(job) {
+    showMessage('Generating PDF report in the background...', 'info');
+    for (let attempt = 0; attempt < 150; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const statusResponse = await fetch(job.status_url);
+        const status = await statusResponse.json();
+        if (!status.success) {
+            throw new Error(status.error || 'Export not found');
+        }
+        if (status.status === 'done') {
+            window.location.href = status.download_url;
+            showMessage('PDF report downloaded successfully!', 'success');
+            return;
+        }
+        if (status.status === 'failed') {
+            throw new Error(status.error || 'PDF generation failed');
+        }
+    }
+    throw new Error('PDF generation is taking too long, please try again later');
+}
+
 function generateCustomerOrdersPDF(csvData, customerCount) {
     try {
         // Check if jsPDF is available
@@ -0,0 +1,63 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from utils.keyset import KeysetPager, decode_cursor, encode_cursor, seek_predicate
+
+
+@pytest.mark.parametrize('values', [
+    [datetime(2025, 3, 1, 14, 30, 5), 1042],
+    [date(2025, 1, 31), 'Ünïcode name', 7],
+    [Decimal('1299.99'), 3],
+    ['ACER NITRO 5', 12],
+])
+def test_cursor_round_trip(values):
+    token = encode_cursor(values)
+    assert '=' not in token
+    assert decode_cursor(token) == values
+    assert [type(v) for v in decode_cursor(token)] == [type(v) for v in values]
+
+
+def test_cursor_is_url_safe():
+    token = encode_cursor(['?&/+' * 10, 1])
+    assert all(c.isalnum() or c in '-_' for c in token)
+
+
+@pytest.mark.parametrize('values', [None, [], [None, 5], [datetime(2025, 1, 1), None]])
+def test_unusable_key_has_no_cursor(values):
+    assert encode_cursor(values) is None
+
+
+@pytest.mark.parametrize('token', [None, ''])
+def test_empty_cursor_decodes_to_none(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.mark.parametrize('token', ['not a cursor', 'e30', 'W10', 'W3siJiI6MX1d', '%%%'])
+def test_malformed_cursor_raises(token):
+    # e30 = {}, W10 = [], W3siJiI6MX1d = [{"&":1}]
+    with pytest.raises(ValueError, match='Invalid pagination cursor'):
+        decode_cursor(token)
+
+
+def test_seek_predicate_expands_row_comparison():
+    sql, params = seek_predicate(['o.order_date', 'o.id'], ['2025-03-01', 9])
+    assert sql == '((o.order_date < %s) OR (o.order_date = %s AND o.id < %s))'
+    assert params == ['2025-03-01', '2025-03-01', 9]
+
+    sql, _ = seek_predicate(['p.id'], [4], descending=False)
+    assert sql == '((p.id > %s))'
+
+    with pytest.raises(ValueError):
+        seek_predicate(['a', 'b'], [1])
+
+
+def test_pager_seeks_from_previous_page_bookmark():
+    pager = KeysetPager()
+    key = KeysetPager.key('orders', 'completed')
+    assert pager.plan(key, 3, 20) == (None, 40)
+
+    token = pager.remember(key, 2, [datetime(2025, 3, 1), 55])
+    assert pager.plan(key, 3, 20) == ([datetime(2025, 3, 1), 55], 0)
+    assert pager.plan(key, 1, 20, cursor=token) == ([datetime(2025, 3, 1), 55], 0)
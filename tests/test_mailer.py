@@ -0,0 +1,102 @@
+"""Mailer / SMTPPool against the in-process debug SMTP server"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from utils.debug_smtp import DebugSMTPServer
+from utils.mailer import Mailer, SMTPPool
+
+
+@pytest.fixture
+def smtp_server():
+    server = DebugSMTPServer(port=0, echo=False).start()
+    yield server
+    server.stop()
+
+
+def _mailer(port, **kwargs):
+    pool = SMTPPool('localhost', port, 'shop@example.com', 'secret', use_tls=False,
+                    size=1, timeout=5, max_messages=kwargs.pop('max_messages', 100))
+    return Mailer(pool, **kwargs)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_send_reuses_the_connection(smtp_server):
+    mailer = _mailer(smtp_server.port)
+    mailer.send('a@example.com', 'Your OTP', '123456')
+    mailer.send('b@example.com', 'Your OTP', '654321')
+
+    assert [(sender, recipients) for sender, recipients, _ in smtp_server.messages] == [
+        ('shop@example.com', ['a@example.com']),
+        ('shop@example.com', ['b@example.com']),
+    ]
+    assert 'Subject: Your OTP' in smtp_server.messages[0][2]
+    stats = mailer.stats()
+    assert stats['sent'] == 2
+    assert stats['pool']['connections_opened'] == 1
+    assert stats['pool']['connections_reused'] == 1
+
+
+def test_send_recycles_after_max_messages(smtp_server):
+    mailer = _mailer(smtp_server.port, max_messages=2)
+    for i in range(3):
+        mailer.send(f'user{i}@example.com', 'Hi', 'body')
+
+    assert len(smtp_server.messages) == 3
+    pool_stats = mailer.stats()['pool']
+    assert pool_stats['connections_opened'] == 2
+    assert pool_stats['connections_recycled'] == 1
+
+
+def test_queue_sends_batches_over_one_connection(smtp_server):
+    mailer = _mailer(smtp_server.port, batch_size=2)
+    # Hold the outbox so the sender thread sees all five messages at once
+    with mailer._cond:
+        for i in range(5):
+            mailer.queue(f'user{i}@example.com', 'Order update', f'message {i}')
+
+    assert _wait_for(lambda: mailer.stats()['sent'] == 5)
+    assert sorted(recipients[0] for _, recipients, _ in smtp_server.messages) == [
+        f'user{i}@example.com' for i in range(5)
+    ]
+    stats = mailer.stats()
+    assert stats['batches'] == 3
+    assert stats['failed'] == 0
+    assert stats['queued'] == 0
+    assert stats['pool']['connections_opened'] == 1
+
+
+def test_queue_gives_up_after_max_attempts():
+    # A port nothing listens on: every attempt fails to connect
+    with socket.socket() as probe:
+        probe.bind(('localhost', 0))
+        port = probe.getsockname()[1]
+
+    mailer = _mailer(port, max_attempts=3, retry_delay=0.01)
+    given_up = threading.Event()
+    errors = []
+
+    def on_give_up(error):
+        errors.append(error)
+        given_up.set()
+
+    mailer.queue('nobody@example.com', 'Your OTP', '123456', on_give_up=on_give_up)
+
+    assert given_up.wait(5)
+    assert isinstance(errors[0], OSError)
+    stats = mailer.stats()
+    assert stats['retried'] == 2
+    assert stats['failed'] == 1
+    assert stats['sent'] == 0
+    assert stats['queued'] == 0
@@ -0,0 +1,144 @@
+"""OrderPlacement / Product.reduce_stock_bulk against an in-memory stand-in connection"""
+
+import pytest
+
+import models
+from models import OrderPlacement, Product
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, query, params=()):
+        self.conn.statements.append((' '.join(query.split()), list(params)))
+        if query.lstrip().startswith('UPDATE products'):
+            self.rowcount = self.conn.update_rowcount
+        elif query.lstrip().startswith('SELECT id, stock'):
+            self._rows = sorted(self.conn.stock.items())
+
+    def executemany(self, query, rows):
+        self.conn.statements.append((' '.join(query.split()), list(rows)))
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Records statements and transaction calls; UPDATE matches `update_rowcount` rows"""
+
+    def __init__(self, stock, update_rowcount, in_transaction=False):
+        self.stock = stock
+        self.update_rowcount = update_rowcount
+        self.in_transaction = in_transaction
+        self.statements = []
+        self.calls = []
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def start_transaction(self):
+        self.calls.append('start_transaction')
+        self.in_transaction = True
+
+    def commit(self):
+        self.calls.append('commit')
+        self.in_transaction = False
+
+    def rollback(self):
+        self.calls.append('rollback')
+        self.in_transaction = False
+
+    def close(self):
+        pass
+
+    def executed(self, prefix):
+        return [statement for statement in self.statements if statement[0].startswith(prefix)]
+
+
+def test_duplicate_cart_lines_cannot_oversell():
+    lines = [{'product_id': '7', 'quantity': 2}, {'product_id': 7, 'quantity': '2'}]
+    quantities = OrderPlacement.aggregate_quantities(lines)
+    assert quantities == {7: 4}
+
+    products = {7: {'name': 'Laptop', 'stock': 3}}
+    with pytest.raises(ValueError, match='Insufficient stock for Laptop. Available: 3, Requested: 4'):
+        OrderPlacement.validate_stock(products, quantities)
+
+
+def test_validate_stock_rejects_unknown_product():
+    with pytest.raises(ValueError, match='Product with ID 9 not found'):
+        OrderPlacement.validate_stock({}, {9: 1})
+
+
+def test_aggregate_quantities_rejects_non_positive():
+    with pytest.raises(ValueError, match='Invalid quantity 0'):
+        OrderPlacement.aggregate_quantities([{'product_id': 1, 'quantity': 0}])
+
+
+def test_decrement_stock_is_one_guarded_update():
+    conn = FakeConnection({1: 5, 2: 5}, update_rowcount=2)
+    OrderPlacement.decrement_stock(conn, {2: 3, 1: 1})
+
+    [(query, params)] = conn.executed('UPDATE products')
+    assert query == ("UPDATE products SET stock = stock - CASE id WHEN %s THEN %s WHEN %s THEN %s END "
+                     "WHERE id IN (%s,%s) AND stock >= CASE id WHEN %s THEN %s WHEN %s THEN %s END")
+    assert params == [1, 1, 2, 3, 1, 2, 1, 1, 2, 3]
+    [(_, rows)] = conn.executed('INSERT INTO inventory')
+    assert rows == [(1, -1), (2, -3)]
+
+
+def test_decrement_stock_rowcount_shortfall_raises():
+    # Validation passed, but a concurrent checkout took product 2's stock before the UPDATE
+    conn = FakeConnection({1: 5, 2: 0}, update_rowcount=1)
+    with pytest.raises(ValueError, match='inventory changed'):
+        OrderPlacement.decrement_stock(conn, {1: 1, 2: 1})
+    assert conn.executed('INSERT INTO inventory') == []
+
+
+def test_decrement_stock_backorder_skips_guard():
+    conn = FakeConnection({1: 0}, update_rowcount=1)
+    OrderPlacement.decrement_stock(conn, {1: 2}, allow_backorder=True)
+    [(query, params)] = conn.executed('UPDATE products')
+    assert 'stock >=' not in query
+    assert params == [2, 1]
+
+
+def test_reduce_stock_bulk_rolls_back_and_explains_shortfall(monkeypatch):
+    conn = FakeConnection({1: 5, 2: 1}, update_rowcount=1)
+    monkeypatch.setattr(models, 'get_db', lambda: conn)
+
+    with pytest.raises(ValueError, match='Insufficient stock for product 2. Available: 1, Requested: 2'):
+        Product.reduce_stock_bulk({1: 1, 2: 2})
+
+    assert conn.calls == ['start_transaction', 'rollback']
+    # The shortfall is read after the rollback, from current stock
+    assert conn.statements[-1][0].startswith('SELECT id, stock FROM products')
+
+
+def test_reduce_stock_bulk_inside_caller_transaction_uses_savepoint(monkeypatch):
+    conn = FakeConnection({1: 0}, update_rowcount=0, in_transaction=True)
+    monkeypatch.setattr(models, 'get_db', lambda: conn)
+
+    with pytest.raises(ValueError, match='Insufficient stock for product 1'):
+        Product.reduce_stock_bulk({1: 1})
+
+    assert conn.calls == []
+    assert conn.in_transaction
+    queries = [query for query, _ in conn.statements]
+    assert queries[0] == 'SAVEPOINT reduce_stock'
+    assert 'ROLLBACK TO SAVEPOINT reduce_stock' in queries
+
+
+def test_reduce_stock_bulk_commits_owned_transaction(monkeypatch):
+    conn = FakeConnection({1: 5}, update_rowcount=1)
+    monkeypatch.setattr(models, 'get_db', lambda: conn)
+
+    Product.reduce_stock_bulk({'1': '2'})
+
+    assert conn.calls == ['start_transaction', 'commit']
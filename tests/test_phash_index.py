@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from utils.phash_index import PHASH_BITS, MultiIndexHash, hamming
+
+
+def _flip(value, bits, rng):
+    for bit in rng.sample(range(PHASH_BITS), bits):
+        value ^= 1 << bit
+    return value
+
+
+@pytest.fixture
+def corpus():
+    """Random hashes plus near-duplicates of a few of them, some values stored twice"""
+    rng = random.Random(20250301)
+    values = [rng.getrandbits(PHASH_BITS) for _ in range(400)]
+    for base in values[:40]:
+        values.extend(_flip(base, rng.randint(0, 10), rng) for _ in range(5))
+    values.extend(values[:10])
+    return values, rng
+
+
+def test_search_matches_brute_force(corpus):
+    values, rng = corpus
+    index = MultiIndexHash()
+    for row_id, value in enumerate(values):
+        index.add(value, row_id)
+    assert len(index) == len(values)
+
+    queries = values[:60] + [_flip(v, rng.randint(1, 6), rng) for v in values[:60]]
+    queries += [rng.getrandbits(PHASH_BITS) for _ in range(20)]
+    for query in queries:
+        for max_distance in range(MultiIndexHash.CHUNKS):
+            expected = sorted((hamming(query, value), row_id) for row_id, value in enumerate(values)
+                              if hamming(query, value) <= max_distance)
+            assert sorted(index.search(query, max_distance)) == expected
+
+
+def test_search_rejects_distance_beyond_pigeonhole_bound():
+    with pytest.raises(ValueError):
+        MultiIndexHash().search(0, MultiIndexHash.CHUNKS)
+
+
+def test_hamming():
+    assert hamming(0, 0) == 0
+    assert hamming(0, (1 << 64) - 1) == 64
+    assert hamming(0b1010, 0b0110) == 2
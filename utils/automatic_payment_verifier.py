@@ -1,23 +1,48 @@
 """
 Automatic Payment Verification System
 Continuously checks for completed QR payments and updates pending orders
+
+Every gunicorn worker runs a verifier thread, but only the one holding the MySQL lock
+LOCK_NAME (GET_LOCK, kept on a dedicated connection) checks payments; the others retry
+every election_interval seconds and take over if the leader's connection goes away.
+Each cycle the leader reads all pending QR orders with their newest pending
+payment_tracking row in one query, asks the bank about the orders that are due using
+a bounded thread pool, and schedules the next check per order by age: new orders every
+check_interval seconds, older ones backing off to max_backoff.
+
+Payment pages ask covers() (through the payment-events responses) whether the leader
+will check their payment; only when it won't do they ask the bank themselves.
 """
 
+import os
 import time
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import Dict, Any, List
-from models import get_db
+from typing import Dict, Any, List, Optional
+from models import get_db, SalesRollup
+from utils.query_predicates import qr_payment_method
+from utils.schema_registry import schema_registry
 from utils.khqr_payment import khqr_handler
 from utils.payment_session_manager import PaymentSessionManager
+from utils.payment_events import payment_events
+
+# Seconds of history behind checks_per_second
+RATE_WINDOW = 60
 
 class AutomaticPaymentVerifier:
     """
     Automatically verifies QR payments and updates order status
     Runs in background to check for completed payments
     """
-    
-    def __init__(self, check_interval: int = 30, app=None, test_mode: bool = False):
+
+    LOCK_NAME = 'computershop_payment_verifier'
+    # Delay until an order's next check, as a fraction of its age
+    BACKOFF_FACTOR = 0.1
+
+    def __init__(self, check_interval: int = 30, app=None, test_mode: bool = False,
+                 workers: int = 4, max_backoff: float = 300, election_interval: float = 15):
         """
         Initialize the automatic payment verifier
         
@@ -25,6 +50,9 @@ class AutomaticPaymentVerifier:
             check_interval: How often to check for payments (in seconds)
             app: Flask app instance for application context
             test_mode: If True, payments are detected immediately for testing
+            workers: Bank status checks run at once (per cycle)
+            max_backoff: Longest gap between two checks of an old pending order (in seconds)
+            election_interval: How often a standby worker tries to become the leader (in seconds)
         """
         self.check_interval = check_interval
         self.running = False
@@ -32,209 +60,338 @@ class AutomaticPaymentVerifier:
         self.payment_manager = PaymentSessionManager()
         self.app = app
         self.test_mode = test_mode
+        self.workers = workers
+        self.max_backoff = max_backoff
+        self.election_interval = election_interval
+        self._pid = None
+        self._lock = threading.Lock()
+        self._lock_conn = None
+        self._leader_seen = (False, 0.0)  # (some worker holds LOCK_NAME, checked at)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._next_check: Dict[int, float] = {}
+        self._last_pending_check: Dict[int, float] = {}
+        self._recent_checks = deque()
+        self._stats = {
+            'cycles': 0,
+            'checks': 0,
+            'backed_off': 0,
+            'detected': 0,
+            'errors': 0,
+            'elections_won': 0,
+            'detection_latency_total_s': 0.0,
+            'detection_latency_max_s': 0.0,
+        }
         
     def start(self):
         """Start the automatic payment verification"""
-        if self.running:
-            print("⚠️ Automatic payment verifier is already running")
+        with self._lock:
+            if self.running and self._pid == os.getpid():
+                print("⚠️ Automatic payment verifier is already running")
+                return
+            self._spawn()
+        print(f"✅ Automatic payment verifier started (checking every {self.check_interval} seconds)")
+
+    def ensure_started(self):
+        """Start in this process unless already running here (workers fork after create_app)"""
+        if self._pid == os.getpid():
             return
-            
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._spawn()
+        print(f"✅ Automatic payment verifier started in worker {os.getpid()}")
+
+    def _spawn(self):
+        # A forked worker inherits neither the parent's thread nor its lock connection
         self.running = True
+        self._pid = os.getpid()
+        self._lock_conn = None
+        self._executor = None
         self.thread = threading.Thread(target=self._verification_loop, daemon=True)
         self.thread.start()
-        print(f"✅ Automatic payment verifier started (checking every {self.check_interval} seconds)")
         
     def stop(self):
         """Stop the automatic payment verification"""
         self.running = False
         if self.thread:
             self.thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         print("🛑 Automatic payment verifier stopped")
         
     def _verification_loop(self):
-        """Main verification loop that runs in background"""
+        """Main verification loop: check payments while leader, otherwise stand by"""
         while self.running:
             try:
-                if self.app:
-                    with self.app.app_context():
-                        self._check_all_pending_payments()
-                else:
+                if not self.app:
                     print("⚠️ No Flask app context available for payment verification")
-                time.sleep(self.check_interval)
+                    time.sleep(self.check_interval)
+                    continue
+                with self.app.app_context():
+                    leader = self._hold_leadership()
+                    if leader:
+                        self._check_all_pending_payments()
+                time.sleep(self.check_interval if leader else self.election_interval)
             except Exception as e:
                 print(f"❌ Error in payment verification loop: {e}")
                 time.sleep(self.check_interval)
-                
-    def _check_all_pending_payments(self):
-        """Check all pending payments for completion"""
+        if self.app:
+            with self.app.app_context():
+                self._release_leadership()
+
+    def _hold_leadership(self) -> bool:
+        """True while this worker holds LOCK_NAME; a standby worker tries to take it"""
+        if self._lock_conn is not None:
+            try:
+                cur = self._lock_conn.cursor()
+                cur.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.LOCK_NAME,))
+                held = cur.fetchone()[0] == 1
+                cur.close()
+                if held:
+                    return True
+            except Exception as e:
+                print(f"⚠️ Payment verifier lock connection failed: {e}")
+            print(f"⚠️ Worker {os.getpid()} lost payment verifier leadership")
+            self._release_leadership()
+
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+            acquired = cur.fetchone()[0] == 1
+            cur.close()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+
+        self._lock_conn = conn
+        with self._lock:
+            self._stats['elections_won'] += 1
+        print(f"👑 Worker {os.getpid()} is now the payment verifier leader")
+        return True
+
+    def _release_leadership(self):
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is None:
+            return
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+            cur.fetchone()
+            cur.close()
+        except Exception:
+            pass
+        finally:
+            conn.close()
+
+    def leader_active(self) -> bool:
+        """True while some worker holds LOCK_NAME; looked up at most once per election_interval"""
+        if self._lock_conn is not None and self._pid == os.getpid():
+            return True
+        active, checked_at = self._leader_seen
+        now = time.time()
+        if now - checked_at < self.election_interval:
+            return active
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT IS_USED_LOCK(%s) IS NOT NULL", (self.LOCK_NAME,))
+            active = cur.fetchone()[0] == 1
+        finally:
+            cur.close()
+            conn.close()
+        self._leader_seen = (active, now)
+        return active
+
+    def covers(self, order_id: Optional[int] = None, payment_id: Optional[str] = None) -> bool:
+        """
+        True when the leader checks this order's (or KHQR payment's) status with the bank
+        itself: a pending QR order with a pending payment_tracking row holding the md5 hash.
+        Anything else, e.g. a KHQR payment with no order yet, is left to the client.
+        """
+        if (order_id is None) == (payment_id is None):
+            raise ValueError("Pass exactly one of order_id and payment_id")
         try:
-            # Get all pending orders with KHQR_BAKONG payment method
+            if not (schema_registry.has_table('payment_tracking')
+                    and schema_registry.has_column('payment_tracking', 'md5_hash')
+                    and self.leader_active()):
+                return False
+            method_sql, method_params = qr_payment_method('o.payment_method')
+            key_sql, key = ('o.id = %s', order_id) if order_id is not None else ('pt.payment_id = %s', payment_id)
             conn = get_db()
-            cur = conn.cursor(dictionary=True)
-            
+            cur = conn.cursor()
             try:
-                # Get all pending orders for instant detection (no time restriction)
-                # Check for various KHQR payment method names
-                cur.execute("""
-                    SELECT o.id, o.transaction_id, o.total_amount, o.order_date, o.customer_id, o.payment_method
+                cur.execute(f"""
+                    SELECT 1
                     FROM orders o
-                    WHERE o.status = 'PENDING' 
-                    AND (o.payment_method = 'KHQR_BAKONG' 
-                         OR o.payment_method LIKE '%KHQR%' 
-                         OR o.payment_method LIKE '%QR%'
-                         OR o.payment_method = 'KHQR Payment')
+                    JOIN payment_tracking pt ON pt.order_id = o.id
+                    WHERE {key_sql}
+                    AND o.status = 'PENDING'
+                    AND {method_sql}
                     AND o.transaction_id IS NOT NULL
-                    ORDER BY o.order_date ASC
-                """)
-                
-                pending_orders = cur.fetchall()
-                
-                if pending_orders:
-                    print(f"🔍 Checking {len(pending_orders)} pending QR payments...")
-                    
-                    for order in pending_orders:
-                        self._check_single_payment(order)
-                else:
-                    # Only log this message once per minute to avoid spam
-                    current_time = time.time()
-                    if not hasattr(self, '_last_no_orders_log') or current_time - self._last_no_orders_log > 60:
-                        # Debug: Check what payment methods are actually in pending orders
-                        cur.execute("""
-                            SELECT payment_method, COUNT(*) as count
-                            FROM orders o
-                            WHERE o.status = 'PENDING'
-                            GROUP BY payment_method
-                        """)
-                        results = cur.fetchall()
-                        if results:
-                            print(f"ℹ️ Found pending orders with these payment methods:")
-                            for row in results:
-                                print(f"   - {row['payment_method']}: {row['count']} orders")
-                            print("   (will check again in 1 minute)")
-                        else:
-                            print("ℹ️ No pending orders found")
-                        self._last_no_orders_log = current_time
-                        
+                    AND pt.status = 'pending'
+                    AND pt.md5_hash IS NOT NULL
+                    LIMIT 1
+                """, [key] + method_params)
+                return cur.fetchone() is not None
             finally:
                 cur.close()
                 conn.close()
-                
+        except Exception as e:
+            print(f"⚠️ Could not tell whether the payment verifier covers {order_id or payment_id}: {e}")
+            return False
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='payment-check')
+        return self._executor
+                
+    def _pending_orders(self) -> List[Dict[str, Any]]:
+        """Pending QR orders with their newest pending payment_tracking row, in one query"""
+        if not schema_registry.has_table('payment_tracking'):
+            return []
+        columns = schema_registry.columns('payment_tracking')
+
+        # Tracking row for the order, else one whose transaction/payment/reference id
+        # matches the order's transaction_id
+        tracking_id = """(SELECT p1.id FROM payment_tracking p1
+                          WHERE p1.order_id = o.id AND p1.status = 'pending'
+                          ORDER BY p1.created_at DESC LIMIT 1)"""
+        by_transaction = [f"p2.{column} = o.transaction_id"
+                          for column in ('transaction_id', 'payment_id', 'reference_id') if column in columns]
+        if by_transaction:
+            tracking_id = f"""COALESCE({tracking_id},
+                              (SELECT p2.id FROM payment_tracking p2
+                               WHERE ({' OR '.join(by_transaction)}) AND p2.status = 'pending'
+                               ORDER BY p2.created_at DESC LIMIT 1))"""
+        md5_column = 'pt.md5_hash' if 'md5_hash' in columns else 'NULL'
+
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        try:
+            method_sql, method_params = qr_payment_method('o.payment_method')
+            cur.execute(f"""
+                SELECT o.id, o.transaction_id, o.total_amount, o.order_date, o.customer_id, o.payment_method,
+                       pt.id AS tracking_id, pt.payment_id, {md5_column} AS md5_hash
+                FROM orders o
+                JOIN payment_tracking pt ON pt.id = {tracking_id}
+                WHERE o.status = 'PENDING'
+                AND {method_sql}
+                AND o.transaction_id IS NOT NULL
+                ORDER BY o.order_date ASC
+            """, method_params)
+            return cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+    def _check_all_pending_payments(self):
+        """Check the pending payments that are due, a bounded number at a time"""
+        try:
+            orders = self._pending_orders()
+            now = time.time()
+            with self._lock:
+                pending_ids = {order['id'] for order in orders}
+                for order_id in list(self._next_check):
+                    if order_id not in pending_ids:
+                        self._next_check.pop(order_id, None)
+                        self._last_pending_check.pop(order_id, None)
+                due = [order for order in orders if self._next_check.get(order['id'], 0) <= now]
+                self._stats['cycles'] += 1
+                self._stats['backed_off'] += len(orders) - len(due)
+
+            if not due:
+                # Only log this message once per minute to avoid spam
+                if not orders and now - getattr(self, '_last_no_orders_log', 0) > 60:
+                    print("ℹ️ No pending QR payments to check")
+                    self._last_no_orders_log = now
+                return
+
+            print(f"🔍 Checking {len(due)} of {len(orders)} pending QR payments...")
+            wait([self._pool().submit(self._check_in_context, order) for order in due])
+
         except Exception as e:
             print(f"❌ Error checking pending payments: {e}")
+
+    def _check_in_context(self, order: Dict[str, Any]):
+        with self.app.app_context():
+            self._check_single_payment(order)
+
+    def _order_age(self, order: Dict[str, Any]) -> float:
+        order_date = order['order_date']
+        if isinstance(order_date, str):
+            order_date = datetime.strptime(order_date, '%Y-%m-%d %H:%M:%S')
+        return max(0.0, (datetime.now() - order_date).total_seconds())
+
+    def _next_delay(self, order: Dict[str, Any]) -> float:
+        """New orders are checked every check_interval; older ones less often, up to max_backoff"""
+        return min(self.max_backoff, max(self.check_interval, self._order_age(order) * self.BACKOFF_FACTOR))
+
+    def _bank_reports_paid(self, order: Dict[str, Any]) -> bool:
+        if self.test_mode:
+            return True
+        if not (khqr_handler and khqr_handler.khqr):
+            print(f"⚠️ KHQR handler not available for order {order['id']}")
+            return False
+        if order['md5_hash']:
+            return khqr_handler.khqr.check_payment(order['md5_hash']) == "PAID"
+        # Without a stored hash only the worker that created the QR can ask the bank
+        if order['payment_id'] in khqr_handler.active_payments:
+            payment_status = khqr_handler.check_payment_status(order['payment_id'])
+            return bool(payment_status.get('success')) and payment_status.get('status') == 'completed'
+        return False
             
     def _check_single_payment(self, order: Dict[str, Any]):
-        """Check a single pending payment"""
+        """Check a single pending payment with the bank and schedule its next check"""
+        order_id = order['id']
         try:
-            order_id = order['id']
-            transaction_id = order['transaction_id']
-            amount = float(order['total_amount'])
-            
-            # Check if we have a payment session for this order
-            payment_session = self._find_payment_session_by_order(order_id)
-            
-            if payment_session:
-                # Use the payment tracking's payment_id to check status
-                payment_id = payment_session['payment_id']
-                print(f"🔍 Checking payment for order {order_id} (payment_id: {payment_id})")
-                
-                # Check payment status using KHQR handler
-                if khqr_handler and khqr_handler.khqr:
-                    payment_status = khqr_handler.check_payment_status(payment_id)
-                    
-                    if payment_status.get('success') and payment_status.get('status') == 'completed':
-                        print(f"✅ Payment completed for order {order_id}!")
-                        self._complete_order_payment(order_id, payment_session)
-                    else:
-                        print(f"⏳ Payment still pending for order {order_id}")
-                else:
-                    print(f"⚠️ KHQR handler not available for order {order_id}")
-            else:
-                # No payment session found - this is normal for KHQR orders created through checkout
-                # For these orders, we need to check if payment was made using the transaction ID
-                # We'll simulate automatic detection by checking if enough time has passed
-                # In a real system, this would check the bank's API using the transaction ID
-                
-                # For real-world scenarios, we need to check if payment was actually made
-                # Since we can't access bank APIs directly, we'll use a different approach:
-                # 1. Check if order has been "paid" by looking for payment confirmation
-                # 2. For demo purposes, we'll simulate random payment completion
-                # 3. In production, this would integrate with actual bank APIs
-                
-                from datetime import datetime, timedelta
-                import random
-                
-                order_date = order['order_date']
-                if isinstance(order_date, str):
-                    order_date = datetime.strptime(order_date, '%Y-%m-%d %H:%M:%S')
-                
-                time_since_order = datetime.now() - order_date
-                
-                # Simplified instant payment detection
-                from datetime import datetime, timedelta
-                
-                order_date = order['order_date']
-                if isinstance(order_date, str):
-                    order_date = datetime.strptime(order_date, '%Y-%m-%d %H:%M:%S')
-                
-                time_since_order = datetime.now() - order_date
-                
-                # Check if we have a payment session for this order
-                payment_session = self._find_payment_session_by_order(order_id)
-                
-                if payment_session:
-                    # Use the payment session's payment_id to check status
-                    payment_id = payment_session['session_id']
-                    print(f"🔍 Checking payment for order {order_id} (session: {payment_id})")
-                    
-                    # Check payment status using KHQR handler
-                    if khqr_handler and khqr_handler.khqr:
-                        payment_status = khqr_handler.check_payment_status(payment_id)
-                        
-                        if payment_status.get('success') and payment_status.get('status') == 'completed':
-                            print(f"✅ Payment completed for order {order_id}!")
-                            self._complete_order_payment(order_id, payment_session)
-                        else:
-                            print(f"⏳ Payment still pending for order {order_id}")
-                    else:
-                        print(f"⚠️ KHQR handler not available for order {order_id}")
-                else:
-                    # No payment session found - check using transaction_id and MD5 hash
-                    transaction_id = order.get('transaction_id')
-                    if transaction_id:
-                        print(f"🔍 Checking payment for order {order_id} using transaction_id: {transaction_id}")
-                        
-                        # Use KHQR handler to check payment with transaction ID
-                        if khqr_handler and khqr_handler.khqr:
-                            # Try to check payment status using the transaction ID
-                            try:
-                                print(f"🔍 Checking real payment status for transaction {transaction_id}")
-                                
-                                # Check if we have a payment session with this transaction ID
-                                payment_session = self._find_payment_session_by_transaction_id(transaction_id)
-                                
-                                if payment_session:
-                                    # Use the payment session to check status
-                                    payment_id = payment_session['session_id']
-                                    payment_status = khqr_handler.check_payment_status(payment_id)
-                                    
-                                    if payment_status.get('success') and payment_status.get('status') == 'completed':
-                                        print(f"✅ Payment completed for order {order_id}!")
-                                        self._complete_order_payment(order_id, payment_session)
-                                    else:
-                                        print(f"⏳ Payment still pending for order {order_id}")
-                                else:
-                                    # No payment session found - wait for real payment verification
-                                    print(f"⏳ Order {order_id} waiting for real payment verification (no payment session found)")
-                                
-                            except Exception as e:
-                                print(f"❌ Error checking payment status: {e}")
-                        else:
-                            print(f"⚠️ KHQR handler not available for order {order_id}")
-                    else:
-                        print(f"⚠️ No transaction_id found for order {order_id}")
-                
+            paid = self._bank_reports_paid(order)
         except Exception as e:
             print(f"❌ Error checking payment for order {order_id}: {e}")
+            paid = False
+            with self._lock:
+                self._stats['errors'] += 1
+
+        checked_at = time.time()
+        with self._lock:
+            self._stats['checks'] += 1
+            self._recent_checks.append(checked_at)
+            while self._recent_checks and checked_at - self._recent_checks[0] > RATE_WINDOW:
+                self._recent_checks.popleft()
+            if not paid:
+                self._last_pending_check[order_id] = checked_at
+                self._next_check[order_id] = checked_at + self._next_delay(order)
+                return
+            # The payment happened at most this long before we saw it
+            previous = self._last_pending_check.pop(order_id, checked_at - self._order_age(order))
+            latency = checked_at - previous
+            self._next_check.pop(order_id, None)
+            self._stats['detected'] += 1
+            self._stats['detection_latency_total_s'] += latency
+            self._stats['detection_latency_max_s'] = max(self._stats['detection_latency_max_s'], latency)
+
+        print(f"✅ Payment completed for order {order_id}! (detected within {latency:.1f}s)")
+        self._complete_order_payment(order_id, {'id': order['tracking_id'], 'payment_id': order['payment_id']})
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            while self._recent_checks and now - self._recent_checks[0] > RATE_WINDOW:
+                self._recent_checks.popleft()
+            stats = dict(self._stats)
+            stats['checks_per_second'] = round(len(self._recent_checks) / RATE_WINDOW, 3)
+            stats['scheduled_orders'] = len(self._next_check)
+        total = stats.pop('detection_latency_total_s')
+        stats['detection_latency_avg_s'] = round(total / stats['detected'], 1) if stats['detected'] else None
+        stats['detection_latency_max_s'] = round(stats['detection_latency_max_s'], 1)
+        stats['leader'] = self._lock_conn is not None and self._pid == os.getpid()
+        stats['running'] = self.running and self._pid == os.getpid()
+        stats['workers'] = self.workers
+        return stats
     
     def _check_real_payment_status(self, order_id: int, order: Dict[str, Any]):
         """Check real payment status using bank API"""
@@ -269,86 +426,6 @@ class AutomaticPaymentVerifier:
         except Exception as e:
             print(f"❌ Error simulating payment completion for order {order_id}: {e}")
             
-    def _find_payment_session_by_order(self, order_id: int) -> Dict[str, Any]:
-        """Find payment tracking by order ID"""
-        try:
-            conn = get_db()
-            cur = conn.cursor(dictionary=True)
-            
-            try:
-                cur.execute("""
-                    SELECT * FROM payment_tracking 
-                    WHERE order_id = %s AND status = 'pending'
-                    ORDER BY created_at DESC LIMIT 1
-                """, (order_id,))
-                
-                return cur.fetchone()
-                
-            finally:
-                cur.close()
-                conn.close()
-                
-        except Exception as e:
-            print(f"❌ Error finding payment tracking for order {order_id}: {e}")
-            return None
-    
-    def _find_payment_session_by_transaction_id(self, transaction_id: str) -> Dict[str, Any]:
-        """Find payment tracking by transaction ID"""
-        try:
-            conn = get_db()
-            cur = conn.cursor(dictionary=True)
-            
-            try:
-                # Check if payment_tracking table exists
-                cur.execute("SHOW TABLES LIKE 'payment_tracking'")
-                if not cur.fetchone():
-                    print(f"⚠️ payment_tracking table does not exist - skipping payment lookup")
-                    return None
-                
-                # Check what columns exist in the table
-                cur.execute("DESCRIBE payment_tracking")
-                columns = [row[0] for row in cur.fetchall()]
-                print(f"📋 Available columns in payment_tracking: {columns}")
-                
-                # Build query based on available columns
-                where_conditions = []
-                params = []
-                
-                if 'transaction_id' in columns:
-                    where_conditions.append("transaction_id = %s")
-                    params.append(transaction_id)
-                if 'payment_id' in columns:
-                    where_conditions.append("payment_id = %s")
-                    params.append(transaction_id)
-                if 'reference_id' in columns:
-                    where_conditions.append("reference_id = %s")
-                    params.append(transaction_id)
-                
-                if not where_conditions:
-                    print(f"⚠️ No matching columns found for transaction lookup")
-                    return None
-                
-                where_clause = " OR ".join(where_conditions)
-                status_condition = " AND status = 'pending'" if 'status' in columns else ""
-                
-                query = f"""
-                    SELECT * FROM payment_tracking 
-                    WHERE ({where_clause}) {status_condition}
-                    ORDER BY created_at DESC LIMIT 1
-                """
-                
-                cur.execute(query, params)
-                
-                return cur.fetchone()
-                
-            finally:
-                cur.close()
-                conn.close()
-                
-        except Exception as e:
-            print(f"❌ Error finding payment tracking for transaction {transaction_id}: {e}")
-            return None
-            
     def _complete_order_payment(self, order_id: int, payment_session: Dict[str, Any]):
         """Complete the order payment and update status"""
         try:
@@ -358,10 +435,12 @@ class AutomaticPaymentVerifier:
             try:
                 # Update order status to COMPLETED (payment detected)
                 # But keep approval_status as PENDING until admin manually approves
+                # Only while still PENDING: a concurrent check or the customer's own KHQR
+                # status check may have completed it already
                 cur.execute("""
                     UPDATE orders 
                     SET status = 'COMPLETED'
-                    WHERE id = %s
+                    WHERE id = %s AND status = 'PENDING'
                 """, (order_id,))
                 
                 # Update payment tracking status if payment_session exists
@@ -372,15 +451,14 @@ class AutomaticPaymentVerifier:
                         WHERE id = %s
                     """, (payment_session['id'],))
                 
-                # Reduce stock for order items
-                cur.execute("""
-                    UPDATE products p
-                    JOIN order_items oi ON p.id = oi.product_id
-                    SET p.stock = p.stock - oi.quantity
-                    WHERE oi.order_id = %s AND p.stock >= oi.quantity
-                """, (order_id,))
-                
+                # No stock change here: checkout already reserved the items
                 conn.commit()
+                SalesRollup.record_orders([order_id])
+                payment_events.publish_order(order_id, 'completed')
+                if payment_session and payment_session.get('payment_id'):
+                    payment_events.publish(f"khqr:{payment_session['payment_id']}", 'completed',
+                                           payment_id=payment_session['payment_id'], order_id=order_id,
+                                           invoice_url=f'/invoice/{order_id}')
                 
                 print(f"✅ Order {order_id} payment detected!")
                 print(f"   - Payment Status: PENDING → COMPLETED")
@@ -389,7 +467,6 @@ class AutomaticPaymentVerifier:
                     print(f"   - Payment tracking: {payment_session.get('payment_id', 'N/A')}")
                 else:
                     print(f"   - Payment tracking: Direct order completion")
-                print(f"   - Stock reduced for order items")
                 
             except Exception as e:
                 conn.rollback()
@@ -416,21 +493,15 @@ class AutomaticPaymentVerifier:
                     WHERE id = %s
                 """, (order_id,))
                 
-                # Reduce stock for order items
-                cur.execute("""
-                    UPDATE products p
-                    JOIN order_items oi ON p.id = oi.product_id
-                    SET p.stock = p.stock - oi.quantity
-                    WHERE oi.order_id = %s AND p.stock >= oi.quantity
-                """, (order_id,))
-                
+                # No stock change here: checkout already reserved the items
                 conn.commit()
+                SalesRollup.record_orders([order_id])
+                payment_events.publish_order(order_id, 'completed')
                 
                 print(f"✅ Order {order_id} payment automatically detected!")
                 print(f"   - Payment Status: PENDING → COMPLETED")
                 print(f"   - Approval Status: PENDING (waiting for admin approval)")
                 print(f"   - Transaction ID: {transaction_id}")
-                print(f"   - Stock reduced for order items")
                 
             except Exception as e:
                 conn.rollback()
@@ -481,8 +552,22 @@ class AutomaticPaymentVerifier:
 # Global instance - will be initialized with Flask app
 payment_verifier = None
 
-def initialize_payment_verifier(app, check_interval=2, test_mode=False):
-    """Initialize the payment verifier with Flask app context"""
+
+def verifier_covers(order_id: Optional[int] = None, payment_id: Optional[str] = None) -> bool:
+    """AutomaticPaymentVerifier.covers for the global verifier; False when it is disabled"""
+    if payment_verifier is None:
+        return False
+    return payment_verifier.covers(order_id=order_id, payment_id=payment_id)
+
+def initialize_payment_verifier(app, check_interval=None, test_mode=False):
+    """Initialize the payment verifier with Flask app context (settings from Config)"""
     global payment_verifier
-    payment_verifier = AutomaticPaymentVerifier(check_interval=check_interval, app=app, test_mode=test_mode)
-    return payment_verifier
\ No newline at end of file
+    from config import Config
+    if payment_verifier is not None and payment_verifier.app is app:
+        return payment_verifier
+    payment_verifier = AutomaticPaymentVerifier(check_interval=check_interval or Config.PAYMENT_VERIFIER_INTERVAL,
+                                                app=app, test_mode=test_mode,
+                                                workers=Config.PAYMENT_VERIFIER_WORKERS,
+                                                max_backoff=Config.PAYMENT_VERIFIER_MAX_BACKOFF,
+                                                election_interval=Config.PAYMENT_VERIFIER_ELECTION_INTERVAL)
+    return payment_verifier
@@ -234,30 +234,8 @@ class BakongAPIClient:
             Base64 encoded QR code image
         """
         try:
-            from PIL import Image, ImageDraw
-            import qrcode
-            import io
-            import base64
-            
-            # Generate QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            # Create image
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            
-            return img_str
+            from utils.qr_images import qr_images
+            return qr_images.base64(qr_data, box_size=10, border=4)
             
         except Exception as e:
             print(f"Error generating QR code image: {e}")
@@ -5,8 +5,6 @@ This module provides functionality for generating KHQR (Cambodia QR) codes
 compatible with the Bakong payment system using real banking credentials.
 """
 
-import qrcode
-import io
 import base64
 from typing import Optional, Dict, Any
 import uuid
@@ -14,6 +12,9 @@ import json
 from datetime import datetime, timedelta
 import os
 
+from utils.qr_images import qr_images
+from utils.payment_events import payment_events
+
 
 class BakongQRGenerator:
     """
@@ -111,25 +112,8 @@ class BakongQRGenerator:
         # Simple payment info for QR code
         payment_info = f"Pay ${amount} USD to {self.merchant_name} - Ref: {reference_id}"
 
-        # Generate QR code with optimized parameters for speed
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,  # Lowest error correction for speed
-            box_size=8,  # Smaller box size for faster generation
-            border=2,    # Smaller border for faster generation
-        )
-        qr.add_data(payment_info)
-        qr.make(fit=True)
-
-        # Create image
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        # Convert to base64 with optimization
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG', optimize=True)
-        img_data = buffer.getvalue()
-
-        return base64.b64encode(img_data).decode('utf-8')
+        # Rendered once per payload by the shared QR service
+        return qr_images.base64(payment_info, box_size=8, border=2)
     
     def save_static_qr_image(self, image_data: bytes):
         """
@@ -308,6 +292,7 @@ class PaymentSession:
             cls._sessions[session_id]['status'] = status
             if additional_data:
                 cls._sessions[session_id].update(additional_data)
+            payment_events.publish(f"session:{session_id}", status)
             return True
         return False
     
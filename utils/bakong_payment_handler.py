@@ -9,8 +9,6 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 import os
-import base64
-import io
 
 try:
     from PIL import Image
@@ -19,6 +17,7 @@ except ImportError:
     PIL_AVAILABLE = False
 
 from utils.bakong_api_client import get_bakong_client
+from utils.payment_events import payment_events
 
 class BakongPaymentHandler:
     """
@@ -293,30 +292,10 @@ class BakongPaymentHandler:
             if not PIL_AVAILABLE:
                 print("PIL not available, returning None for QR code image")
                 return None
-                
-            # For now, return a placeholder
-            # In a real implementation, you would generate the actual QR code
-            # using a QR code library like qrcode
-            
-            # Create a simple placeholder image
-            from PIL import Image, ImageDraw, ImageFont
-            
-            # Create a simple QR code placeholder
-            img = Image.new('RGB', (200, 200), color='white')
-            draw = ImageDraw.Draw(img)
-            
-            # Draw a simple pattern
-            for i in range(0, 200, 20):
-                for j in range(0, 200, 20):
-                    if (i + j) % 40 == 0:
-                        draw.rectangle([i, j, i+15, j+15], fill='black')
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
             
-            return img_str
+            # Rendered by the shared QR service (cached per payload) instead of a placeholder
+            from utils.qr_images import qr_images
+            return qr_images.base64(qr_data, box_size=10, border=4)
             
         except Exception as e:
             print(f"Error generating QR code image: {e}")
@@ -347,6 +326,7 @@ class BakongPaymentHandler:
             conn.commit()
             cur.close()
             conn.close()
+            payment_events.publish_order(order_id, status)
             
         except Exception as e:
             print(f"Error updating order payment status: {e}")
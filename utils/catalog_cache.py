@@ -0,0 +1,255 @@
+"""
+Catalog Cache
+In-process TTL + LRU cache for catalog reads (featured products, categories, colors,
+warranties, brands) that change a few times a day but are read on every page view.
+Optionally backed by a local SQLite file so gunicorn workers share loaded entries.
+"""
+
+import os
+import copy
+import time
+import pickle
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Touched by invalidate() so every gunicorn worker drops its entries, not just the one
+# that handled the write
+STAMP_FILE = os.path.join(tempfile.gettempdir(), 'computershop_catalog.stamp')
+
+_MISSING = object()
+
+
+class CatalogCache:
+    """
+    Thread-safe cache with a per-key TTL and an LRU bound on the number of entries.
+
+    - values are deep-copied in and out, so callers may mutate what they get back
+    - invalidate() clears this worker and touches STAMP_FILE; other workers compare the
+      stamp on lookup and clear themselves
+    - with store_path set, entries are also written to a SQLite file and read back by
+      workers that miss locally
+    """
+
+    def __init__(self, max_entries: int = 256, default_ttl: float = 300, store_path: Optional[str] = None,
+                 enabled: bool = True):
+        self.max_entries = max(1, int(max_entries))
+        self.default_ttl = default_ttl
+        self.store_path = store_path or None
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._stamp = self._read_stamp()
+        self._store_ready = False
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'shared_hits': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    # -- stamp ---------------------------------------------------------------
+
+    @staticmethod
+    def _read_stamp() -> int:
+        try:
+            return os.stat(STAMP_FILE).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _sync_stamp(self) -> int:
+        """Drop local entries if another worker invalidated since we last looked"""
+        stamp = self._read_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._entries.clear()
+                    self._stamp = stamp
+        return stamp
+
+    # -- shared store --------------------------------------------------------
+
+    def _store_connect(self):
+        conn = sqlite3.connect(self.store_path, timeout=1)
+        if not self._store_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS catalog_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._store_ready = True
+        return conn
+
+    def _store_get(self, key: str):
+        try:
+            conn = self._store_connect()
+            try:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM catalog_cache WHERE cache_key = ?", (key,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Catalog cache store read failed: {e}")
+            return _MISSING
+        if row is None or row[1] <= time.time():
+            return _MISSING
+        return pickle.loads(row[0]), row[1]
+
+    def _store_set(self, key: str, value: Any, expires_at: float):
+        try:
+            conn = self._store_connect()
+            try:
+                conn.execute(
+                    "REPLACE INTO catalog_cache (cache_key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Catalog cache store write failed: {e}")
+
+    def _store_clear(self):
+        try:
+            conn = self._store_connect()
+            try:
+                conn.execute("DELETE FROM catalog_cache")
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Catalog cache store clear failed: {e}")
+
+    # -- public API ----------------------------------------------------------
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def _lookup(self, key: str) -> Any:
+        self._sync_stamp()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        if self.store_path:
+            found = self._store_get(key)
+            if found is not _MISSING:
+                value, expires_at = found
+                self._put_local(key, value, expires_at)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return copy.deepcopy(value)
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return _MISSING
+
+    def _put_local(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        value = copy.deepcopy(value)
+        self._put_local(key, value, expires_at)
+        if self.store_path:
+            self._store_set(key, value, expires_at)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Return the cached value for key, calling loader() and caching its result on a miss"""
+        if not self.enabled:
+            return loader()
+
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        stamp = self._stamp
+        value = loader()
+        # An invalidation that landed while loader() ran means value may already be stale
+        if self._read_stamp() == stamp:
+            self.set(key, value, ttl)
+        return value
+
+    def cached(self, namespace: str, ttl: Optional[float] = None):
+        """Decorator caching a function's result per (namespace, arguments)"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = f"{namespace}:{args!r}:{sorted(kwargs.items())!r}"
+                return self.get_or_load(key, lambda: func(*args, **kwargs), ttl)
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def generation(self) -> int:
+        """Changes whenever any worker invalidates; lets derived indexes know when to rebuild"""
+        return self._sync_stamp()
+
+    def invalidate(self, reason: str = ''):
+        """Clear the cache in this worker, the shared store and (via the stamp file) every other worker"""
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+        if self.store_path:
+            self._store_clear()
+        try:
+            with open(STAMP_FILE, 'a'):
+                os.utime(STAMP_FILE, None)
+        except OSError as e:
+            logger.warning(f"Could not touch catalog stamp file {STAMP_FILE}: {e}")
+        self._stamp = self._read_stamp()
+        if reason:
+            logger.info(f"Catalog cache invalidated: {reason}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['shared_hits']) / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['default_ttl'] = self.default_ttl
+        stats['shared_store'] = self.store_path
+        stats['enabled'] = self.enabled
+        stats['pid'] = os.getpid()
+        return stats
+
+
+def _from_config() -> CatalogCache:
+    from config import Config
+    return CatalogCache(
+        max_entries=Config.CATALOG_CACHE_MAX_ENTRIES,
+        default_ttl=Config.CATALOG_CACHE_TTL,
+        store_path=Config.CATALOG_CACHE_STORE,
+        enabled=Config.CATALOG_CACHE_ENABLED,
+    )
+
+
+# Global instance
+catalog_cache = _from_config()
@@ -0,0 +1,181 @@
+"""
+Request-scoped database connection
+One pooled connection per Flask request, shared by models.get_db() and the
+legacy mysql.connection call sites in app.py / auth.py
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+from utils.db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+
+class RequestScopedConnection:
+    """
+    Proxy handed out for the lifetime of a request.
+    close() is a no-op so existing `finally: conn.close()` blocks keep working;
+    the underlying pooled connection is released in the teardown handler.
+    """
+
+    def __init__(self, pooled):
+        self._pooled = pooled
+        self.checkouts = 0
+        self.opened_at = time.time()
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._pooled, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+def get_request_connection() -> RequestScopedConnection:
+    """Return the connection bound to the current request, checking one out on first use"""
+    conn = g.get('_db_conn')
+    if conn is None:
+        conn = RequestScopedConnection(get_pool().get_connection())
+        g._db_conn = conn
+    conn.checkouts += 1
+    return conn
+
+
+def release_request_connection(exc=None):
+    """
+    Roll back any transaction still open and hand the connection back to the pool.
+    Uncommitted work is discarded, as flask_mysqldb did when it closed its connection:
+    a handler that catches an error between two writes must not half-apply them.
+    """
+    conn = g.pop('_db_conn', None)
+    if conn is None:
+        return
+
+    pooled = conn._pooled
+    try:
+        if pooled.in_transaction:
+            pooled.rollback()
+    except Exception as e:
+        logger.error(f"Error finishing request transaction: {e}")
+        try:
+            pooled.rollback()
+        except Exception:
+            pass
+    finally:
+        pooled.close()
+
+    held_ms = (time.time() - conn.opened_at) * 1000
+    logger.info(
+        f"DB: 1 connection, {conn.checkouts} checkout(s), held {held_ms:.1f}ms "
+        f"for {request.method} {request.path}"
+    )
+
+
+def begin_transaction(conn) -> bool:
+    """
+    Start an explicit transaction unless one is already open on this connection.
+    Returns True when this call started it: only then may the caller commit or roll back.
+    """
+    if conn.in_transaction:
+        return False
+    conn.start_transaction()
+    return True
+
+
+@contextmanager
+def atomic(conn, name: str = 'atomic_block'):
+    """
+    Run a block atomically on conn. With no transaction open it starts one and commits or
+    rolls it back; inside a caller's transaction it sets a SAVEPOINT instead, so a failure
+    undoes only this block and the enclosing work is left for its owner to finish.
+    Yields True when the block owns the transaction.
+    """
+    owned = begin_transaction(conn)
+    if not owned:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SAVEPOINT {name}")
+        finally:
+            cur.close()
+    try:
+        yield owned
+    except BaseException:
+        try:
+            if owned:
+                conn.rollback()
+            elif conn.in_transaction:
+                cur = conn.cursor()
+                try:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                finally:
+                    cur.close()
+        except Exception as e:
+            # e.g. a deadlock already rolled back the whole transaction
+            logger.error(f"Could not roll back {name}: {e}")
+        raise
+    if owned:
+        conn.commit()
+    else:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"RELEASE SAVEPOINT {name}")
+        finally:
+            cur.close()
+
+
+@contextmanager
+def transaction():
+    """
+    Explicit transaction on the request connection (or a pooled one outside a request).
+    Commits on success, rolls back on error; nested inside an open transaction (e.g. a
+    legacy mysql.connection one) it becomes a savepoint, see atomic().
+    """
+    if has_request_context():
+        conn = get_request_connection()
+        owned = False
+    else:
+        conn = get_pool().get_connection()
+        owned = True
+
+    try:
+        with atomic(conn, 'request_transaction'):
+            yield conn
+    finally:
+        if owned:
+            conn.close()
+
+
+class RequestMySQL:
+    """
+    Drop-in replacement for flask_mysqldb.MySQL.
+    `mysql.connection` resolves to the same request-scoped connection models use, with a
+    transaction open like flask_mysqldb's autocommit-off connection: legacy handlers run
+    several writes and then call mysql.connection.commit(), and the writes stay atomic.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.teardown_request(release_request_connection)
+        app.mysql = self
+
+    @property
+    def connection(self):
+        if not has_request_context():
+            return None
+        conn = get_request_connection()
+        if not conn.in_transaction:
+            # Reopened on the next access after commit()/rollback()
+            conn.start_transaction()
+        return conn
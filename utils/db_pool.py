@@ -0,0 +1,275 @@
+"""
+MySQL Connection Pool
+Per-process pool of mysql.connector connections used behind models.get_db()
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a raw mysql.connector connection.
+    Calling close() hands the connection back to the pool instead of
+    tearing down the socket; everything else is delegated to the raw connection.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Call sites that forget close() must not leak a pool slot. The collector can run
+        # while this thread holds the pool lock, so only the slot is handed back here;
+        # the socket is closed by the next checkout.
+        if not self._released:
+            self._released = True
+            self._pool._abandon(self._raw)
+
+
+class ConnectionPool:
+    """
+    Thread-safe connection pool.
+
+    - pool_size connections are kept open between requests
+    - up to max_overflow extra connections are opened under load and closed on return
+    - callers wait up to `timeout` seconds when pool_size + max_overflow are checked out
+    - idle connections are pinged before reuse and recycled after `recycle` seconds
+    - the pool resets itself in forked children (gunicorn preload_app=True)
+    """
+
+    def __init__(self, connect_kwargs: Dict[str, Any], pool_size: int = 10, max_overflow: int = 20,
+                 timeout: float = 30, recycle: int = 3600, pre_ping: bool = True):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.pool_size = max(1, int(pool_size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._reset()
+
+    def _reset(self):
+        """(Re)initialise all per-process state"""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size + self.max_overflow)
+        self._idle = deque()
+        self._abandoned = deque()
+        self._created_at = {}
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+            'stale': 0,
+            'recycled': 0,
+            'abandoned': 0,
+            'checked_out': 0,
+        }
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Inherited sockets belong to the parent process: drop them without
+            # sending COM_QUIT, otherwise the parent's sessions would be closed too.
+            logger.info(f"Connection pool reset after fork (parent pid {self._pid}, child pid {os.getpid()})")
+            self._reset()
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.connect_kwargs)
+        self._created_at[id(raw)] = time.time()
+        return raw
+
+    def _discard(self, raw):
+        self._created_at.pop(id(raw), None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, raw) -> bool:
+        created = self._created_at.get(id(raw), 0)
+        if self.recycle and self.recycle > 0 and time.time() - created > self.recycle:
+            with self._lock:
+                self._stats['recycled'] += 1
+            return False
+        if self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._stats['stale'] += 1
+                return False
+        return True
+
+    def get_connection(self) -> PooledConnection:
+        self._check_pid()
+        self._close_abandoned()
+
+        if not self._slots.acquire(blocking=False):
+            started = time.time()
+            with self._lock:
+                self._stats['waits'] += 1
+            acquired = self._slots.acquire(timeout=self.timeout)
+            with self._lock:
+                self._stats['wait_time_ms'] += (time.time() - started) * 1000
+                if not acquired:
+                    self._stats['timeouts'] += 1
+            if not acquired:
+                raise PoolTimeoutError(
+                    f"Timed out after {self.timeout}s waiting for a database connection "
+                    f"(pool_size={self.pool_size}, max_overflow={self.max_overflow})"
+                )
+
+        try:
+            while True:
+                with self._lock:
+                    raw = self._idle.pop() if self._idle else None
+                if raw is None:
+                    break
+                if self._is_usable(raw):
+                    with self._lock:
+                        self._stats['hits'] += 1
+                        self._stats['checked_out'] += 1
+                    return PooledConnection(self, raw)
+                self._discard(raw)
+
+            raw = self._connect()
+            with self._lock:
+                self._stats['misses'] += 1
+                self._stats['checked_out'] += 1
+            return PooledConnection(self, raw)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, raw):
+        if self._pid != os.getpid():
+            # Connection checked out before a fork; the slot belongs to the old pool
+            return
+
+        keep = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            keep = False
+
+        with self._lock:
+            self._stats['checked_out'] = max(0, self._stats['checked_out'] - 1)
+            if keep and len(self._idle) < self.pool_size:
+                self._idle.append(raw)
+                raw = None
+
+        if raw is not None:
+            self._discard(raw)
+        self._slots.release()
+
+    def _abandon(self, raw):
+        """
+        Give back the slot of a connection that was garbage collected without close().
+        Runs inside __del__, so no lock and no network I/O: the raw connection is parked
+        for _close_abandoned (deque.append is atomic).
+        """
+        if self._pid != os.getpid():
+            return
+        self._abandoned.append(raw)
+        self._slots.release()
+
+    def _close_abandoned(self):
+        while True:
+            try:
+                raw = self._abandoned.popleft()
+            except IndexError:
+                return
+            with self._lock:
+                self._stats['checked_out'] = max(0, self._stats['checked_out'] - 1)
+                self._stats['abandoned'] += 1
+            self._discard(raw)
+
+    def dispose(self):
+        """Close every idle connection (checked-out ones are closed on return)"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw in idle:
+            self._discard(raw)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        requests = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / requests, 4) if requests else 0.0
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 2)
+        stats['pool_size'] = self.pool_size
+        stats['max_overflow'] = self.max_overflow
+        stats['pid'] = self._pid
+        return stats
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, creating it from Config on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from config import Config
+                _pool = ConnectionPool(
+                    connect_kwargs={
+                        'user': Config.MYSQL_USER,
+                        'password': Config.MYSQL_PASSWORD,
+                        'host': Config.MYSQL_HOST,
+                        'port': Config.MYSQL_PORT,
+                        'database': Config.MYSQL_DB,
+                        'use_pure': True,
+                        'autocommit': True,
+                        # Buffered cursors let one connection be shared by nested model calls
+                        'buffered': True,
+                        'connect_timeout': 60,
+                        'auth_plugin': 'mysql_native_password',
+                    },
+                    pool_size=Config.SQLALCHEMY_POOL_SIZE,
+                    max_overflow=Config.SQLALCHEMY_MAX_OVERFLOW,
+                    timeout=Config.SQLALCHEMY_POOL_TIMEOUT,
+                    recycle=Config.SQLALCHEMY_POOL_RECYCLE,
+                    pre_ping=Config.SQLALCHEMY_POOL_PRE_PING,
+                )
+    return _pool
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Hit/miss/wait counters for the current process"""
+    return get_pool().stats()
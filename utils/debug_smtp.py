@@ -0,0 +1,136 @@
+"""
+Debug SMTP Server
+Local stand-in for the real SMTP server when testing OTP emails. It accepts any login,
+keeps every message in memory and prints it instead of delivering it.
+
+    python -m utils.debug_smtp --port 1025
+
+then run the app with SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_USE_TLS=false.
+In a test, DebugSMTPServer(port=0).start() picks a free port (server.port) and
+server.messages holds (sender, recipients, raw message) tuples.
+"""
+
+import argparse
+import socketserver
+import threading
+from typing import List, Optional, Tuple
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of RFC 5321 for smtplib: EHLO, AUTH, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def readline(self) -> Optional[str]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def handle(self):
+        server = self.server
+        sender, recipients = None, []
+        self.reply('220 localhost debug SMTP ready')
+        while True:
+            line = self.readline()
+            if line is None:
+                return
+            command = line.split(' ', 1)[0].upper()
+            argument = line[len(command):].strip()
+
+            if command == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250-AUTH PLAIN LOGIN')
+                self.reply('250 8BITMIME')
+            elif command == 'HELO':
+                self.reply('250 localhost')
+            elif command == 'STARTTLS':
+                self.reply('454 TLS not available on the debug server')
+            elif command == 'AUTH':
+                if argument.upper().startswith('LOGIN'):
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.readline()
+                elif argument.upper() == 'PLAIN':
+                    self.reply('334 ')
+                    self.readline()
+                self.reply('235 Authentication successful')
+            elif command == 'MAIL':
+                sender, recipients = argument.split(':', 1)[1].strip().strip('<>'), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(argument.split(':', 1)[1].strip().strip('<>'))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data_line = self.readline()
+                    if data_line is None or data_line == '.':
+                        break
+                    lines.append(data_line[1:] if data_line.startswith('..') else data_line)
+                server.record(sender, recipients, '\n'.join(lines))
+                sender, recipients = None, []
+                self.reply('250 OK: queued')
+            elif command in ('RSET', 'NOOP'):
+                if command == 'RSET':
+                    sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = 'localhost', port: int = 1025, echo: bool = True):
+        super().__init__((host, port), _SMTPHandler)
+        self.echo = echo
+        self.messages: List[Tuple[str, List[str], str]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record(self, sender: str, recipients: List[str], message: str):
+        with self._lock:
+            self.messages.append((sender, list(recipients), message))
+        if self.echo:
+            print(f"""
+        ========================================
+        DEBUG SMTP: {sender} -> {', '.join(recipients)}
+        ========================================
+{message}
+        ========================================
+        """)
+
+    def start(self) -> 'DebugSMTPServer':
+        """Serve on a background thread (for tests)"""
+        self._thread = threading.Thread(target=self.serve_forever, name='debug-smtp', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local debugging SMTP server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1025)
+    options = parser.parse_args()
+    server = DebugSMTPServer(options.host, options.port)
+    print(f"Debug SMTP server listening on {options.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
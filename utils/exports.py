@@ -0,0 +1,71 @@
+"""
+Exports
+Constant-memory CSV streaming for the staff customer pages.
+
+- iter_rows() reads a query through an unbuffered (server-side) cursor in fetchmany()
+  batches on its own pool connection, so the full result set is never held in memory
+- stream_csv() turns those rows into CSV chunks for a generator-backed (chunked) Response
+- PDF exports are rendered by utils.job_queue; the request only enqueues and polls
+"""
+
+import csv
+import io
+from typing import Iterable, Iterator, Optional, Sequence
+
+from utils.db_pool import get_pool
+
+BATCH_SIZE = 500        # rows per fetchmany() round trip
+CHUNK_ROWS = 200        # CSV rows per response chunk
+
+
+def iter_rows(query: str, params: Sequence = (), batch_size: int = BATCH_SIZE) -> Iterator[dict]:
+    """Yield query rows as dicts, batch by batch, from a server-side cursor"""
+    conn = get_pool().get_connection()
+    cur = conn.cursor(dictionary=True, buffered=False)
+    try:
+        cur.execute(query, tuple(params))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        try:
+            # An abandoned download leaves unread rows; drain them so the connection is reusable
+            while cur.fetchmany(batch_size):
+                pass
+        except Exception:
+            pass
+        cur.close()
+        conn.close()
+
+
+def peek(rows: Iterator) -> Optional[Iterator]:
+    """None if `rows` is empty, else an iterator over all of its rows (first row included)"""
+    try:
+        first = next(rows)
+    except StopIteration:
+        return None
+
+    def chained():
+        yield first
+        yield from rows
+    return chained()
+
+
+def stream_csv(header: Sequence[str], rows: Iterable[Sequence], chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """CSV text in chunks of chunk_rows lines; text fields are quoted, numbers are not"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n')
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    yield buffer.getvalue()
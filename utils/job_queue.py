@@ -0,0 +1,238 @@
+"""
+Job Queue
+In-process background job queue for work that should not hold a gunicorn worker:
+invoice and export PDFs, screenshot OCR and KHQR image rendering
+(OTP emails go through the batching outbox in utils/mailer.py).
+
+- Handlers are registered by name (register()) and run on a small thread pool
+- A failing job is retried with exponential backoff up to max_attempts; an optional
+  on_give_up callback runs after the last failure
+- Job state (status, attempts, error, JSON result, output file) lives in files under
+  JOB_DIR so any gunicorn worker can answer status polls and serve finished files.
+  Arguments are kept in memory only (they may hold OTP codes), so a job does not
+  survive a restart of the process that queued it.
+
+The request path only enqueues and polls: enqueue() returns a job id and the client
+polls /jobs/<job_id> until the job is done or failed.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_DIR = os.path.join(tempfile.gettempdir(), 'computershop_jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+RETRYING = 'retrying'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE = (QUEUED, RUNNING, RETRYING)
+
+
+class JobQueue:
+    """Named-handler job queue with retries and on-disk status shared by all workers"""
+
+    def __init__(self, directory: str = JOB_DIR, workers: int = 2, max_attempts: int = 3,
+                 retry_delay: float = 2.0, retention: float = 3600, stale_after: float = 600):
+        self.directory = directory
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self.stale_after = stale_after
+        self._handlers: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, tuple] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'reused': 0,
+            'succeeded': 0,
+            'retried': 0,
+            'failed': 0,
+        }
+
+    def register(self, name: str, handler: Callable, max_attempts: Optional[int] = None,
+                 on_give_up: Optional[Callable] = None):
+        """
+        Register handler(*args, **kwargs) under name. Jobs with an output file get the
+        file path as the first argument. on_give_up(error, *args, **kwargs) runs once the
+        last attempt has failed.
+        """
+        self._handlers[name] = {
+            'handler': handler,
+            'max_attempts': max_attempts or self.max_attempts,
+            'on_give_up': on_give_up,
+        }
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created on first use so the threads belong to the (forked) worker process
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            return self._executor
+
+    def _meta_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write_meta(self, job_id: str, meta: Dict[str, Any]):
+        tmp = f"{self._meta_path(job_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, default=str)
+        os.replace(tmp, self._meta_path(job_id))
+
+    def _update(self, job_id: str, **changes):
+        with self._lock:
+            meta = self.get(job_id) or {}
+            meta.update(changes)
+            meta['updated_at'] = time.time()
+            self._write_meta(job_id, meta)
+
+    def _reusable(self, meta: Optional[Dict[str, Any]]) -> bool:
+        if not meta:
+            return False
+        if meta['status'] == DONE:
+            return not meta.get('path') or os.path.exists(meta['path'])
+        # An active job whose process died never finishes; enqueue it again once stale
+        return meta['status'] in ACTIVE and time.time() - meta.get('updated_at', 0) < self.stale_after
+
+    def enqueue(self, name: str, args: tuple = (), kwargs: Optional[dict] = None, owner=None,
+                filename: Optional[str] = None, attachment: bool = True, job_id: Optional[str] = None) -> str:
+        """
+        Queue a registered job and return its id. With filename the handler writes its
+        output to a file that /jobs/<job_id>/download serves. Passing a deterministic
+        job_id reuses a finished or in-progress job with the same id instead of
+        running the work again.
+        """
+        if name not in self._handlers:
+            raise KeyError(f"No job handler registered for '{name}'")
+        os.makedirs(self.directory, exist_ok=True)
+        if job_id is None:
+            job_id = uuid.uuid4().hex
+        elif not job_id.isalnum():
+            raise ValueError('Job ids must be alphanumeric')
+        else:
+            existing = self.get(job_id)
+            if self._reusable(existing):
+                with self._lock:
+                    self._stats['reused'] += 1
+                return job_id
+
+        self.cleanup()
+        now = time.time()
+        extension = os.path.splitext(filename)[1] if filename else ''
+        self._write_meta(job_id, {
+            'id': job_id,
+            'kind': name,
+            'status': QUEUED,
+            'attempts': 0,
+            'filename': filename,
+            'attachment': attachment,
+            'path': os.path.join(self.directory, f"{job_id}{extension}") if filename else None,
+            'owner': owner,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'finished_at': None,
+        })
+        with self._lock:
+            self._pending[job_id] = (name, tuple(args), dict(kwargs or {}))
+            self._stats['enqueued'] += 1
+        self._pool().submit(self._run, job_id, 1)
+        return job_id
+
+    def _run(self, job_id: str, attempt: int):
+        with self._lock:
+            pending = self._pending.get(job_id)
+        meta = self.get(job_id)
+        if pending is None or meta is None:
+            return
+        name, args, kwargs = pending
+        spec = self._handlers[name]
+        if meta.get('path'):
+            args = (meta['path'],) + args
+
+        self._update(job_id, status=RUNNING, attempts=attempt, started_at=time.time())
+        try:
+            result = spec['handler'](*args, **kwargs)
+        except Exception as e:
+            if attempt < spec['max_attempts']:
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                logger.warning(f"Job {job_id} ({name}) attempt {attempt} failed: {e}; retrying in {delay:g}s")
+                self._update(job_id, status=RETRYING, error=str(e))
+                with self._lock:
+                    self._stats['retried'] += 1
+                timer = threading.Timer(delay, lambda: self._pool().submit(self._run, job_id, attempt + 1))
+                timer.daemon = True
+                timer.start()
+                return
+            logger.error(f"Job {job_id} ({name}) failed after {attempt} attempts: {e}")
+            with self._lock:
+                self._pending.pop(job_id, None)
+                self._stats['failed'] += 1
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            if spec['on_give_up'] is not None:
+                try:
+                    spec['on_give_up'](e, *args, **kwargs)
+                except Exception as give_up_error:
+                    logger.error(f"Job {job_id} ({name}) give-up handler failed: {give_up_error}")
+            return
+
+        with self._lock:
+            self._pending.pop(job_id, None)
+            self._stats['succeeded'] += 1
+        self._update(job_id, status=DONE, result=result, error=None, finished_at=time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id or not job_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cleanup(self):
+        """Delete jobs (and their files) older than the retention period"""
+        cutoff = time.time() - self.retention
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_memory'] = len(self._pending)
+        stats['workers'] = self.workers
+        stats['handlers'] = sorted(self._handlers)
+        return stats
+
+
+def _from_config() -> JobQueue:
+    from config import Config
+    return JobQueue(workers=Config.JOB_QUEUE_WORKERS,
+                    max_attempts=Config.JOB_MAX_ATTEMPTS,
+                    retry_delay=Config.JOB_RETRY_DELAY,
+                    retention=Config.JOB_RETENTION)
+
+
+# Global instance
+job_queue = _from_config()
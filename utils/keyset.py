@@ -0,0 +1,181 @@
+"""
+Keyset Pagination
+Cursor-based paging for the staff order, customer and inventory listings.
+Instead of `LIMIT n OFFSET k` (which reads and throws away k rows) a page starts
+right after the sort key of the previous page's last row, e.g.
+`(o.order_date, o.id) < (last_date, last_id)`, so every page costs the same.
+
+Clients may pass the opaque `next_cursor` from a response back as `cursor`. The
+existing page-number UIs keep working: each worker remembers the last key of the pages
+it has served per listing/filter combination ("bookmarks"), so page N+1 seeks from page
+N's bookmark and only jumps to unvisited pages fall back to OFFSET.
+Listing totals are counted once per COUNT_TTL and served from memory in between.
+"""
+
+import json
+import time
+import base64
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 'n' in value:
+            return Decimal(value['n'])
+        raise ValueError('Invalid pagination cursor')
+    return value
+
+
+def encode_cursor(values: Optional[Sequence]) -> Optional[str]:
+    """Opaque, URL-safe token for a sort key; None when there is no usable key"""
+    if not values or any(v is None for v in values):
+        return None
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[list]:
+    """Inverse of encode_cursor; raises ValueError for a malformed token"""
+    if not token:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(payload)
+        if not isinstance(values, list) or not values:
+            raise ValueError
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise ValueError('Invalid pagination cursor')
+
+
+def seek_predicate(columns: Sequence[str], values: Sequence, descending: bool = True) -> Tuple[str, List]:
+    """
+    WHERE fragment selecting rows after `values` in ORDER BY columns (all DESC or all ASC).
+    Expanded to (a < x) OR (a = x AND b < y) so MySQL can range-scan the leading column.
+    """
+    if len(columns) != len(values):
+        raise ValueError('Invalid pagination cursor')
+    op = '<' if descending else '>'
+    clauses, params = [], []
+    for i, column in enumerate(columns):
+        parts = [f"{c} = %s" for c in columns[:i]] + [f"{column} {op} %s"]
+        clauses.append(f"({' AND '.join(parts)})")
+        params.extend(values[:i])
+        params.append(values[i])
+    return f"({' OR '.join(clauses)})", params
+
+
+class KeysetPager:
+    """Per-worker page bookmarks and cached totals, keyed by listing + filters"""
+
+    def __init__(self, count_ttl: float = 60, max_listings: int = 512, max_pages: int = 200):
+        self.count_ttl = count_ttl
+        self.max_listings = max_listings
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self._counts: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._bookmarks: 'OrderedDict[str, Dict[int, tuple]]' = OrderedDict()
+        self._stats = {
+            'count_hits': 0,
+            'count_misses': 0,
+            'seeks': 0,
+            'offset_fallbacks': 0,
+        }
+
+    @staticmethod
+    def key(listing: str, *filters) -> str:
+        return f"{listing}:{filters!r}"
+
+    def _trim(self, entries: OrderedDict):
+        while len(entries) > self.max_listings:
+            entries.popitem(last=False)
+
+    def count(self, key: str, counter: Callable[[], int]) -> int:
+        """Total rows for a listing, recounted at most once per count_ttl"""
+        now = time.time()
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is not None and entry[1] > now:
+                self._counts.move_to_end(key)
+                self._stats['count_hits'] += 1
+                return entry[0]
+            self._stats['count_misses'] += 1
+        total = int(counter())
+        with self._lock:
+            self._counts[key] = (total, now + self.count_ttl)
+            self._counts.move_to_end(key)
+            self._trim(self._counts)
+        return total
+
+    def plan(self, key: str, page: int, page_size: int, cursor: Optional[str] = None) -> Tuple[Optional[list], int]:
+        """
+        (seek values, offset) for a page: an explicit cursor wins, then the bookmark of the
+        previous page; otherwise OFFSET paging.
+        """
+        values = decode_cursor(cursor)
+        if values is None and page > 1:
+            now = time.time()
+            with self._lock:
+                entry = self._bookmarks.get(key, {}).get(page - 1)
+                if entry is not None and entry[1] > now:
+                    values = entry[0]
+        with self._lock:
+            if values is not None:
+                self._stats['seeks'] += 1
+            elif page > 1:
+                self._stats['offset_fallbacks'] += 1
+        if values is not None:
+            return values, 0
+        return None, (max(page, 1) - 1) * page_size
+
+    def remember(self, key: str, page: int, values: Optional[Sequence]) -> Optional[str]:
+        """Store the last sort key served for a page; returns it as the next_cursor token"""
+        token = encode_cursor(values)
+        if token is None:
+            return None
+        now = time.time()
+        with self._lock:
+            # Each bookmark expires count_ttl after it was written, like the cached total,
+            # so pages shifted by new rows are picked up even under steady traffic
+            pages = {number: entry for number, entry in self._bookmarks.get(key, {}).items() if entry[1] > now}
+            if page <= self.max_pages:
+                pages[page] = (list(values), now + self.count_ttl)
+            self._bookmarks[key] = pages
+            self._bookmarks.move_to_end(key)
+            self._trim(self._bookmarks)
+        return token
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_counts'] = len(self._counts)
+            stats['bookmarked_listings'] = len(self._bookmarks)
+        stats['count_ttl'] = self.count_ttl
+        return stats
+
+
+def _from_config() -> KeysetPager:
+    from config import Config
+    return KeysetPager(count_ttl=Config.LISTING_COUNT_TTL)
+
+
+# Global instance
+keyset_pager = _from_config()
@@ -10,6 +10,8 @@ from typing import Dict, Any, Optional
 
 # Import the new Bakong API handler
 from utils.bakong_payment_handler import get_bakong_handler
+from utils.qr_images import qr_images
+from utils.payment_events import payment_events
 
 # Legacy support for old bakong_khqr library
 try:
@@ -140,6 +142,9 @@ class KHQRPaymentHandler:
                 
                 # Add MD5 hash to the result
                 result['md5_hash'] = md5_hash
+                # Same cached PNG URL as the legacy path (the API result only has base64)
+                if qr_data:
+                    result['qr_image_url'] = qr_images.url(qr_data)
                 return result
             else:
                 print(f"⚠️ Bakong API failed: {result.get('error', 'Unknown error')}")
@@ -223,11 +228,8 @@ class KHQRPaymentHandler:
                 except Exception as e:
                     print(f"⚠️ Warning: Could not create payment session: {e}")
             
-            # Generate QR code image from QR data
-            img_start = time.time()
-            qr_code_image = self.generate_qr_code_image(qr_data)
-            img_time = time.time() - img_start
-            print(f"✅ QR image generated (took {img_time:.2f}s)")
+            # The QR image is rendered (once per payload) when the client loads qr_image_url
+            qr_image_url = qr_images.url(qr_data)
             
             total_time = time.time() - start_time
             print(f"✅ Total KHQR payment creation time: {total_time:.2f}s")
@@ -236,7 +238,7 @@ class KHQRPaymentHandler:
                 'success': True,
                 'payment_id': payment_id,
                 'qr_data': qr_data,
-                'qr_code': qr_code_image,  # Base64 encoded QR code image
+                'qr_image_url': qr_image_url,  # Cached PNG served by /qr/<key>.png
                 'md5_hash': md5_hash,
                 'amount': amount,
                 'currency': currency,
@@ -276,14 +278,14 @@ class KHQRPaymentHandler:
 
                 print(f"✅ Fallback QR created for testing")
                 
-                # Generate QR code image for fallback
-                qr_code_image = self.generate_qr_code_image(qr_data)
+                # QR image URL for fallback
+                qr_image_url = qr_images.url(qr_data)
                 
                 return {
                     'success': True,
                     'payment_id': payment_id,
                     'qr_data': qr_data,
-                    'qr_code': qr_code_image,  # Base64 encoded QR code image
+                    'qr_image_url': qr_image_url,  # Cached PNG served by /qr/<key>.png
                     'md5_hash': md5_hash,
                     'amount': amount,
                     'currency': currency,
@@ -306,34 +308,10 @@ class KHQRPaymentHandler:
             qr_data: QR data string to encode
             
         Returns:
-            Base64 encoded PNG image string
+            Base64 encoded PNG image string (cached per payload)
         """
         try:
-            import qrcode
-            import io
-            import base64
-            
-            # Create QR code with optimized settings for faster generation
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=4,  # Reduced from 8 to 4 for faster generation
-                border=1,    # Reduced from 2 to 1 for smaller image
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            # Create QR code image
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Convert to base64
-            img_buffer = io.BytesIO()
-            qr_img.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            qr_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-            
-            return qr_base64
-            
+            return qr_images.base64(qr_data, box_size=4, border=1)
         except ImportError:
             print("⚠️ qrcode library not available, cannot generate QR image")
             return None
@@ -412,14 +390,14 @@ class KHQRPaymentHandler:
             # Store payment for tracking
             self.active_payments[payment_id] = payment_data
             
-            # Generate QR code image from QR data
-            qr_code_image = self.generate_qr_code_image(qr_data)
+            # The QR image is rendered (once per payload) when the client loads qr_image_url
+            qr_image_url = qr_images.url(qr_data)
             
             return {
                 'success': True,
                 'payment_id': payment_id,
                 'qr_data': qr_data,
-                'qr_code': qr_code_image,  # Base64 encoded QR code image
+                'qr_image_url': qr_image_url,  # Cached PNG served by /qr/<key>.png
                 'md5_hash': md5_hash,
                 'amount': amount,
                 'currency': currency,
@@ -560,6 +538,8 @@ class KHQRPaymentHandler:
                 else:
                     print(f"❌ No order available - invoice URL not available")
 
+                payment_events.publish(f"khqr:{payment_id}", 'completed', payment_id=payment_id,
+                                       order_id=order_id, invoice_url=result.get('invoice_url'))
                 print(f"📤 Returning payment result: {result}")
                 return result
             else:
@@ -585,7 +565,7 @@ class KHQRPaymentHandler:
     def update_existing_order_to_completed(self, order_id: int, payment_data: Dict[str, Any] = None) -> Optional[int]:
         """Update an existing pending order payment confirmation - order remains Pending until staff approval"""
         try:
-            from models import get_db
+            from models import get_db, SalesRollup
             
             print(f"🔄 Updating order {order_id} to completed and reducing stock...")
             
@@ -635,6 +615,8 @@ class KHQRPaymentHandler:
                 print(f"📦 Stock already reduced at checkout for {len(order_items)} items")
                 
                 conn.commit()
+                SalesRollup.record_orders([order_id])
+                payment_events.publish_order(order_id, 'completed')
                 return order_id
                 
             except Exception as e:
@@ -0,0 +1,94 @@
+"""
+KPI Snapshot
+Short-lived, per-worker cache for the staff dashboard KPIs.
+Every open staff tab polls /auth/staff/api/kpis; the snapshot is computed once per TTL and
+concurrent requests that arrive while it is being computed wait for that computation
+instead of starting their own.
+"""
+
+import copy
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class KPISnapshot:
+    """TTL cache for a single value with in-flight request coalescing (single flight)"""
+
+    def __init__(self, ttl: float = 15, wait_timeout: float = 30):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._value: Optional[Any] = None
+        self._computed_at = 0.0
+        self._inflight: Optional[threading.Event] = None
+        self._stats = {
+            'hits': 0,
+            'computations': 0,
+            'coalesced': 0,
+            'failures': 0,
+        }
+
+    def _fresh(self, now: float) -> bool:
+        return self._value is not None and now - self._computed_at < self.ttl
+
+    def get(self, loader: Callable[[], Any]) -> Any:
+        """Return the cached snapshot, or compute it with loader() (once, however many callers)"""
+        with self._lock:
+            if self._fresh(time.time()):
+                self._stats['hits'] += 1
+                return copy.deepcopy(self._value)
+            event = self._inflight
+            leader = event is None
+            if leader:
+                event = self._inflight = threading.Event()
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            event.wait(self.wait_timeout)
+            with self._lock:
+                if self._fresh(time.time()):
+                    return copy.deepcopy(self._value)
+            # The leader failed or timed out: compute for this request without caching
+            return loader()
+
+        try:
+            value = loader()
+            with self._lock:
+                self._value = value
+                self._computed_at = time.time()
+                self._stats['computations'] += 1
+            return copy.deepcopy(value)
+        except Exception:
+            with self._lock:
+                self._stats['failures'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight = None
+            event.set()
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._computed_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['age_seconds'] = round(time.time() - self._computed_at, 1) if self._value is not None else None
+        stats['ttl'] = self.ttl
+        return stats
+
+
+def _from_config() -> KPISnapshot:
+    from config import Config
+    return KPISnapshot(ttl=Config.KPI_SNAPSHOT_TTL)
+
+
+# Global instance
+kpi_snapshot = _from_config()
@@ -0,0 +1,336 @@
+"""
+Mailer
+Outbound email over pooled, persistent SMTP connections.
+
+- SMTPPool keeps up to `size` authenticated connections open (EHLO/STARTTLS/LOGIN happen
+  once per connection, not per message) and recycles a connection after max_messages
+  or idle_timeout so it never runs into the server's own limits
+- Mailer.send() delivers synchronously on a pooled connection and raises on failure
+- Mailer.queue() puts a message on the outbox; a sender thread drains it in batches over a
+  single connection and retries failed messages with exponential backoff. on_give_up runs
+  when a message is dropped after its last attempt.
+- stats() reports delivery counters for /api/staff/cache/stats
+
+For local testing point SMTP_SERVER/SMTP_PORT at utils/debug_smtp.py with SMTP_USE_TLS=false.
+"""
+
+import time
+import uuid
+import smtplib
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def is_connection_error(error: Exception) -> bool:
+    """
+    True when the SMTP session is unusable and must be replaced. Note smtplib's own
+    exceptions subclass OSError, so socket errors are told apart from SMTP replies here.
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPHeloError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421  # Service not available, closing transmission channel
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPPool:
+    """Bounded pool of authenticated SMTP connections"""
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str],
+                 use_tls: bool = True, size: int = 2, idle_timeout: float = 60,
+                 max_messages: int = 100, timeout: float = 15):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._idle: deque = deque()  # (connection, messages sent, returned at)
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'connections_recycled': 0,
+        }
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.ehlo()
+            if self.use_tls:
+                conn.starttls()
+                conn.ehlo()
+            if self.username and self.password:
+                conn.login(self.username, self.password)
+        except Exception:
+            self._close(conn)
+            raise
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    @staticmethod
+    def _close(conn: smtplib.SMTP):
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def _checkout(self):
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, sent, returned_at = self._idle.pop()
+                stale = now - returned_at > self.idle_timeout
+                if not stale:
+                    self._stats['connections_reused'] += 1
+                    return conn, sent
+                self._stats['connections_recycled'] += 1
+            # Servers drop idle sessions; don't find out halfway through a send
+            self._close(conn)
+        return self._connect(), 0
+
+    @contextmanager
+    def connection(self):
+        """
+        Yield a connection and a counter callback: call sent() after each delivered message.
+        A connection that raised a connection error is discarded instead of returned.
+        """
+        self._slots.acquire()
+        try:
+            conn, count = self._checkout()
+            counter = {'sent': count}
+
+            def sent():
+                counter['sent'] += 1
+
+            try:
+                yield conn, sent
+            except Exception as e:
+                if is_connection_error(e):
+                    self._close(conn)
+                else:
+                    self._give_back(conn, counter['sent'])
+                raise
+            self._give_back(conn, counter['sent'])
+        finally:
+            self._slots.release()
+
+    def _give_back(self, conn: smtplib.SMTP, sent: int):
+        if sent >= self.max_messages:
+            with self._lock:
+                self._stats['connections_recycled'] += 1
+            self._close(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, sent, time.time()))
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle_connections'] = len(self._idle)
+        stats['size'] = self.size
+        return stats
+
+
+class Mailer:
+    """Synchronous sends and a batching, retrying outbox on top of an SMTPPool"""
+
+    def __init__(self, pool: SMTPPool, sender: Optional[str] = None, batch_size: int = 20,
+                 max_attempts: int = 4, retry_delay: float = 5):
+        self.pool = pool
+        self.sender = sender or pool.username
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._outbox: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'attempts': 0,
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'batches': 0,
+            'send_seconds': 0.0,
+        }
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.pool.host and self.sender)
+
+    def _build(self, to_email: str, subject: str, body: str) -> str:
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg.as_string()
+
+    def _record(self, started: float, ok: bool):
+        """Time a delivery attempt; queued messages count as failed only once given up"""
+        with self._lock:
+            self._stats['send_seconds'] += time.time() - started
+            self._stats['attempts'] += 1
+            if ok:
+                self._stats['sent'] += 1
+
+    def send(self, to_email: str, subject: str, body: str):
+        """Deliver now on a pooled connection; raises on failure"""
+        message = self._build(to_email, subject, body)
+        started = time.time()
+        try:
+            try:
+                with self.pool.connection() as (conn, sent):
+                    conn.sendmail(self.sender, to_email, message)
+                    sent()
+            except smtplib.SMTPServerDisconnected:
+                # A pooled connection the server had already closed: one retry on a fresh one
+                with self.pool.connection() as (conn, sent):
+                    conn.sendmail(self.sender, to_email, message)
+                    sent()
+        except Exception:
+            self._record(started, False)
+            with self._lock:
+                self._stats['failed'] += 1
+            raise
+        self._record(started, True)
+
+    def queue(self, to_email: str, subject: str, body: str,
+              on_give_up: Optional[Callable[[Exception], None]] = None) -> str:
+        """Put a message on the outbox; returns its id"""
+        message_id = uuid.uuid4().hex
+        item = {
+            'id': message_id,
+            'to': to_email,
+            'message': self._build(to_email, subject, body),
+            'attempts': 0,
+            'not_before': 0.0,
+            'on_give_up': on_give_up,
+        }
+        with self._cond:
+            self._outbox.append(item)
+            self._ensure_sender()
+            self._cond.notify()
+        return message_id
+
+    def _ensure_sender(self):
+        # Started on first use so the thread belongs to the (forked) worker process
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._drain, name='mailer-outbox', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self) -> list:
+        """Wait for messages that are due and take up to batch_size of them"""
+        with self._cond:
+            while True:
+                now = time.time()
+                due = [item for item in self._outbox if item['not_before'] <= now]
+                if due:
+                    batch = due[:self.batch_size]
+                    for item in batch:
+                        self._outbox.remove(item)
+                    return batch
+                waits = [item['not_before'] - now for item in self._outbox]
+                self._cond.wait(min(waits) if waits else None)
+
+    def _drain(self):
+        while True:
+            batch = self._next_batch()
+            with self._lock:
+                self._stats['batches'] += 1
+            for item in batch:
+                item['attempts'] += 1
+            pending = list(batch)
+            try:
+                with self.pool.connection() as (conn, sent):
+                    while pending:
+                        item = pending[0]
+                        started = time.time()
+                        try:
+                            conn.sendmail(self.sender, item['to'], item['message'])
+                        except Exception as e:
+                            if is_connection_error(e):
+                                raise
+                            # Rejected message (bad recipient, policy); the connection is fine
+                            pending.pop(0)
+                            self._record(started, False)
+                            self._retry_or_give_up(item, e)
+                            continue
+                        pending.pop(0)
+                        sent()
+                        self._record(started, True)
+            except Exception as e:
+                # Connection lost or could not be opened: everything left in the batch waits
+                logger.warning(f"SMTP batch interrupted with {len(pending)} message(s) unsent: {e}")
+                for item in pending:
+                    self._retry_or_give_up(item, e)
+
+    def _retry_or_give_up(self, item: dict, error: Exception):
+        if item['attempts'] < self.max_attempts:
+            delay = self.retry_delay * (2 ** (item['attempts'] - 1))
+            item['not_before'] = time.time() + delay
+            with self._lock:
+                self._stats['retried'] += 1
+            with self._cond:
+                self._outbox.append(item)
+                self._cond.notify()
+            return
+        logger.error(f"Giving up on email {item['id']} to {item['to']} after {item['attempts']} attempts: {error}")
+        with self._lock:
+            self._stats['failed'] += 1
+        if item['on_give_up'] is not None:
+            try:
+                item['on_give_up'](error)
+            except Exception as give_up_error:
+                logger.error(f"Email give-up handler failed: {give_up_error}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        with self._cond:
+            stats['queued'] = len(self._outbox)
+        send_seconds = stats.pop('send_seconds')
+        stats['avg_send_ms'] = round(send_seconds * 1000 / stats['attempts'], 1) if stats['attempts'] else None
+        stats['pool'] = self.pool.stats()
+        return stats
+
+
+def _from_config() -> Mailer:
+    from config import Config
+    pool = SMTPPool(host=Config.SMTP_SERVER,
+                    port=Config.SMTP_PORT,
+                    username=getattr(Config, 'SMTP_USERNAME', None),
+                    password=getattr(Config, 'SMTP_PASSWORD', None),
+                    use_tls=Config.SMTP_USE_TLS,
+                    size=Config.SMTP_POOL_SIZE,
+                    idle_timeout=Config.SMTP_IDLE_TIMEOUT,
+                    max_messages=Config.SMTP_MAX_MESSAGES_PER_CONNECTION)
+    return Mailer(pool,
+                  batch_size=Config.SMTP_BATCH_SIZE,
+                  max_attempts=Config.SMTP_MAX_ATTEMPTS,
+                  retry_delay=Config.SMTP_RETRY_DELAY)
+
+
+# Global instance
+mailer = _from_config()
@@ -0,0 +1,141 @@
+"""
+Notification Feed
+Per-customer version stamps for the notifications list, so browsers stop re-reading it
+from the database every 30 seconds.
+
+Every change to a customer's notifications (create, mark read, clear, cleanup) bumps
+that customer's version. /api/customer/notifications sends the version as its ETag and
+answers a matching If-None-Match with 304 before touching the database.
+/api/customer/notifications/events tells a client when its version moved: it long-polls
+when the worker has a free waiter slot (NOTIFICATION_FEED_MAX_WAITERS) and otherwise
+answers at once with a retry hint, which costs one file read. With NOTIFICATION_SSE the
+same changes are also offered as an EventSource stream.
+
+Versions are stored like payment events (one small file per customer under FEED_DIR), so
+all gunicorn workers agree. A customer without a file gets a fresh version, which makes
+clients refetch once after a restart or cleanup instead of trusting a stale ETag.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+from utils.payment_events import PaymentEvents
+
+logger = logging.getLogger(__name__)
+
+FEED_DIR = os.path.join(tempfile.gettempdir(), 'computershop_notification_feed')
+
+
+class NotificationFeed:
+    """Versioned change feed of each customer's notifications"""
+
+    def __init__(self, directory: str = FEED_DIR, max_waiters: int = 0, poll_interval: float = 30,
+                 stream_duration: float = 300):
+        self.poll_interval = poll_interval
+        self.stream_duration = stream_duration
+        self._events = PaymentEvents(directory, max_waiters=max_waiters, busy_retry=poll_interval)
+        self._lock = threading.Lock()
+        self._stats = {
+            'bumps': 0,
+            'not_modified': 0,
+            'full_reads': 0,
+            'streams': 0,
+        }
+
+    @staticmethod
+    def _channel(customer_id) -> str:
+        return f"customer:{int(customer_id)}"
+
+    def bump(self, customer_id, reason: str = 'changed') -> int:
+        """Record that customer_id's notifications changed; never raises"""
+        try:
+            channel = self._channel(customer_id)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid customer id for notification feed: {customer_id!r}")
+            return 0
+        with self._lock:
+            self._stats['bumps'] += 1
+        return self._events.publish(channel, reason)
+
+    def bump_many(self, customer_ids, reason: str = 'changed'):
+        for customer_id in set(customer_ids):
+            self.bump(customer_id, reason)
+
+    def version(self, customer_id) -> int:
+        """Current version, creating one if the customer has none yet"""
+        event = self._events.current(self._channel(customer_id))
+        if event is None:
+            return self.bump(customer_id, 'initial')
+        return event['version']
+
+    def etag(self, customer_id, variant: str = '') -> str:
+        return f"n{int(customer_id)}-{self.version(customer_id)}{variant}"
+
+    def record_read(self, not_modified: bool):
+        with self._lock:
+            self._stats['not_modified' if not_modified else 'full_reads'] += 1
+
+    def wait(self, customer_id, since: Optional[int], timeout: float) -> Dict[str, Any]:
+        """
+        {'version', 'changed', 'retry_after'}: returns as soon as the version differs from
+        since, else blocks up to timeout if a waiter slot is free (retry_after = 0) or
+        answers at once with retry_after = poll_interval.
+        """
+        version = self.version(customer_id)
+        if since is None or version != since:
+            return {'version': version, 'changed': since is not None, 'retry_after': 0}
+        result = self._events.wait(self._channel(customer_id), since=since, timeout=timeout)
+        event = result['event']
+        return {
+            'version': event['version'] if event else version,
+            'changed': result['changed'],
+            'retry_after': result['retry_after'],
+        }
+
+    def stream(self, customer_id, since: Optional[int], timeout: float) -> Iterator[str]:
+        """
+        Server-sent events: a `version` event whenever the version moves, comments as
+        keep-alives, closing after stream_duration seconds (EventSource then reconnects
+        with Last-Event-ID). When no waiter slot is free it asks the browser to reconnect
+        after poll_interval instead.
+        """
+        with self._lock:
+            self._stats['streams'] += 1
+        yield f"retry: {int(self.poll_interval * 1000)}\n\n"
+        deadline = time.time() + self.stream_duration
+        while time.time() < deadline:
+            result = self.wait(customer_id, since, min(timeout, max(deadline - time.time(), 0)))
+            if result['version'] != since:
+                since = result['version']
+                yield f"id: {since}\nevent: version\ndata: {json.dumps({'version': since})}\n\n"
+            elif result['retry_after']:
+                return
+            else:
+                yield ": keep-alive\n\n"
+
+    def cleanup(self):
+        self._events.cleanup()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        events = self._events.stats()
+        stats.update(waiting=events['waiting'], max_waiters=events['max_waiters'],
+                     long_polls=events['waits'], busy=events['busy'])
+        return stats
+
+
+def _from_config() -> NotificationFeed:
+    from config import Config
+    return NotificationFeed(max_waiters=Config.NOTIFICATION_FEED_MAX_WAITERS,
+                            poll_interval=Config.NOTIFICATION_FEED_POLL,
+                            stream_duration=Config.NOTIFICATION_SSE_DURATION)
+
+
+# Global instance
+notification_feed = _from_config()
@@ -0,0 +1,176 @@
+"""
+Payment Events
+Push channel for payment state changes, replacing clients that poll status endpoints
+every few seconds.
+
+Code that completes a payment publishes to a channel (`order:<id>`, `khqr:<payment_id>`,
+`session:<id>`). Each publish writes a small JSON file under EVENT_DIR with a
+monotonically increasing version, so every gunicorn worker sees it. Clients long-poll
+with the last version they saw: wait() returns as soon as a newer version exists, or
+after `timeout` seconds with the unchanged state. Waiting costs a file stat per second
+and no database connection.
+
+Sync gunicorn workers have only a few threads, so at most `max_waiters` requests per
+worker block at once. Beyond that wait() answers immediately and the response tells
+the client to retry after `busy_retry` seconds.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_DIR = os.path.join(tempfile.gettempdir(), 'computershop_payment_events')
+
+
+class PaymentEvents:
+    """File-backed, versioned payment state per channel with long-poll waiting"""
+
+    def __init__(self, directory: str = EVENT_DIR, max_waiters: int = 1, poll_interval: float = 1.0,
+                 busy_retry: float = 5, retention: float = 86400):
+        self.directory = directory
+        self.max_waiters = max_waiters
+        self.poll_interval = poll_interval
+        self.busy_retry = busy_retry
+        self.retention = retention
+        self._condition = threading.Condition()
+        self._waiters = 0
+        self._publishes = 0
+        self._stats = {
+            'published': 0,
+            'waits': 0,
+            'woken': 0,
+            'timeouts': 0,
+            'busy': 0,
+        }
+
+    @staticmethod
+    def _valid(channel: str) -> bool:
+        return bool(channel) and all(c.isalnum() or c in ':-_' for c in channel)
+
+    def _path(self, channel: str) -> str:
+        return os.path.join(self.directory, f"{channel.replace(':', '_')}.json")
+
+    def publish(self, channel: str, status: str, **data) -> int:
+        """
+        Record a new state for a channel and wake its waiters; returns the version (0 if
+        the channel name is invalid). Never raises on I/O errors, so callers can publish
+        right after their commit.
+        """
+        if not self._valid(channel):
+            logger.warning(f"Invalid payment event channel: {channel!r}")
+            return 0
+        # Microseconds stay exact as JavaScript numbers (below 2**53); never reuse or go
+        # back from the version already on disk
+        previous = self.current(channel)
+        version = max(time.time_ns() // 1000, previous['version'] + 1 if previous else 0)
+        event = dict(data, channel=channel, status=status, version=version)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(channel)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(event, f, default=str)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not record payment event for {channel}: {e}")
+        with self._condition:
+            self._stats['published'] += 1
+            self._publishes += 1
+            self._condition.notify_all()
+        if self._publishes % 500 == 0:
+            self.cleanup()
+        return version
+
+    def publish_order(self, order_id, status: str, **data) -> int:
+        """Publish on order:<order_id>"""
+        try:
+            order_id = int(order_id)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid order id for payment event: {order_id!r}")
+            return 0
+        return self.publish(f"order:{order_id}", status, order_id=order_id, **data)
+
+    def current(self, channel: str) -> Optional[Dict[str, Any]]:
+        """Latest event on a channel, or None if nothing was published"""
+        if not self._valid(channel):
+            return None
+        try:
+            with open(self._path(channel)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def wait(self, channel: str, since: int = 0, timeout: float = 25) -> Dict[str, Any]:
+        """
+        Block until the channel has a version newer than `since` or timeout passes.
+        Returns {'event': latest event or None, 'changed': bool, 'retry_after': seconds}.
+        """
+        event = self.current(channel)
+        if (event and event['version'] > since) or timeout <= 0:
+            return {'event': event, 'changed': bool(event and event['version'] > since), 'retry_after': 0}
+
+        with self._condition:
+            if self._waiters >= self.max_waiters:
+                self._stats['busy'] += 1
+                return {'event': event, 'changed': False, 'retry_after': self.busy_retry}
+            self._waiters += 1
+            self._stats['waits'] += 1
+
+        try:
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    with self._condition:
+                        self._stats['timeouts'] += 1
+                    return {'event': event, 'changed': False, 'retry_after': 0}
+                # Woken at once by a publish in this worker; other workers' publishes
+                # are seen on the next file check
+                with self._condition:
+                    self._condition.wait(min(self.poll_interval, remaining))
+                event = self.current(channel)
+                if event and event['version'] > since:
+                    with self._condition:
+                        self._stats['woken'] += 1
+                    return {'event': event, 'changed': True, 'retry_after': 0}
+        finally:
+            with self._condition:
+                self._waiters -= 1
+
+    def cleanup(self):
+        """Delete channel files not updated for `retention` seconds"""
+        cutoff = time.time() - self.retention
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            stats = dict(self._stats)
+            stats['waiting'] = self._waiters
+        stats['max_waiters'] = self.max_waiters
+        return stats
+
+
+def _from_config() -> PaymentEvents:
+    from config import Config
+    return PaymentEvents(max_waiters=Config.PAYMENT_EVENTS_MAX_WAITERS,
+                         busy_retry=Config.PAYMENT_EVENTS_BUSY_RETRY)
+
+
+# Global instance
+payment_events = _from_config()
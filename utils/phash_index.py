@@ -0,0 +1,181 @@
+"""
+Perceptual Hash Index
+Near-duplicate lookup for payment screenshots without re-decoding stored images.
+
+order_screenshots.phash holds the 64-bit imagehash.phash of each upload, computed once
+by ScreenshotFraudDetector.verify_upload. Every worker keeps those hashes in a
+multi-index hash table, so "all screenshots within distance d" compares against the
+few hashes sharing a byte with the query instead of every row. Rows inserted by other workers are picked up by id
+before each lookup; a full reload every `reload_interval` seconds catches updated rows.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import get_db
+from utils.schema_registry import schema_registry
+
+logger = logging.getLogger(__name__)
+
+PHASH_BITS = 64
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def phash_to_int(image_hash) -> int:
+    """imagehash.ImageHash -> unsigned 64-bit int (the order_screenshots.phash value)"""
+    return int(str(image_hash), 16)
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit ints: each value is filed under its 8 bytes, one
+    table per byte position. Two hashes within distance d < 8 agree exactly on at least
+    one byte (pigeonhole), so a search only checks values sharing a byte with the query,
+    about 8 * N / 256 candidates.
+    """
+
+    CHUNKS = 8
+    CHUNK_BITS = PHASH_BITS // CHUNKS
+
+    def __init__(self):
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(self.CHUNKS)]
+        self._entries: Dict[int, List[Any]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _chunks(self, value: int):
+        mask = (1 << self.CHUNK_BITS) - 1
+        for position in range(self.CHUNKS):
+            yield position, (value >> (position * self.CHUNK_BITS)) & mask
+
+    def add(self, value: int, entry: Any):
+        self._size += 1
+        entries = self._entries.get(value)
+        if entries is not None:
+            entries.append(entry)
+            return
+        self._entries[value] = [entry]
+        for position, chunk in self._chunks(value):
+            self._tables[position].setdefault(chunk, []).append(value)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """(distance, entry) for every entry within max_distance of value"""
+        if max_distance >= self.CHUNKS:
+            raise ValueError(f"max_distance must be below {self.CHUNKS}")
+        seen = set()
+        results = []
+        for position, chunk in self._chunks(value):
+            for candidate in self._tables[position].get(chunk, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = hamming(value, candidate)
+                if distance <= max_distance:
+                    results.extend((distance, entry) for entry in self._entries[candidate])
+        return results
+
+
+class PHashIndex:
+    """Per-worker multi-index of order_screenshots.phash, refreshed from the database"""
+
+    def __init__(self, reload_interval: float = 300):
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._index = MultiIndexHash()
+        self._last_id = 0
+        self._added_ids = set()  # rows add()ed here that refresh() has not reached yet
+        self._loaded_at = 0.0
+        self._stats = {
+            'lookups': 0,
+            'reloads': 0,
+            'rows_loaded': 0,
+            'total_lookup_ms': 0.0,
+        }
+
+    @staticmethod
+    def available() -> bool:
+        return schema_registry.has_column('order_screenshots', 'phash')
+
+    def _fetch(self, after_id: int) -> List[tuple]:
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT id, order_id, phash, uploaded_at
+                FROM order_screenshots
+                WHERE id > %s AND phash IS NOT NULL
+                ORDER BY id
+            """, (after_id,))
+            return cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+    def refresh(self, full: bool = False):
+        """Load rows added since the last refresh; full=True rebuilds the index"""
+        with self._lock:
+            full = full or time.time() - self._loaded_at > self.reload_interval
+            rows = self._fetch(0 if full else self._last_id)
+            if full:
+                self._index = MultiIndexHash()
+                self._last_id = 0
+                self._added_ids.clear()
+                self._loaded_at = time.time()
+                self._stats['reloads'] += 1
+            for row_id, order_id, phash, uploaded_at in rows:
+                self._last_id = max(self._last_id, row_id)
+                if row_id in self._added_ids:
+                    self._added_ids.discard(row_id)
+                    continue
+                self._index.add(int(phash), (order_id, uploaded_at))
+            self._stats['rows_loaded'] += len(rows)
+
+    def add(self, row_id: int, order_id: int, phash: int, uploaded_at=None):
+        """Index a row this worker just inserted, so it need not wait for refresh()"""
+        with self._lock:
+            if row_id > self._last_id and row_id not in self._added_ids:
+                self._index.add(phash, (order_id, uploaded_at))
+                self._added_ids.add(row_id)
+
+    def find_similar(self, phash: int, max_distance: int,
+                     exclude_order_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Screenshots of other orders within max_distance bits of phash, closest first"""
+        self.refresh()
+        start = time.perf_counter()
+        with self._lock:
+            matches = self._index.search(phash, max_distance)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['lookups'] += 1
+            self._stats['total_lookup_ms'] += elapsed
+
+        similar = []
+        for distance, (order_id, uploaded_at) in sorted(matches, key=lambda m: m[0]):
+            if order_id == exclude_order_id:
+                continue
+            similar.append({
+                'order_id': order_id,
+                'similarity': 1 - distance / PHASH_BITS,
+                'uploaded_at': uploaded_at
+            })
+        return similar
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['indexed'] = len(self._index)
+            stats['last_id'] = self._last_id
+        lookups = stats.pop('total_lookup_ms')
+        stats['avg_lookup_ms'] = round(lookups / stats['lookups'], 3) if stats['lookups'] else 0.0
+        return stats
+
+
+# Global instance
+phash_index = PHashIndex()
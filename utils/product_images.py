@@ -0,0 +1,262 @@
+"""
+Product Image Derivatives
+Fixed-width WebP and JPEG copies of uploaded product photos for grids, cards and cart
+thumbnails, so those pages stop downloading multi-megabyte originals.
+
+Product.create/update queue generate() on the job queue for the photo, back_view and
+left_rear_view they store; scripts/generate_product_image_derivatives.py backfills
+existing uploads. Derivatives live in static/uploads/products/derivatives as
+`<filename>.<width>.webp` / `.jpg`, next to a `<filename>.json` sidecar listing the
+widths that exist and the original's own width. Widths at or above the original's width
+are not generated; the original itself is the last, widest srcset candidate.
+
+Templates use product_picture() (a <picture> with a WebP source and a JPEG srcset
+fallback) or product_srcset(); both fall back to the original when no derivatives
+exist yet.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from markupsafe import Markup, escape
+
+from utils.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(BASE_DIR, 'static', 'uploads', 'products')
+SOURCE_URL = '/static/uploads/products'
+
+# Card grids: four columns on desktop, two on tablets, one on phones
+GRID_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 50vw, 100vw'
+
+FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+
+
+class ProductImagePipeline:
+    """Generate and look up fixed-width derivatives of product photos"""
+
+    def __init__(self, source_dir: str = SOURCE_DIR, source_url: str = SOURCE_URL,
+                 widths: Iterable[int] = (160, 320, 480, 800), quality: int = 80,
+                 recheck_interval: float = 60):
+        self.source_dir = source_dir
+        self.source_url = source_url
+        self.output_dir = os.path.join(source_dir, 'derivatives')
+        self.output_url = f"{source_url}/derivatives"
+        self.widths = tuple(sorted(set(int(w) for w in widths)))
+        self.quality = quality
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._known: Dict[str, Tuple[Tuple[int, ...], Optional[int], float]] = {}
+        self._stats = {
+            'generated': 0,
+            'skipped': 0,
+            'failed': 0,
+            'bytes_original': 0,
+            'bytes_derivatives': 0,
+        }
+
+    @staticmethod
+    def _valid(filename: Optional[str]) -> bool:
+        return bool(filename) and os.path.basename(filename) == filename and not filename.startswith('.')
+
+    def _sidecar(self, filename: str) -> str:
+        return os.path.join(self.output_dir, f"{filename}.json")
+
+    def _output(self, filename: str, width: int, extension: str) -> str:
+        return os.path.join(self.output_dir, f"{filename}.{width}.{extension}")
+
+    def generate(self, filename: str, force: bool = False) -> List[int]:
+        """
+        Write the derivatives of one uploaded photo and return their widths. Up-to-date
+        derivatives (sidecar newer than the original) are kept unless force is set.
+        """
+        if not self._valid(filename):
+            raise ValueError(f"Invalid product image name: {filename!r}")
+        source = os.path.join(self.source_dir, filename)
+        source_mtime = os.path.getmtime(source)
+
+        if not force:
+            try:
+                with open(self._sidecar(filename)) as f:
+                    sidecar = json.load(f)
+                # Sidecars written before source_width was recorded are regenerated once
+                if sidecar.get('source_mtime') == source_mtime and sidecar.get('source_width'):
+                    with self._lock:
+                        self._stats['skipped'] += 1
+                    return sidecar.get('widths', [])
+            except (OSError, ValueError):
+                pass
+
+        from PIL import Image, ImageOps
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        written = []
+        derivative_bytes = 0
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                flattened = Image.new('RGB', image.size, (255, 255, 255))
+                flattened.paste(image, mask=image.split()[-1])
+                image = flattened
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            for width in self.widths:
+                if width >= image.width:
+                    break
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+                for extension, pil_format in FORMATS:
+                    path = self._output(filename, width, extension)
+                    tmp = f"{path}.{os.getpid()}.tmp"
+                    options = {'quality': self.quality}
+                    if pil_format == 'JPEG':
+                        options.update(optimize=True, progressive=True)
+                    else:
+                        options.update(method=6)
+                    resized.save(tmp, format=pil_format, **options)
+                    os.replace(tmp, path)
+                    derivative_bytes += os.path.getsize(path)
+                written.append(width)
+            source_width = image.width
+
+        # Derivatives for widths no longer configured (or a replaced, smaller original)
+        for width in set(self._lookup_sidecar(filename)[0]) - set(written):
+            for extension, _ in FORMATS:
+                try:
+                    os.remove(self._output(filename, width, extension))
+                except OSError:
+                    pass
+
+        tmp = f"{self._sidecar(filename)}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'source_mtime': source_mtime, 'widths': written, 'source_width': source_width}, f)
+        os.replace(tmp, self._sidecar(filename))
+
+        with self._lock:
+            self._known[filename] = (tuple(written), source_width, time.time())
+            self._stats['generated'] += 1
+            self._stats['bytes_original'] += os.path.getsize(source)
+            self._stats['bytes_derivatives'] += derivative_bytes
+        return written
+
+    def generate_many(self, *filenames: Optional[str]) -> Dict[str, List[int]]:
+        """Job handler: derivatives for every stored filename (None entries are skipped)"""
+        results = {}
+        for filename in filenames:
+            if not filename:
+                continue
+            try:
+                results[filename] = self.generate(filename)
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed'] += 1
+                logger.error(f"Could not generate derivatives for {filename}: {e}")
+                raise
+        return results
+
+    def queue(self, *filenames: Optional[str]) -> Optional[str]:
+        """Generate derivatives in the background; returns the job id (None if nothing to do)"""
+        filenames = tuple(f for f in filenames if self._valid(f))
+        if not filenames:
+            return None
+        try:
+            return job_queue.enqueue('product_image_derivatives', args=filenames)
+        except Exception as e:
+            logger.error(f"Could not queue image derivatives for {filenames}: {e}")
+            return None
+
+    def _lookup_sidecar(self, filename: str) -> Tuple[Tuple[int, ...], Optional[int]]:
+        """(derivative widths, original width) from the sidecar"""
+        try:
+            with open(self._sidecar(filename)) as f:
+                sidecar = json.load(f)
+            return tuple(sidecar.get('widths', [])), sidecar.get('source_width')
+        except (OSError, ValueError):
+            return (), None
+
+    def _lookup(self, filename: Optional[str]) -> Tuple[Tuple[int, ...], Optional[int]]:
+        """_lookup_sidecar, rechecked every recheck_interval seconds"""
+        if not self._valid(filename):
+            return (), None
+        now = time.time()
+        with self._lock:
+            known = self._known.get(filename)
+        if known is not None and now - known[2] < self.recheck_interval:
+            return known[0], known[1]
+        widths, source_width = self._lookup_sidecar(filename)
+        with self._lock:
+            self._known[filename] = (widths, source_width, now)
+        return widths, source_width
+
+    def available_widths(self, filename: Optional[str]) -> Tuple[int, ...]:
+        """Widths with derivatives on disk"""
+        return self._lookup(filename)[0]
+
+    def original_url(self, filename: str) -> str:
+        return f"{self.source_url}/{filename}"
+
+    def srcset(self, filename: Optional[str], extension: str = 'webp') -> str:
+        """
+        `url 160w, url 320w, ..., original 1200w` for the derivatives of filename ('' when
+        none). The original comes last with its real width, so wide slots and high-density
+        screens can still pick it over the largest derivative.
+        """
+        widths, source_width = self._lookup(filename)
+        candidates = [f"{self.output_url}/{filename}.{width}.{extension} {width}w" for width in widths]
+        if candidates and source_width:
+            candidates.append(f"{self.original_url(filename)} {source_width}w")
+        return ', '.join(candidates)
+
+    def src(self, filename: Optional[str], width: int = 480) -> str:
+        """JPEG derivative closest to (not below) width, else the original"""
+        widths = self.available_widths(filename)
+        if not widths:
+            return self.original_url(filename)
+        chosen = next((w for w in widths if w >= width), widths[-1])
+        return f"{self.output_url}/{filename}.{chosen}.jpg"
+
+    def picture(self, filename: Optional[str], alt: str = '', class_: str = '',
+                sizes: str = GRID_SIZES, width: int = 480,
+                placeholder: str = '/static/images/placeholder-product.jpg') -> Markup:
+        """<picture> with a WebP srcset, JPEG srcset fallback and lazy loading"""
+        attributes = f'alt="{escape(alt)}" loading="lazy" decoding="async"'
+        if class_:
+            attributes += f' class="{escape(class_)}"'
+        if not self._valid(filename):
+            return Markup(f'<img src="{escape(placeholder)}" {attributes}>')
+        if not self.available_widths(filename):
+            return Markup(f'<img src="{escape(self.original_url(filename))}" {attributes}>')
+        return Markup(
+            '<picture>'
+            f'<source type="image/webp" srcset="{escape(self.srcset(filename, "webp"))}" sizes="{escape(sizes)}">'
+            f'<img src="{escape(self.src(filename, width))}" srcset="{escape(self.srcset(filename, "jpg"))}" '
+            f'sizes="{escape(sizes)}" {attributes}>'
+            '</picture>'
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['known'] = len(self._known)
+        stats['widths'] = list(self.widths)
+        return stats
+
+
+def _from_config() -> ProductImagePipeline:
+    from config import Config
+    return ProductImagePipeline(widths=Config.PRODUCT_IMAGE_WIDTHS,
+                                quality=Config.PRODUCT_IMAGE_QUALITY)
+
+
+# Global instance
+product_images = _from_config()
+
+job_queue.register('product_image_derivatives', product_images.generate_many)
@@ -0,0 +1,328 @@
+"""
+Product Search Index
+In-process inverted index over product name, description and spec columns.
+Replaces `name LIKE '%q%'` table scans with ranked, prefix-aware lookups; a name that
+contains the query as a substring still matches, as it did with LIKE. Rebuilt whenever
+the catalog cache is invalidated (i.e. after product writes).
+Autocomplete also tolerates typos (via a trie over the vocabulary) and favours
+products that sell well.
+"""
+
+import math
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from flask import has_request_context
+
+from utils.db_pool import get_pool
+from utils.db_context import get_request_connection
+from utils.catalog_cache import catalog_cache
+from utils.schema_registry import schema_registry
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of a match in each indexed column
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'cpu': 2.0,
+    'ram': 2.0,
+    'storage': 2.0,
+    'graphics': 2.0,
+    'display': 2.0,
+    'description': 1.0,
+}
+PREFIX_FACTOR = 0.7          # a prefix match scores less than a whole-token match
+MAX_PREFIX_EXPANSIONS = 64   # vocabulary terms considered per query prefix
+MAX_AGE = 600                # seconds; also picks up writes made outside the models and new sales
+FUZZY_FACTOR = 0.5           # divided by the edit distance of a typo-corrected match
+MAX_FUZZY_TERMS = 64         # vocabulary terms considered per misspelled token
+POPULARITY_WEIGHT = 0.25     # suggestion score multiplier per log(units sold)
+SUBSTRING_SCORE = 0.5        # name contains the query but no token matched (`LIKE '%q%'`)
+
+# Runs between whitespace and ASCII punctuation, so names in other scripts (combining
+# vowel signs included) are indexed as whole words too
+_TOKEN_RE = re.compile(r'[^\s!-/:-@\[-`{-~]+(?:\.[0-9]+)?')
+
+
+def tokenize(text) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def max_edit_distance(token: str) -> int:
+    """Typos tolerated for a token: none for very short input, 2 for long words"""
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 7 else 2
+
+
+class _TrieNode:
+    __slots__ = ('children', 'terms')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.terms: List[str] = []  # every vocabulary term below this node
+
+
+def id_filter(column: str, ids) -> tuple:
+    """SQL condition + params restricting `column` to ids (matches nothing when ids is empty)"""
+    ids = list(ids)
+    if not ids:
+        return "1 = 0", []
+    return f"{column} IN ({','.join(['%s'] * len(ids))})", ids
+
+
+class _Snapshot:
+    """Immutable index state; swapped in whole so readers never see a half-built index"""
+
+    def __init__(self, docs, postings, brands, popularity, generation):
+        self.docs: Dict[int, dict] = docs
+        self.postings: Dict[str, Dict[int, float]] = postings
+        self.vocabulary: List[str] = sorted(postings)
+        # (lowercased name, id) sorted, for `name LIKE 'brand%'` prefix lookups
+        self.names: List[tuple] = sorted(brands)
+        self.popularity: Dict[int, float] = popularity
+        self.trie = _TrieNode()
+        for term in self.vocabulary:
+            node = self.trie
+            for char in term:
+                node = node.children.setdefault(char, _TrieNode())
+                node.terms.append(term)
+        self.generation = generation
+        self.built_at = time.time()
+
+
+class ProductSearchIndex:
+    """Ranked product search with prefix matching for autocomplete"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+
+    def refresh(self, conn=None) -> int:
+        """Rebuild the index from the products table. Returns the number of indexed products."""
+        generation = catalog_cache.generation()
+        owned = False
+        if conn is None:
+            if has_request_context():
+                conn = get_request_connection()
+            else:
+                conn = get_pool().get_connection()
+                owned = True
+        cur = conn.cursor(dictionary=True)
+        try:
+            query = f"""
+                SELECT id, name, archived, {', '.join(c for c in FIELD_WEIGHTS if c != 'name')}
+                FROM products
+            """
+            if schema_registry.has_column('products', 'deleted'):
+                query += " WHERE (deleted = FALSE OR deleted IS NULL)"
+            cur.execute(query)
+            rows = cur.fetchall()
+
+            cur.execute("""
+                SELECT oi.product_id, SUM(oi.quantity) AS units
+                FROM order_items oi
+                JOIN orders o ON o.id = oi.order_id
+                WHERE o.status = 'COMPLETED'
+                GROUP BY oi.product_id
+            """)
+            popularity = {
+                row['product_id']: 1 + POPULARITY_WEIGHT * math.log1p(float(row['units'] or 0))
+                for row in cur.fetchall()
+            }
+        finally:
+            cur.close()
+            if owned:
+                conn.close()
+
+        docs = {}
+        postings: Dict[str, Dict[int, float]] = {}
+        brands: List[tuple] = []
+        for row in rows:
+            product_id = row['id']
+            name = (row['name'] or '').strip()
+            docs[product_id] = {
+                'id': product_id,
+                'name': row['name'],
+                'name_key': ' '.join(tokenize(name)),
+                'name_lower': name.lower(),
+                'archived': bool(row['archived']),
+            }
+            if name:
+                brands.append((name.lower(), product_id))
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(row[field]):
+                    entry = postings.setdefault(token, {})
+                    if entry.get(product_id, 0) < weight:
+                        entry[product_id] = weight
+
+        snapshot = _Snapshot(docs, postings, brands, popularity, generation)
+        self._snapshot = snapshot
+        logger.info(f"Product search index built: {len(docs)} products, {len(snapshot.vocabulary)} terms")
+        return len(docs)
+
+    def _current(self) -> _Snapshot:
+        snapshot = self._snapshot
+        stale = (snapshot is None
+                 or snapshot.generation != catalog_cache.generation()
+                 or time.time() - snapshot.built_at > MAX_AGE)
+        if not stale:
+            return snapshot
+
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.refresh()
+                return self._snapshot
+
+        # Someone else is already rebuilding: keep serving the previous snapshot
+        if self._lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Product search index rebuild failed, serving previous index: {e}")
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def _expand(self, snapshot: _Snapshot, token: str):
+        """Yield (term, factor) for the exact token and vocabulary terms it prefixes"""
+        vocabulary = snapshot.vocabulary
+        i = bisect_left(vocabulary, token)
+        expansions = 0
+        while i < len(vocabulary) and vocabulary[i].startswith(token) and expansions < MAX_PREFIX_EXPANSIONS:
+            term = vocabulary[i]
+            yield term, 1.0 if term == token else PREFIX_FACTOR
+            i += 1
+            expansions += 1
+
+    def _fuzzy(self, snapshot: _Snapshot, token: str):
+        """
+        Yield (term, factor) for vocabulary terms that have a prefix within
+        max_edit_distance(token) edits of the token (Levenshtein walk over the trie)
+        """
+        limit = max_edit_distance(token)
+        if not limit:
+            return
+        best: Dict[str, int] = {}
+        stack = [(child, char, list(range(len(token) + 1))) for char, child in snapshot.trie.children.items()]
+        while stack:
+            node, char, previous = stack.pop()
+            row = [previous[0] + 1]
+            for i in range(1, len(token) + 1):
+                row.append(min(row[i - 1] + 1, previous[i] + 1, previous[i - 1] + (token[i - 1] != char)))
+            distance = row[-1]
+            if distance <= limit:
+                for term in node.terms:
+                    if distance < best.get(term, limit + 1):
+                        best[term] = distance
+            if min(row) <= limit:
+                stack.extend((child, c, row) for c, child in node.children.items())
+
+        ranked = sorted(best.items(), key=lambda item: (item[1], len(item[0])))[:MAX_FUZZY_TERMS]
+        for term, distance in ranked:
+            yield term, FUZZY_FACTOR / max(1, distance)
+
+    def search(self, query: str, limit: Optional[int] = None, include_archived: bool = False) -> List[int]:
+        """
+        Product ids matching every query token (as a whole token or a prefix) or whose
+        name contains the query, best match first; ties go to the newest product.
+        """
+        return self._rank(self._current(), query, limit, include_archived)
+
+    def _rank(self, snapshot: _Snapshot, query: str, limit: Optional[int], include_archived: bool,
+              fuzzy: bool = False, popular: bool = False) -> List[int]:
+        needle = (query or '').strip().lower()
+        if not needle:
+            return []
+        tokens = list(dict.fromkeys(tokenize(needle)))
+        total = max(1, len(snapshot.docs))
+
+        scores: Optional[Dict[int, float]] = None
+        for token in tokens:
+            token_scores: Dict[int, float] = {}
+            matches = list(self._expand(snapshot, token))
+            if not matches and fuzzy:
+                matches = list(self._fuzzy(snapshot, token))
+            for term, factor in matches:
+                entry = snapshot.postings[term]
+                idf = math.log(1 + total / len(entry))
+                for product_id, weight in entry.items():
+                    score = weight * idf * factor
+                    if score > token_scores.get(product_id, 0):
+                        token_scores[product_id] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: s + token_scores[pid] for pid, s in scores.items() if pid in token_scores}
+            if not scores:
+                break
+        scores = scores or {}
+
+        # Substring of the name, like `name LIKE '%q%'`: "book" still finds "MacBook"
+        for product_id, doc in snapshot.docs.items():
+            if product_id not in scores and needle in doc['name_lower']:
+                scores[product_id] = SUBSTRING_SCORE
+
+        phrase = ' '.join(tokens)
+        results = []
+        for product_id, score in scores.items():
+            doc = snapshot.docs[product_id]
+            if doc['archived'] and not include_archived:
+                continue
+            if phrase and doc['name_key'].startswith(phrase):
+                score *= 1.5
+            if popular:
+                score *= snapshot.popularity.get(product_id, 1.0)
+            results.append((-score, -product_id))
+        results.sort()
+        ids = [-pid for _, pid in results]
+        return ids[:limit] if limit else ids
+
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        """
+        Autocomplete entries ({'id', 'name'}) served straight from memory.
+        Misspelled tokens fall back to fuzzy matches; best sellers rank higher.
+        """
+        snapshot = self._current()
+        return [
+            {'id': product_id, 'name': snapshot.docs[product_id]['name']}
+            for product_id in self._rank(snapshot, query, limit, include_archived=False, fuzzy=True, popular=True)
+        ]
+
+    def brand_ids(self, brand: str, include_archived: bool = False) -> List[int]:
+        """Ids of products whose name starts with `brand` (case-insensitive, like `name LIKE 'brand%'`), newest first"""
+        snapshot = self._current()
+        prefix = (brand or '').strip().lower()
+        ids = []
+        for name, product_id in snapshot.names[bisect_left(snapshot.names, (prefix,)):]:
+            if not name.startswith(prefix):
+                break
+            ids.append(product_id)
+        return sorted(
+            (pid for pid in ids if include_archived or not snapshot.docs[pid]['archived']),
+            reverse=True
+        )
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'built': False}
+        return {
+            'built': True,
+            'products': len(snapshot.docs),
+            'terms': len(snapshot.vocabulary),
+            'named_products': len(snapshot.names),
+            'products_with_sales': len(snapshot.popularity),
+            'age_seconds': round(time.time() - snapshot.built_at, 1),
+        }
+
+
+# Global instance
+product_search = ProductSearchIndex()
@@ -0,0 +1,205 @@
+"""
+QR Images
+One QR rendering service for every KHQR/Bakong generator.
+
+PNGs are content-addressed: the key is a hash of the payload and render options, so
+the same payment payload is encoded once. Rendered images sit in a bounded in-memory
+LRU. With a store directory they are also written to disk next to the payload
+(`<key>.png` / `<key>.txt`), which lets any gunicorn worker serve /qr/<key>.png. That
+route returns raw PNG bytes with the key as ETag, replacing base64-in-JSON. url()
+records the payload only; the image is rendered the first time it is requested.
+"""
+
+import os
+import io
+import time
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+QR_STORE_DIR = os.path.join(tempfile.gettempdir(), 'computershop_qr')
+
+
+class QRImageService:
+    """Render QR PNGs once per payload; LRU in memory, optionally persisted on disk"""
+
+    def __init__(self, max_entries: int = 512, directory: Optional[str] = QR_STORE_DIR,
+                 retention: float = 86400):
+        self.max_entries = max_entries
+        self.directory = directory or None
+        self.retention = retention
+        self._images: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._payloads: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'renders': 0,
+        }
+
+    @staticmethod
+    def key(data: str, box_size: int = 4, border: int = 1) -> str:
+        return hashlib.sha256(f"{box_size}:{border}:{data}".encode()).hexdigest()[:32]
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def _remember(self, entries: OrderedDict, key: str, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _write(self, path: str, content: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.cleanup()
+
+    @staticmethod
+    def _render(data: str, box_size: int, border: int) -> bytes:
+        import qrcode
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+        img = qr.make_image(fill_color="black", back_color="white")
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+
+    def png(self, data: str, box_size: int = 4, border: int = 1) -> bytes:
+        """PNG bytes for a payload, rendered at most once per process (or store)"""
+        key = self.key(data, box_size, border)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return image
+
+        image = self._load(key)
+        if image is None:
+            image = self._render(data, box_size, border)
+            with self._lock:
+                self._stats['renders'] += 1
+            if self.directory:
+                try:
+                    self._write(self._path(key, 'png'), image)
+                except OSError as e:
+                    logger.warning(f"Could not persist QR image {key}: {e}")
+        with self._lock:
+            self._remember(self._images, key, image)
+        return image
+
+    def base64(self, data: str, box_size: int = 4, border: int = 1) -> str:
+        """Base64 PNG for the JSON APIs that still embed the image"""
+        return base64.b64encode(self.png(data, box_size, border)).decode()
+
+    def url(self, data: str, box_size: int = 4, border: int = 1) -> str:
+        """
+        /qr/<key>.png for a payload without rendering it: the payload is recorded so
+        png_by_key() can render on first request
+        """
+        key = self.key(data, box_size, border)
+        with self._lock:
+            known = key in self._payloads
+            self._remember(self._payloads, key, (data, box_size, border))
+        if self.directory and not known:
+            path = self._path(key, 'txt')
+            if not os.path.exists(path):
+                try:
+                    self._write(path, f"{box_size}\n{border}\n{data}".encode())
+                except OSError as e:
+                    logger.warning(f"Could not persist QR payload {key}: {e}")
+        return f"/qr/{key}.png"
+
+    def _load(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key, 'png'), 'rb') as f:
+                image = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._stats['disk_hits'] += 1
+        return image
+
+    def png_by_key(self, key: str) -> Optional[bytes]:
+        """PNG for a key handed out by url(); None for an unknown key"""
+        if not key.isalnum():
+            return None
+        with self._lock:
+            image = self._images.get(key)
+            payload = self._payloads.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return image
+        image = self._load(key)
+        if image is not None:
+            with self._lock:
+                self._remember(self._images, key, image)
+            return image
+        if payload is None and self.directory:
+            try:
+                with open(self._path(key, 'txt'), 'rb') as f:
+                    box_size, border, data = f.read().decode().split('\n', 2)
+                payload = (data, int(box_size), int(border))
+            except (OSError, ValueError):
+                payload = None
+        if payload is None:
+            return None
+        return self.png(*payload)
+
+    def cleanup(self):
+        """Delete stored images and payloads not written for `retention` seconds"""
+        if not self.directory:
+            return
+        cutoff = time.time() - self.retention
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_images'] = len(self._images)
+            stats['known_payloads'] = len(self._payloads)
+        stats['max_entries'] = self.max_entries
+        stats['store'] = self.directory
+        return stats
+
+
+def _from_config() -> QRImageService:
+    from config import Config
+    store = QR_STORE_DIR if Config.QR_IMAGE_STORE is None else Config.QR_IMAGE_STORE
+    return QRImageService(max_entries=Config.QR_IMAGE_CACHE_SIZE, directory=store)
+
+
+# Global instance
+qr_images = _from_config()
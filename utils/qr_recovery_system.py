@@ -6,8 +6,9 @@ Handles payment recovery from QR screenshots when server crashes or customer pay
 import re
 import hashlib
 from typing import Dict, Any, Optional, Tuple
-from models import get_db
+from models import get_db, SalesRollup
 from utils.payment_session_manager import PaymentSessionManager
+from utils.payment_events import payment_events
 
 class QRRecoverySystem:
     """
@@ -246,6 +247,8 @@ class QRRecoverySystem:
                 """, (order_id,))
                 
                 conn.commit()
+                SalesRollup.record_orders([order_id])
+                payment_events.publish_order(order_id, 'completed')
                 
                 # If screenshot provided, create payment session record
                 if screenshot_path:
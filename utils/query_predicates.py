@@ -0,0 +1,133 @@
+"""
+Query Predicates
+Index-friendly WHERE fragments for order queries.
+Dates become half-open ranges on the raw column (no DATE()/YEAR()/MONTH() wrappers) and
+statuses are compared directly instead of through LOWER(), so MySQL can use the
+(status, order_date) / (approval_status, order_date) / (customer_id, order_date) indexes
+from scripts/add_order_report_indexes.sql.
+
+Every helper returns (sql, params) for the caller to append to its own condition list.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import List, Tuple
+
+Predicate = Tuple[str, List]
+
+
+class OrderStatus:
+    """Canonical order statuses as written by the application"""
+    PENDING = 'PENDING'
+    PROCESSING = 'PROCESSING'
+    CONFIRMED = 'CONFIRMED'
+    COMPLETED = 'COMPLETED'
+    CANCELLED = 'CANCELLED'
+    REJECTED = 'REJECTED'
+    SHIPPED = 'SHIPPED'
+    DELIVERED = 'DELIVERED'
+
+
+class ApprovalStatus:
+    PENDING = 'Pending Approval'
+    APPROVED = 'Approved'
+    REJECTED = 'Rejected'
+
+
+class PaymentMethod:
+    """payment_method values written by the application"""
+    QR_PAYMENT = 'QR Payment'
+    KHQR_PAYMENT = 'KHQR Payment'
+    KHQR_BAKONG = 'KHQR_BAKONG'
+    CASH = 'Cash'
+    PAY_ON_DELIVERY = 'Pay on Delivery'
+
+
+def normalize_status(status) -> str:
+    """'completed' / 'Completed' / ' COMPLETED ' -> 'COMPLETED'"""
+    return str(status or '').strip().upper()
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _start_of(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+
+def between_days(column: str, start_day, end_day) -> Predicate:
+    """column falls on any day from start_day to end_day, both inclusive"""
+    start = _start_of(_as_date(start_day))
+    end = _start_of(_as_date(end_day)) + timedelta(days=1)
+    return f"{column} >= %s AND {column} < %s", [start, end]
+
+
+def on_day(column: str, day) -> Predicate:
+    """Replaces DATE(column) = day"""
+    return between_days(column, day, day)
+
+
+def today(column: str) -> Predicate:
+    """Replaces DATE(column) = CURDATE(); keeps using the database's clock"""
+    return f"{column} >= CURDATE() AND {column} < CURDATE() + INTERVAL 1 DAY", []
+
+
+def in_hour(column: str, day, hour: int) -> Predicate:
+    """Replaces DATE(column) = day AND HOUR(column) = hour"""
+    start = _start_of(_as_date(day)) + timedelta(hours=int(hour))
+    return f"{column} >= %s AND {column} < %s", [start, start + timedelta(hours=1)]
+
+
+def in_month(column: str, year: int, month: int) -> Predicate:
+    """Replaces YEAR(column) = year AND MONTH(column) = month"""
+    start = datetime(int(year), int(month), 1)
+    end = datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+    return f"{column} >= %s AND {column} < %s", [start, end]
+
+
+def this_month(column: str) -> Predicate:
+    """Replaces YEAR(column) = YEAR(CURDATE()) AND MONTH(column) = MONTH(CURDATE())"""
+    first = "CURDATE() - INTERVAL (DAYOFMONTH(CURDATE()) - 1) DAY"
+    return f"{column} >= {first} AND {column} < {first} + INTERVAL 1 MONTH", []
+
+
+def in_year(column: str, year: int) -> Predicate:
+    """Replaces YEAR(column) = year"""
+    return f"{column} >= %s AND {column} < %s", [datetime(int(year), 1, 1), datetime(int(year) + 1, 1, 1)]
+
+
+def status_in(column: str, *statuses) -> Predicate:
+    """
+    Replaces LOWER(column) IN (...). The orders tables use a case-insensitive collation,
+    so a plain comparison matches 'Completed' and 'COMPLETED' alike and stays sargable.
+    """
+    values = [normalize_status(s) for s in statuses]
+    if len(values) == 1:
+        return f"{column} = %s", values
+    return f"{column} IN ({','.join(['%s'] * len(values))})", values
+
+
+def status_not_in(column: str, *statuses) -> Predicate:
+    values = [normalize_status(s) for s in statuses]
+    return f"{column} NOT IN ({','.join(['%s'] * len(values))})", values
+
+
+def completed_or_approved(alias: str = 'o') -> Predicate:
+    """Orders that count as sales: status COMPLETED or approval_status Approved"""
+    prefix = f"{alias}." if alias else ''
+    return (f"({prefix}status = %s OR {prefix}approval_status = %s)",
+            [OrderStatus.COMPLETED, ApprovalStatus.APPROVED])
+
+
+def qr_payment_method(column: str) -> Predicate:
+    """
+    Every method Order.create treats as a QR payment ('QR' anywhere in it, any case), so
+    method strings outside the PaymentMethod constants still match. Not sargable: combine
+    it with a status / date predicate that narrows the rows first.
+    """
+    return f"{column} LIKE %s", ['%QR%']
+
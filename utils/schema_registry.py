@@ -0,0 +1,157 @@
+"""
+Schema Capability Registry
+Inspects the database schema once and caches which optional tables/columns exist,
+so model queries don't have to probe with SHOW COLUMNS / SHOW TABLES per request.
+"""
+
+import os
+import time
+import logging
+import tempfile
+import threading
+from typing import Dict, Set, Optional
+
+from flask import has_request_context
+
+from utils.db_pool import get_pool
+from utils.db_context import get_request_connection
+
+logger = logging.getLogger(__name__)
+
+# Optional schema pieces added by migrations in scripts/; logged at startup
+OPTIONAL_FEATURES = {
+    'product_soft_delete': ('products', 'deleted'),
+    'product_discounts': ('products', 'discount_percentage'),
+    'product_preorders': ('products', 'allow_preorder'),
+    'product_archive': ('products', 'archived'),
+    'customer_soft_delete': ('customers', 'deleted_at'),
+    'order_item_denormalization': ('order_items', 'product_name'),
+    'order_screenshots': ('order_screenshots', None),
+    'screenshot_phash': ('order_screenshots', 'phash'),
+    'payment_tracking': ('payment_tracking', None),
+    'payment_sessions': ('payment_sessions', None),
+    'notifications': ('notifications', None),
+    'volume_discounts': ('volume_discount_rules', None),
+    'sales_rollup': ('daily_sales_rollup', None),
+}
+
+
+# Touched by invalidate() so every gunicorn worker re-reads the schema, not just the one
+# that served the refresh request
+STAMP_FILE = os.path.join(tempfile.gettempdir(), 'computershop_schema.stamp')
+STAMP_CHECK_INTERVAL = 5  # seconds
+
+# After a failed refresh (e.g. a pool timeout under load) the last good schema is kept
+# and the next attempt waits RETRY_BACKOFF seconds, doubling up to RETRY_BACKOFF_MAX
+RETRY_BACKOFF = 5
+RETRY_BACKOFF_MAX = 300
+
+
+class SchemaRegistry:
+    """Cached view of information_schema for the configured database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: Optional[Dict[str, Set[str]]] = None
+        self._loaded_at = 0.0
+        self._stamp_checked_at = 0.0
+        self._stale = False
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def refresh(self, conn=None) -> Dict[str, bool]:
+        """
+        Re-read table and column names. Call at startup and after running a migration.
+        Returns the optional feature map. Inside a request the request connection is used.
+        """
+        owned = False
+        if conn is None:
+            if has_request_context():
+                conn = get_request_connection()
+            else:
+                conn = get_pool().get_connection()
+                owned = True
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT TABLE_NAME, COLUMN_NAME
+                FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE()
+            """)
+            tables: Dict[str, Set[str]] = {}
+            for table_name, column_name in cur.fetchall():
+                tables.setdefault(str(table_name).lower(), set()).add(str(column_name).lower())
+        finally:
+            cur.close()
+            if owned:
+                conn.close()
+
+        with self._lock:
+            self._tables = tables
+            self._loaded_at = time.time()
+            self._stale = False
+            self._failures = 0
+            self._retry_at = 0.0
+
+        features = self.features()
+        logger.info(f"Schema registry loaded {len(tables)} tables; optional features: {features}")
+        return features
+
+    def _stamp_changed(self) -> bool:
+        now = time.time()
+        if now - self._stamp_checked_at < STAMP_CHECK_INTERVAL:
+            return False
+        self._stamp_checked_at = now
+        try:
+            return os.path.getmtime(STAMP_FILE) > self._loaded_at
+        except OSError:
+            return False
+
+    def _ensure_loaded(self) -> Dict[str, Set[str]]:
+        tables = self._tables
+        if tables is not None and not self._stale and not self._stamp_changed():
+            return tables
+        if time.time() < self._retry_at:
+            return tables or {}
+        try:
+            self.refresh()
+        except Exception as e:
+            with self._lock:
+                self._stale = True
+                self._failures += 1
+                delay = min(RETRY_BACKOFF * 2 ** (self._failures - 1), RETRY_BACKOFF_MAX)
+                self._retry_at = time.time() + delay
+            kept = "keeping the last good schema" if tables is not None else "no schema loaded yet"
+            logger.error(f"Schema registry could not inspect the database ({kept}, retrying in {delay}s): {e}")
+            return tables or {}
+        return self._tables
+
+    def has_table(self, table: str) -> bool:
+        return table.lower() in self._ensure_loaded()
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column.lower() in self._ensure_loaded().get(table.lower(), set())
+
+    def columns(self, table: str) -> Set[str]:
+        return set(self._ensure_loaded().get(table.lower(), set()))
+
+    def features(self) -> Dict[str, bool]:
+        result = {}
+        for name, (table, column) in OPTIONAL_FEATURES.items():
+            result[name] = self.has_column(table, column) if column else self.has_table(table)
+        return result
+
+    def invalidate(self):
+        """Mark the cached schema stale in every worker; the next lookup re-reads it"""
+        with self._lock:
+            self._stale = True
+            self._retry_at = 0.0
+        try:
+            with open(STAMP_FILE, 'a'):
+                os.utime(STAMP_FILE, None)
+        except OSError as e:
+            logger.warning(f"Could not touch schema stamp file {STAMP_FILE}: {e}")
+
+
+# Global instance
+schema_registry = SchemaRegistry()
@@ -13,6 +13,14 @@ from PIL import Image
 import pytesseract
 from datetime import datetime, timedelta
 from models import get_db
+from utils.job_queue import job_queue
+from utils.phash_index import phash_index, phash_to_int
+from utils.schema_registry import schema_registry
+from utils.payment_events import payment_events
+
+# Max Hamming distance between 64-bit perceptual hashes still treated as the same
+# screenshot: 6 bits is just over 90% similar
+SIMILAR_PHASH_DISTANCE = 6
 
 class ScreenshotFraudDetector:
     def __init__(self, enabled=True):
@@ -94,8 +102,8 @@ class ScreenshotFraudDetector:
             if self.has_color_inconsistencies(image):
                 fraud_indicators.append("Color inconsistencies detected")
             
-            # 4. Check for compression artifacts
-            if self.has_compression_artifacts(image):
+            # 4. Check for compression artifacts (reuses the grayscale image and edge map)
+            if self.has_compression_artifacts(image, gray=gray, edges=edges):
                 fraud_indicators.append("Heavy compression artifacts")
             
             return len(fraud_indicators) > 0, fraud_indicators
@@ -158,50 +166,67 @@ class ScreenshotFraudDetector:
         except Exception:
             return False
     
-    def has_compression_artifacts(self, image):
-        """Check for compression artifacts"""
+    BLOCK_SIZE = 8  # JPEG block size
+
+    def has_compression_artifacts(self, image, gray=None, edges=None):
+        """
+        Check for compression artifacts: more than 10% of 8x8 blocks are either nearly
+        uniform (std < 5) or crossed edge-to-edge by an edge. Vectorized over the whole
+        image: blockwise std via reshape, one Canny pass (reused from the caller when
+        given) and one connected-component pass instead of a Canny/findContours call
+        per block. See scripts/benchmark_block_artifacts.py.
+        """
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Check for block artifacts (JPEG compression)
+            if gray is None:
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if edges is None:
+                edges = cv2.Canny(gray, 50, 150)
+
+            block_size = self.BLOCK_SIZE
             h, w = gray.shape
-            block_size = 8
-            
-            artifacts_count = 0
-            for i in range(0, h - block_size, block_size):
-                for j in range(0, w - block_size, block_size):
-                    block = gray[i:i+block_size, j:j+block_size]
-                    if self.has_block_artifacts(block):
-                        artifacts_count += 1
-            
-            # If more than 10% of blocks have artifacts, it's suspicious
+            # Blocks start at 0, 8, ... < h - 8 (and w - 8), as in the original scan
+            rows, cols = (h - 1) // block_size, (w - 1) // block_size
             total_blocks = (h // block_size) * (w // block_size)
-            if total_blocks > 0 and artifacts_count / total_blocks > 0.1:
-                return True
-            
-            return False
-            
+            if rows <= 0 or cols <= 0 or total_blocks == 0:
+                return False
+
+            artifacts = self.block_artifact_map(gray[:rows * block_size, :cols * block_size],
+                                                edges[:rows * block_size, :cols * block_size])
+
+            # If more than 10% of blocks have artifacts, it's suspicious
+            return int(artifacts.sum()) / total_blocks > 0.1
+
         except Exception:
             return False
-    
-    def has_block_artifacts(self, block):
-        """Check if a block has compression artifacts"""
-        # Check for uniform blocks (compression artifact)
-        if np.std(block) < 5:  # Very uniform block
-            return True
-        
-        # Check for edge artifacts
-        edges = cv2.Canny(block, 50, 150)
-        if np.sum(edges) > 0:
-            # Check if edges are too regular (compression artifact)
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            if len(contours) > 0:
-                for contour in contours:
-                    x, y, w, h = cv2.boundingRect(contour)
-                    if w == block.shape[1] or h == block.shape[0]:  # Edge-to-edge contour
-                        return True
-        
-        return False
+
+    def block_artifact_map(self, gray, edges):
+        """
+        Boolean (rows, cols) map of 8x8 blocks with artifacts; gray/edges must be cropped to
+        whole blocks. A block counts when its std is below 5 (very uniform) or when one
+        8-connected edge component inside it spans its full width or height, as the old
+        per-block findContours/boundingRect check did. The blocks are spread apart by a
+        blank row and column so a single connectedComponentsWithStats call labels every
+        block separately.
+        """
+        block_size = self.BLOCK_SIZE
+        rows, cols = gray.shape[0] // block_size, gray.shape[1] // block_size
+
+        # (rows, 8, cols, 8) view: axis 1 is the row inside a block, axis 3 the column
+        blocks = gray.reshape(rows, block_size, cols, block_size).astype(np.float64)
+        uniform = blocks.std(axis=(1, 3)) < 5
+
+        pitch = block_size + 1
+        spread = np.zeros((rows, pitch, cols, pitch), dtype=np.uint8)
+        spread[:, :block_size, :, :block_size] = edges.reshape(rows, block_size, cols, block_size) > 0
+        _, _, stats, _ = cv2.connectedComponentsWithStats(spread.reshape(rows * pitch, cols * pitch),
+                                                          connectivity=8)
+        stats = stats[1:]  # label 0 is the background
+        spanning = stats[(stats[:, cv2.CC_STAT_WIDTH] == block_size) |
+                         (stats[:, cv2.CC_STAT_HEIGHT] == block_size)]
+        spans = np.zeros((rows, cols), dtype=bool)
+        spans[spanning[:, cv2.CC_STAT_TOP] // pitch, spanning[:, cv2.CC_STAT_LEFT] // pitch] = True
+
+        return uniform | spans
     
     def detect_duplicate_screenshot(self, image_path, order_id):
         """Detect if same screenshot was used for different orders"""
@@ -232,43 +257,22 @@ class ScreenshotFraudDetector:
         except Exception as e:
             return True, f"Error checking duplicates: {str(e)}"
     
-    def detect_similar_screenshots(self, image_path, order_id):
+    def perceptual_hash(self, image_path):
+        """64-bit perceptual hash of an image, as stored in order_screenshots.phash"""
+        with Image.open(image_path) as image:
+            return phash_to_int(imagehash.phash(image))
+
+    def detect_similar_screenshots(self, image_path, order_id, phash=None):
         """Detect similar screenshots using perceptual hashing"""
         try:
-            image = Image.open(image_path)
-            phash = imagehash.phash(image)
-            
-            conn = get_db()
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT order_id, image_hash, uploaded_at 
-                FROM order_screenshots 
-                WHERE order_id != %s
-            """, (order_id,))
-            
-            similar_screenshots = []
-            for row in cur.fetchall():
-                try:
-                    stored_image_path = os.path.join(self.upload_dir, f"{row[1]}.jpg")
-                    if os.path.exists(stored_image_path):
-                        stored_image = Image.open(stored_image_path)
-                        stored_phash = imagehash.phash(stored_image)
-                        
-                        # Calculate similarity
-                        similarity = 1 - (phash - stored_phash) / len(phash.hash) ** 2
-                        
-                        if similarity > 0.9:  # 90% similar
-                            similar_screenshots.append({
-                                'order_id': row[0],
-                                'similarity': similarity,
-                                'uploaded_at': row[2]
-                            })
-                except Exception:
-                    continue
-            
-            cur.close()
-            conn.close()
+            if not phash_index.available():
+                return False, "Similarity index not available"
+
+            if phash is None:
+                phash = self.perceptual_hash(image_path)
+
+            similar_screenshots = phash_index.find_similar(phash, SIMILAR_PHASH_DISTANCE,
+                                                           exclude_order_id=order_id)
             
             if similar_screenshots:
                 return True, f"Similar screenshots found: {similar_screenshots}"
@@ -425,8 +429,10 @@ class ScreenshotFraudDetector:
             if is_duplicate:
                 verification_results['fraud_reasons'].append(duplicate_reason)
             
-            # 5. Check for similar screenshots
-            is_similar, similar_reason = self.detect_similar_screenshots(image_path, order_id)
+            # 5. Check for similar screenshots (the hash is kept for verify_upload to store)
+            verification_results['phash'] = self.perceptual_hash(image_path)
+            is_similar, similar_reason = self.detect_similar_screenshots(
+                image_path, order_id, phash=verification_results['phash'])
             verification_results['verification_details']['similarity_check'] = not is_similar
             if is_similar:
                 verification_results['fraud_reasons'].append(similar_reason)
@@ -470,5 +476,117 @@ class ScreenshotFraudDetector:
             verification_results['is_fraud'] = True
             return verification_results
 
+    def record_upload(self, file_path, relative_path, order_id):
+        """
+        Record an uploaded payment screenshot on the order, pending verification.
+        Runs in the upload request, so the proof is stored even if the verification job is
+        lost (e.g. the worker is recycled); returns the order_screenshots row id.
+        """
+        with open(file_path, 'rb') as f:
+            image_hash = hashlib.md5(f.read()).hexdigest()
+
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE orders 
+                SET payment_screenshot_path = %s, 
+                    screenshot_uploaded_at = CURRENT_TIMESTAMP,
+                    payment_verification_status = 'pending'
+                WHERE id = %s
+            """, (relative_path, order_id))
+            cur.execute("""
+                INSERT INTO order_screenshots (order_id, image_hash, file_path, uploaded_at)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+            """, (order_id, image_hash, relative_path))
+            screenshot_id = cur.lastrowid
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+        return screenshot_id
+
+    def verify_upload(self, file_path, relative_path, order_id, expected_amount, screenshot_id):
+        """
+        Score a screenshot stored by record_upload (job queue handler). A suspicious file is
+        deleted and its record removed; the returned dict is the job result the client polls for.
+        """
+        verification_result = self.comprehensive_verification(file_path, order_id, expected_amount)
+
+        if verification_result['is_fraud']:
+            if os.path.exists(file_path):
+                os.remove(file_path)  # Delete the suspicious file
+            conn = get_db()
+            cur = conn.cursor()
+            try:
+                cur.execute("DELETE FROM order_screenshots WHERE id = %s", (screenshot_id,))
+                cur.execute("""
+                    UPDATE orders
+                    SET payment_screenshot_path = NULL,
+                        payment_verification_status = 'rejected'
+                    WHERE id = %s AND payment_screenshot_path = %s
+                """, (order_id, relative_path))
+                conn.commit()
+            finally:
+                cur.close()
+                conn.close()
+            payment_events.publish_order(order_id, 'rejected')
+            print(f"🚨 Fraud detected in screenshot for order {order_id}: {verification_result['fraud_reasons']}")
+            return {
+                'success': False,
+                'error': 'Screenshot verification failed',
+                'fraud_reasons': verification_result['fraud_reasons'],
+                'confidence_score': verification_result['confidence_score'],
+                'verification_details': verification_result['verification_details']
+            }
+
+        # Perceptual hash for the similarity index, so later uploads never re-decode this file
+        store_phash = schema_registry.has_column('order_screenshots', 'phash')
+        phash = verification_result.get('phash')
+        if store_phash and phash is None:
+            try:
+                phash = self.perceptual_hash(file_path)
+            except Exception as e:
+                print(f"⚠️ Could not compute perceptual hash for order {order_id}: {e}")
+
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE orders 
+                SET payment_verification_status = 'verified'
+                WHERE id = %s AND payment_screenshot_path = %s
+            """, (order_id, relative_path))
+
+            # Store the score (and perceptual hash) for later fraud checks
+            if store_phash:
+                cur.execute("""
+                    UPDATE order_screenshots SET verification_score = %s, phash = %s WHERE id = %s
+                """, (verification_result['confidence_score'], phash, screenshot_id))
+            else:
+                cur.execute("""
+                    UPDATE order_screenshots SET verification_score = %s WHERE id = %s
+                """, (verification_result['confidence_score'], screenshot_id))
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+        if store_phash and phash is not None:
+            phash_index.add(screenshot_id, order_id, phash, datetime.now())
+        payment_events.publish_order(order_id, 'verified')
+
+        print(f"✅ Payment screenshot verified for order {order_id}: {relative_path} (confidence: {verification_result['confidence_score']:.2f})")
+        return {
+            'success': True,
+            'message': 'Screenshot uploaded and verified successfully',
+            'file_path': relative_path,
+            'verification_score': verification_result['confidence_score'],
+            'verification_details': verification_result['verification_details']
+        }
+
 # Global instance - temporarily disabled for testing
 screenshot_detector = ScreenshotFraudDetector(enabled=False)
+
+# OCR and image analysis run on the job queue; the upload itself is recorded in the request
+job_queue.register('screenshot_verification', screenshot_detector.verify_upload)
@@ -0,0 +1,276 @@
+"""
+Static Assets
+Fingerprinted, long-cached serving of static/css, static/js and static/icons.
+
+url_for('static', filename='css/cart.css') builds /static/css/cart.<hash>.css, where
+<hash> is the first 10 hex digits of the file's MD5. A fingerprinted URL changes
+whenever the content does, so it is served with a one-year immutable Cache-Control.
+Unfingerprinted paths (hard-coded /static/... links, images, uploads) get
+STATIC_MAX_AGE. Every response carries an ETag and answers If-None-Match with 304.
+
+scripts/build_static_assets.py writes static/asset-manifest.json and precompressed
+`.gz` / `.br` siblings at deploy time. Without the manifest the hashes are computed on
+first use. Entries whose file changed since the build (mtime/size) are re-hashed. A
+precompressed variant is used only when the client accepts it and it is not older
+than the original.
+
+With STATIC_SENDFILE = 'x-accel' the app picks the file and headers but nginx sends
+the bytes from an internal location. nginx then chooses the precompressed sibling itself,
+so the app always redirects to the original file:
+
+    location /static/ { proxy_pass http://unix:/tmp/gunicorn.sock; }
+    location /_static/ { internal; alias /path/to/app/static/; gzip_static on; }
+
+(NGINX_TIMEOUT_FIX.md has nginx serve /static/ directly instead.)
+
+'x-sendfile' sets Flask's USE_X_SENDFILE instead (Apache mod_xsendfile / lighttpd).
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import mimetypes
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from flask import request, send_file, Response
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTED_DIRS = ('css', 'js', 'icons')
+MANIFEST_NAME = 'asset-manifest.json'
+HASH_LENGTH = 10
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Best first: (Accept-Encoding token, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+_FINGERPRINT = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % HASH_LENGTH)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(filename: str, digest: str) -> str:
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}.{digest[:HASH_LENGTH]}{extension}"
+
+
+class StaticAssets:
+    """Asset manifest plus the /static/<path> view that serves it"""
+
+    def __init__(self, static_folder: str, enabled: bool = True, max_age: int = 3600,
+                 sendfile: str = '', accel_prefix: str = '/_static/'):
+        self.static_folder = os.path.abspath(static_folder)
+        self.enabled = enabled
+        self.max_age = max_age
+        self.sendfile = sendfile
+        self.accel_prefix = accel_prefix.rstrip('/') + '/'
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._stats = {
+            'fingerprinted_hits': 0,
+            'plain_hits': 0,
+            'not_modified': 0,
+            'precompressed': 0,
+            'accel_redirects': 0,
+        }
+
+    # Manifest
+
+    def manifest_path(self) -> str:
+        return os.path.join(self.static_folder, MANIFEST_NAME)
+
+    def scan(self, previous: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        {logical path: {'hash', 'mtime', 'size'}} for every fingerprinted file. Entries
+        from `previous` whose mtime and size still match are reused without re-hashing.
+        """
+        previous = previous or {}
+        entries = {}
+        for directory in FINGERPRINTED_DIRS:
+            root = os.path.join(self.static_folder, directory)
+            for dirpath, _, names in os.walk(root):
+                for name in names:
+                    if name.endswith(('.gz', '.br')):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    logical = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                    stat = os.stat(path)
+                    known = previous.get(logical)
+                    if known and known.get('mtime') == stat.st_mtime and known.get('size') == stat.st_size:
+                        entries[logical] = known
+                    else:
+                        entries[logical] = {'hash': file_hash(path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+        return entries
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        entries = self._entries
+        if entries is not None:
+            return entries
+        with self._lock:
+            if self._entries is None:
+                try:
+                    with open(self.manifest_path()) as f:
+                        previous = json.load(f).get('files', {})
+                except (OSError, ValueError):
+                    previous = {}
+                try:
+                    self._entries = self.scan(previous)
+                except OSError as e:
+                    logger.warning(f"Could not build static asset manifest: {e}")
+                    self._entries = {}
+                logger.info(f"Static asset manifest: {len(self._entries)} fingerprinted file(s)")
+            return self._entries
+
+    def write_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Re-scan and write static/asset-manifest.json (used by the build script)"""
+        try:
+            with open(self.manifest_path()) as f:
+                previous = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            previous = {}
+        entries = self.scan(previous)
+        manifest = {
+            'files': entries,
+            'urls': {logical: fingerprint(logical, entry['hash']) for logical, entry in entries.items()},
+        }
+        tmp = f"{self.manifest_path()}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path())
+        with self._lock:
+            self._entries = entries
+        return entries
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+
+    def url_path(self, filename: str) -> str:
+        """Fingerprinted name for url_for('static'); unknown files are returned unchanged"""
+        if not self.enabled:
+            return filename
+        entry = self._load().get(filename)
+        return fingerprint(filename, entry['hash']) if entry else filename
+
+    def resolve(self, filename: str) -> Tuple[str, Optional[str]]:
+        """(logical path, content hash) for a requested path; hash is None unless fingerprinted"""
+        match = _FINGERPRINT.match(filename)
+        if match:
+            logical = f"{match.group('stem')}{match.group('ext')}"
+            entry = self._load().get(logical)
+            if entry and entry['hash'][:HASH_LENGTH] == match.group('hash'):
+                return logical, entry['hash']
+        return filename, None
+
+    # Serving
+
+    def _safe_path(self, filename: str) -> Optional[str]:
+        path = os.path.abspath(os.path.join(self.static_folder, filename))
+        if not path.startswith(self.static_folder + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _variant(self, path: str, mimetype: str) -> Tuple[str, Optional[str]]:
+        """Precompressed sibling the client accepts, if one exists and is current"""
+        if not mimetype.startswith(COMPRESSIBLE_TYPES):
+            return path, None
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if not accepted[encoding]:
+                continue
+            candidate = path + suffix
+            try:
+                if os.path.getmtime(candidate) >= os.path.getmtime(path):
+                    return candidate, encoding
+            except OSError:
+                continue
+        return path, None
+
+    def serve(self, filename: str) -> Response:
+        logical, digest = self.resolve(filename)
+        path = self._safe_path(logical)
+        if path is None:
+            return Response('Not Found', status=404)
+
+        mimetype = mimetypes.guess_type(logical)[0] or 'application/octet-stream'
+        if self.sendfile == 'x-accel':
+            # gzip_static on the internal location negotiates the encoding
+            served_path, encoding = path, None
+        else:
+            served_path, encoding = self._variant(path, mimetype)
+        etag = digest or None
+        if etag is None:
+            stat = os.stat(served_path)
+            etag = f"{int(stat.st_mtime)}-{stat.st_size}"
+        if encoding:
+            etag = f"{etag}-{encoding}"
+        max_age = IMMUTABLE_MAX_AGE if digest else self.max_age
+
+        with self._lock:
+            self._stats['fingerprinted_hits' if digest else 'plain_hits'] += 1
+            if encoding:
+                self._stats['precompressed'] += 1
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            with self._lock:
+                self._stats['not_modified'] += 1
+        elif self.sendfile == 'x-accel':
+            relative = os.path.relpath(served_path, self.static_folder).replace(os.sep, '/')
+            response = Response(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = f"{self.accel_prefix}{relative}"
+            with self._lock:
+                self._stats['accel_redirects'] += 1
+        else:
+            response = send_file(served_path, mimetype=mimetype, etag=False, conditional=True)
+
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        if digest:
+            response.cache_control.immutable = True
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['manifest_entries'] = len(self._entries) if self._entries is not None else None
+        stats['enabled'] = self.enabled
+        stats['sendfile'] = self.sendfile or None
+        return stats
+
+
+def init_app(app) -> StaticAssets:
+    """Route /static/<path> through StaticAssets and fingerprint url_for('static')"""
+    config = app.config
+    assets = StaticAssets(app.static_folder,
+                          enabled=config.get('STATIC_FINGERPRINT', True),
+                          max_age=config.get('STATIC_MAX_AGE', 3600),
+                          sendfile=config.get('STATIC_SENDFILE', ''),
+                          accel_prefix=config.get('STATIC_ACCEL_PREFIX', '/_static/'))
+    if assets.sendfile == 'x-sendfile':
+        app.config['USE_X_SENDFILE'] = True
+
+    app.view_functions['static'] = assets.serve
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = assets.url_path(values['filename'])
+
+    app.extensions['static_assets'] = assets
+    return assets